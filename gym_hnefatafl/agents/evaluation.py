@@ -5,7 +5,8 @@ import random
 import numpy as np
 from enum import IntEnum
 
-from gym_hnefatafl.envs.board import Outcome, TileState, Player, TileMoveState
+from gym_hnefatafl.envs.action_encoding import action_encoding
+from gym_hnefatafl.envs.board import Outcome, TileState, Player, TileMoveState, move_tables
 
 BOARD_PRESENCE_WEIGHT = 4
 SUPERIORITY_WEIGHT = 5
@@ -43,6 +44,7 @@ def evaluate(board, player):
 
 
 # does only the stuff that can be calculated quickly
+# (the king terms are read from the IncrementalEvaluator of the board if it has one)
 def quick_evaluate(board, player):
     if board.outcome == Outcome.white:
         return math.inf
@@ -50,8 +52,63 @@ def quick_evaluate(board, player):
         return -math.inf
     if board.outcome == Outcome.draw:
         return math.inf if player == Player.black else -math.inf
-    return superiority_rating(board) + king_in_trouble_rating(board) + covered_angle_rating(board) \
-           + same_axis_as_king_rating(board)
+    if getattr(board, "evaluator", None) is not None:
+        return superiority_rating(board) + board.evaluator.king_ratings(board)
+    return superiority_rating(board) + king_ratings(board)
+
+
+# the ratings of quick_evaluate that only depend on the surroundings of the king
+def king_ratings(board):
+    return king_in_trouble_rating(board) + covered_angle_rating(board) + same_axis_as_king_rating(board)
+
+
+# tiles within this distance (in x and y) of the king can change covered_angle_rating and king_in_trouble_rating
+KING_RATINGS_RADIUS = 3
+
+
+# Keeps the king ratings of quick_evaluate (see king_ratings) of a board while a search does and undoes actions on
+# it. Set it as board.evaluator, then the board calls action_done in do_action and action_undone in
+# undo_last_action. The ratings only change if the king moves or a piece moves from or to (or is captured on) a tile
+# on the row or column of the king or near it. Otherwise the cached value stays valid for the new position and,
+# when the action is undone, for the previous one again. It is computed only when it is read and not cached.
+# superiority_rating is a difference of piece counts the board already keeps up to date
+class IncrementalEvaluator(object):
+
+    def __init__(self):
+        self.cached_king_ratings = None
+        # (whether the action changed the king ratings, cached value before the action) for the actions on the
+        # board that have not been undone
+        self.stack = []
+
+    # returns the king ratings of the current position of "board"
+    def king_ratings(self, board):
+        if self.cached_king_ratings is None:
+            self.cached_king_ratings = king_ratings(board)
+        return self.cached_king_ratings
+
+    # called by "board" after it has done "move" and captured the pieces at "captured_positions"
+    def action_done(self, board, move, captured_positions):
+        changed = self.__changes_king_ratings__(board, move, captured_positions)
+        self.stack.append((changed, self.cached_king_ratings))
+        if changed:
+            self.cached_king_ratings = None
+
+    # called by "board" after it has undone its last action
+    def action_undone(self, board):
+        changed, cached_king_ratings = self.stack.pop()
+        if changed:
+            self.cached_king_ratings = cached_king_ratings
+
+    # returns whether "move" and the captures can have changed the king ratings
+    def __changes_king_ratings__(self, board, move, captured_positions):
+        king_x, king_y = board.king_position
+        if move[1] == (king_x, king_y):
+            return True
+        for x, y in itertools.chain(move, captured_positions):
+            if x == king_x or y == king_y \
+                    or (abs(x - king_x) <= KING_RATINGS_RADIUS and abs(y - king_y) <= KING_RATINGS_RADIUS):
+                return True
+        return False
 
 
 # currently tested, add stuff as you like, but don't make it too slow
@@ -81,14 +138,8 @@ def number_of_pieces(board, area=None):
     if area is None:
         return board.black_pieces, board.white_pieces
     else:
-        white = 0
-        black = 0
-        for i in area.indices():
-            if board.board[i] == TileState.white:
-                white += 1
-            elif board.board[i] == TileState.black:
-                black += 1
-        return black, white
+        black, white = area_masks(board.size).pieces_per_area(np.asarray(board.board))
+        return int(black[area]), int(white[area])
 
 
 # enum that describes an area on the board. Corner areas are 4x4, the middle is 3x3 and edge areas are 4x3 or 3x4
@@ -103,39 +154,68 @@ class Area(IntEnum):
     bottom = 7
     bottom_right = 8
 
-    # returns the indices of all board tiles that this enum covers
-    def indices(self):
-        first = range(1, 5)
-        middle = range(5, 8)
-        last = range(8, 12)
-        indices = {
-            # itertools.product returns the cartesian product of the lists
-            0: itertools.product(first, first),
-            1: itertools.product(first, middle),
-            2: itertools.product(first, last),
-            3: itertools.product(middle, first),
-            4: itertools.product(middle, middle),
-            5: itertools.product(middle, last),
-            6: itertools.product(last, first),
-            7: itertools.product(last, middle),
-            8: itertools.product(last, last),
-        }
-        return indices[self]
+    # returns the indices of all board tiles that this enum covers on a board of size "size"
+    def indices(self, size=11):
+        return ((int(x), int(y)) for x, y in np.argwhere(area_masks(size).labels == self))
+
+
+# The areas of one board size as label grid and indicator matrix. The board is split into 3 x 3 areas with a middle
+# band that contains the throne and is about a third of the board wide (4, 3, 4 tiles on 11x11).
+# labels is the (size + 2) x (size + 2) grid of the Area of every tile (len(Area) on the border) and one_hot the
+# (number of tiles, number of areas) indicator matrix of the labels, so the pieces in all areas of one board or a
+# stack of boards are counted with one matrix product
+class AreaMasks(object):
+
+    def __init__(self, size):
+        width = size + 2
+        edge = (size - size // 3 + 1) // 2
+        bands = np.full(width, -1)
+        bands[1:edge + 1] = 0
+        bands[edge + 1:size - edge + 1] = 1
+        bands[size - edge + 1:size + 1] = 2
+        on_board = (bands[:, None] >= 0) & (bands[None, :] >= 0)
+        self.labels = np.where(on_board, 3 * bands[:, None] + bands[None, :], len(Area))
+        self.flat_labels = self.labels.ravel()
+        self.one_hot = np.zeros((width * width, len(Area)))
+        self.one_hot[np.flatnonzero(on_board), self.flat_labels[on_board.ravel()]] = 1
+
+    # returns the numbers of black and of white soldiers (the king is not counted) in each area of the TileState
+    # grids "boards" (..., size + 2, size + 2) as two arrays of shape (..., len(Area))
+    def pieces_per_area(self, boards):
+        flat_boards = boards.reshape(boards.shape[:-2] + (-1,))
+        return (flat_boards == TileState.black) @ self.one_hot, (flat_boards == TileState.white) @ self.one_hot
+
+    # returns the Area labels of the tiles of the kings of the TileState grids "boards" (..., size + 2, size + 2)
+    def king_areas(self, boards):
+        flat_boards = boards.reshape(boards.shape[:-2] + (-1,))
+        return self.flat_labels[np.argmax(flat_boards == TileState.king, axis=-1)]
+
+
+__AREA_MASKS__ = {}
+
+
+# returns the (cached) area masks of a board size
+def area_masks(size):
+    if size not in __AREA_MASKS__:
+        __AREA_MASKS__[size] = AreaMasks(size)
+    return __AREA_MASKS__[size]
 
 
 # divides the board into areas and calculates an area presence value between -1 and 1 for each one
 # the area that the king is in gets an additional bonus
 # the area ratings are then weighted by the values in the list above and summed up
 def board_presence_rating(board):
-    total_value = 0
-    for area in Area:
-        white, black = number_of_pieces(board, area)
-        # make values not exceed 1 and -1
-        area_value = max(min(white - black/2, 1), -1)
-        if board.king_position in area.indices():
-            area_value *= KING_BONUS_FACTOR
-        total_value += area_value * AREA_FACTOR[area]
-    return total_value
+    return float(board_presence_ratings(np.asarray(board.board)))
+
+
+# board_presence_rating of a stack of TileState grids (..., size + 2, size + 2)
+def board_presence_ratings(boards):
+    masks = area_masks(boards.shape[-1] - 2)
+    black, white = masks.pieces_per_area(boards)
+    # the counts are used in the order number_of_pieces returns them: (black, white)
+    area_values = np.clip(black - white / 2, -1, 1)
+    area_values *= np.where(np.arange(len(Area)) == masks.king_areas(boards)[..., None], KING_BONUS_FACTOR, 1)
+    return area_values @ np.array(AREA_FACTOR)
 
 
 # calculates a value for the king's threat of capture as an exponential
@@ -159,25 +239,86 @@ def king_in_trouble_rating(board):
 # calculates how many moves the king needs in a row to reach the nearest corner
 # (just by movement alone, not checking for capture of black pieces)
 def king_turns_to_corner(board):
-    turns_from = np.full((13, 13), -1)
-    this_list = [(1, 1), (1, 11), (11, 1), (11, 11)]
-    for position in this_list:
-        turns_from[position] = 0
-    next_list = []
-    current_step_count = 1
-    while True:
-        for to_position in this_list:
-            for end_position, from_position in board.get_valid_actions_for_piece(to_position):
-                if board.king_position == from_position:
-                    return -KING_TURNS_TO_CORNER_WEIGHT*KING_TURNS_TO_CORNER_EXP_BASE**(-current_step_count)
-                if turns_from[from_position] == -1:
-                    turns_from[from_position] = current_step_count
-                    next_list.append(from_position)
-        if len(next_list) == 0:
-            return 0
-        this_list = next_list
-        next_list = []
-        current_step_count += 1
+    turns = king_distance_field(board.size).turns_to_corner(board)
+    if turns is None:
+        return 0
+    return -KING_TURNS_TO_CORNER_WEIGHT*KING_TURNS_TO_CORNER_EXP_BASE**(-turns)
+
+
+# maximum number of king distance fields that are cached per board size before the cache is cleared
+KING_DISTANCE_CACHE_SIZE = 4096
+
+
+# The number of moves the king needs to reach the nearest corner from every tile for one board size, found by a
+# breadth-first search backwards from the corners along precomputed rays of flat indices x * width + y.
+# Soldiers block the lines, the king itself does not, so the field does not depend on where the king stands.
+# Fields are cached by the Zobrist key of the soldiers (the key of the position without the king and the side to
+# move): king moves just look up another tile of the same field. After a soldier has moved or been captured, the
+# field is computed again from scratch instead of being patched
+class KingDistanceField(object):
+
+    def __init__(self, size):
+        self.size = size
+        self.width = size + 2
+        tables = move_tables(size)
+        self.rays = [()] * (self.width * self.width)
+        for (x, y), rays in tables.king_rays.items():
+            self.rays[x * self.width + y] = tuple(tuple(destination[0] * self.width + destination[1]
+                                                        for destination, _ in ray) for ray in rays)
+        self.corners = [x * self.width + y for x, y in ((1, 1), (1, size), (size, 1), (size, size))]
+        self.unreached = [-1] * (self.width * self.width)
+        # buffer of the field that is being computed
+        self.distances = list(self.unreached)
+        self.fields = {}
+
+    # returns the number of moves the king of "board" needs to reach a corner or None if it can not reach one
+    def turns_to_corner(self, board):
+        king_position = tuple(int(i) for i in board.king_position)
+        # the key of the soldiers only: without the king and with the same value for both sides to move
+        key = board.zobrist_key ^ board.zobrist.piece(TileState.king, king_position)
+        key = min(key, key ^ board.zobrist.white_to_move)
+        field = self.fields.get(key)
+        if field is None:
+            if len(self.fields) >= KING_DISTANCE_CACHE_SIZE:
+                self.fields.clear()
+            field = self.__compute__(board)
+            self.fields[key] = field
+        turns = field[king_position[0] * self.width + king_position[1]]
+        return None if turns == -1 else turns
+
+    # returns the distances of all tiles to the nearest corner (-1 if there is no way) as a tuple
+    def __compute__(self, board):
+        grid = np.asarray(board.board)
+        blocked = ((grid == TileState.white) | (grid == TileState.black)).ravel().tolist()
+        distances = self.distances
+        distances[:] = self.unreached
+        frontier = self.corners
+        for corner in frontier:
+            distances[corner] = 0
+        turns = 0
+        while frontier:
+            turns += 1
+            next_frontier = []
+            for tile in frontier:
+                for ray in self.rays[tile]:
+                    for other_tile in ray:
+                        if blocked[other_tile]:
+                            break
+                        if distances[other_tile] == -1:
+                            distances[other_tile] = turns
+                            next_frontier.append(other_tile)
+            frontier = next_frontier
+        return tuple(distances)
+
+
+__KING_DISTANCE_FIELDS__ = {}
+
+
+# returns the (cached) king distance field of a board size
+def king_distance_field(size):
+    if size not in __KING_DISTANCE_FIELDS__:
+        __KING_DISTANCE_FIELDS__[size] = KingDistanceField(size)
+    return __KING_DISTANCE_FIELDS__[size]
 
 
 # the relative squares and their evaluation order in a circle around the king with radius 3
@@ -232,56 +373,91 @@ def calculate_angle_intervals():
         ANGLE_INTERVALS_3.append((right_angle, left_angle))
 
 
+# Lookup tables for covered_angle_rating on one board size.
+# The circle around the king is cut at all ends of the intervals in ANGLE_INTERVALS_3 into segments, each of which is
+# covered by a fixed set of the squares in ANGLE_CALCULATION_ORDER_3. The covered angle of one quadrant of the circle
+# only depends on the (at most 12) squares whose intervals overlap it, so it is looked up in a table indexed by the
+# bit pattern of the black pieces on these squares. The union of the intervals is exact, also where they cross
+# the quadrant borders, and the tables are computed once when they are first needed.
+# square_indices[x * width + y] are the flat indices of the squares around a king at (x, y) (tile 0, a border tile,
+# for squares off the grid) and weights the bit of each square in the pattern of each quadrant
+class CoveredAngleTables(object):
+
+    def __init__(self, size):
+        if not ANGLE_INTERVALS_3:
+            calculate_angle_intervals()
+        width = size + 2
+        number_of_squares = len(ANGLE_CALCULATION_ORDER_3)
+
+        # the segments of the circle and the squares that cover them
+        ends = sorted({0, 2 * math.pi} | {k * math.pi / 2 for k in range(4)}
+                      | {end for interval in ANGLE_INTERVALS_3 for end in interval})
+        segments = [(start, end) for start, end in zip(ends, ends[1:]) if end > start]
+        covering_squares = []
+        for start, end in segments:
+            center = (start + end) / 2
+            # intervals with right > left cross over 0
+            covering_squares.append([square for square, (right, left) in enumerate(ANGLE_INTERVALS_3)
+                                     if (right <= center < left if right <= left else not left <= center < right)])
+
+        quadrant_squares = []
+        for quadrant in range(4):
+            squares = set()
+            for (start, end), covering in zip(segments, covering_squares):
+                if quadrant * math.pi / 2 <= (start + end) / 2 < (quadrant + 1) * math.pi / 2:
+                    squares.update(covering)
+            quadrant_squares.append(sorted(squares))
+        self.table_size = 2 ** max(len(squares) for squares in quadrant_squares)
+
+        self.weights = np.zeros((number_of_squares, 4), dtype=np.intp)
+        for quadrant, squares in enumerate(quadrant_squares):
+            for bit, square in enumerate(squares):
+                self.weights[square, quadrant] = 1 << bit
+        # one table after the other, table_offsets[quadrant] is the start of the table of the quadrant
+        self.table_offsets = np.arange(4) * self.table_size
+        self.tables = np.zeros(4 * self.table_size)
+        patterns = np.arange(self.table_size)
+        for (start, end), covering in zip(segments, covering_squares):
+            quadrant = min(int((start + end) / 2 // (math.pi / 2)), 3)
+            mask = int(self.weights[covering, quadrant].sum())
+            self.tables[self.table_offsets[quadrant]:self.table_offsets[quadrant] + self.table_size] += \
+                (end - start) * ((patterns & mask) != 0)
+
+        self.square_indices = np.zeros((width * width, number_of_squares), dtype=np.intp)
+        for x in range(1, size + 1):
+            for y in range(1, size + 1):
+                for square, (relative_x, relative_y) in enumerate(ANGLE_CALCULATION_ORDER_3):
+                    if 0 <= x + relative_x < width and 0 <= y + relative_y < width:
+                        self.square_indices[x * width + y, square] = (x + relative_x) * width + y + relative_y
+
+    # returns the angle that the squares of the black pieces around the king cover on the TileState grid "board"
+    def covered_angle(self, board, king_position):
+        x, y = king_position
+        squares = board.ravel()[self.square_indices[int(x) * board.shape[1] + int(y)]] == TileState.black
+        return self.tables[squares @ self.weights + self.table_offsets].sum()
+
+    # covered_angle of a stack of TileState grids "boards" (N, size + 2, size + 2) with the kings on the flat
+    # indices "king_indices" (N,), as (N,) array
+    def covered_angles(self, boards, king_indices):
+        squares = np.take_along_axis(boards.reshape(len(boards), -1), self.square_indices[king_indices], axis=1) \
+            == TileState.black
+        return self.tables[squares @ self.weights + self.table_offsets].sum(axis=-1)
+
+
+__COVERED_ANGLE_TABLES__ = {}
+
+
+# returns the (cached) covered angle tables of a board size
+def covered_angle_tables(size):
+    if size not in __COVERED_ANGLE_TABLES__:
+        __COVERED_ANGLE_TABLES__[size] = CoveredAngleTables(size)
+    return __COVERED_ANGLE_TABLES__[size]
+
+
 # calculates the angle that the squares of all black pieces in a circle of radius 3 around the king cover
 # returns the negative of that scaled between 0 and -1
 def covered_angle_rating(board):
-    union = []
-    edge_pieces = []
-    king_x, king_y = board.king_position
-    for (relative_x, relative_y), (right, left) in zip(ANGLE_CALCULATION_ORDER_3, ANGLE_INTERVALS_3):
-        pos_x = king_x + relative_x
-        pos_y = king_y + relative_y
-        if 1 <= pos_x <= 11 and 1 <= pos_y <= 11:
-            if board.board[(pos_x, pos_y)] == TileState.black:
-                # split interval if it crosses over 0
-                if right > left:
-                    edge_pieces.append(right)
-                    right = 0
-                if not union:
-                    union.append((right, left))
-                else:
-                    # find the first interval that is not fully included in the current one
-                    first_subinterval_index = len(union) - 1
-                    while first_subinterval_index > 0 and union[first_subinterval_index - 1][0] > right:
-                        first_subinterval_index -= 1
-                    # delete all elements after the found index
-                    del union[first_subinterval_index + 1:]
-                    # if last interval and the current one are disjunct, append it. Else join them.
-                    if union[first_subinterval_index][1] <= right:
-                        union.append((right, left))
-                    else:
-                        union[first_subinterval_index] = (union[first_subinterval_index][0], left)
-
-    # do the same thing for the right pieces of the intervals where the angle has crossed over 0
-    left = 2 * math.pi
-    for right in edge_pieces:
-        if not union:
-            union.append((right, left))
-        else:
-            first_subinterval_index = len(union) - 1
-            while first_subinterval_index > 0 and union[first_subinterval_index - 1][0] > right:
-                first_subinterval_index -= 1
-            del union[first_subinterval_index + 1:]
-            if union[first_subinterval_index][1] <= right:
-                union.append((right, left))
-            else:
-                del union[first_subinterval_index + 1:]
-                union[first_subinterval_index] = (union[first_subinterval_index][0], left)
-
-    # calculate the covered angle
-    covered_angle = 0
-    for interval in union:
-        covered_angle += interval[1] - interval[0]
+    covered_angle = covered_angle_tables(board.size).covered_angle(np.asarray(board.board), board.king_position)
     return -covered_angle * COVERED_ANGLE_WEIGHT / (2 * math.pi)
 
 
@@ -292,31 +468,161 @@ def covered_angle_rating(board):
 def same_axis_as_king_rating(board):
     axis_sum = 0
     king_x, king_y = board.king_position
+    # the grids are read once, the bitboard engine derives them from its bitboards
+    move_board = board.move_board
+    tile_board = board.board
     for x_other in reversed(range(1, king_x)):
-        if board.move_board[x_other, king_y] == TileMoveState.traversable:
+        if move_board[x_other, king_y] == TileMoveState.traversable:
             continue
-        elif board.board[x_other, king_y] == TileState.black:
+        elif tile_board[x_other, king_y] == TileState.black:
             axis_sum += 1/(king_x - x_other)
         break
     # second direction
     for x_other in range(king_x + 1, 12):
-        if board.move_board[x_other, king_y] == TileMoveState.traversable:
+        if move_board[x_other, king_y] == TileMoveState.traversable:
             continue
-        elif board.board[x_other, king_y] == TileState.black:
+        elif tile_board[x_other, king_y] == TileState.black:
             axis_sum += 1/(x_other - king_x)
         break
     # third direction
     for y_other in reversed(range(1, king_y)):
-        if board.move_board[king_x, y_other] == TileMoveState.traversable:
+        if move_board[king_x, y_other] == TileMoveState.traversable:
             continue
-        elif board.board[king_x, y_other] == TileState.black:
+        elif tile_board[king_x, y_other] == TileState.black:
             axis_sum += 1/(king_y - y_other)
         break
     # forth direction
     for y_other in range(king_y + 1, 12):
-        if board.move_board[king_x, y_other] == TileMoveState.traversable:
+        if move_board[king_x, y_other] == TileMoveState.traversable:
             continue
-        elif board.board[king_x, y_other] == TileState.black:
+        elif tile_board[king_x, y_other] == TileState.black:
             axis_sum += 1/(y_other - king_y)
         break
     return -axis_sum / 4 * SAME_AXIS_AS_KING_WEIGHT
+
+
+# Batched versions of the evaluations and ratings above, which score many positions (e.g. all children of a node)
+# with one call each. They take a stack of TileState grids "boards" (N, size + 2, size + 2) and the positions of
+# the kings "king_positions" (N, 2) and return (N,) arrays. Finished games are not detected, see evaluate_actions
+
+# evaluate of a stack of boards of ongoing games
+def evaluate_batch(boards, king_positions):
+    return superiority_ratings(boards) + king_in_trouble_ratings(boards, king_positions) \
+        + king_turns_to_corner_ratings(boards, king_positions) + board_presence_ratings(boards)
+
+
+# quick_evaluate of a stack of boards of ongoing games
+def quick_evaluate_batch(boards, king_positions):
+    return superiority_ratings(boards) + king_in_trouble_ratings(boards, king_positions) \
+        + covered_angle_ratings(boards, king_positions) + same_axis_as_king_ratings(boards, king_positions)
+
+
+# Returns the evaluations (evaluate or quick_evaluate) for "player" of the positions after each of the "actions"
+# of "player" on "board" as array. The actions are done and undone one after the other to collect the positions,
+# which are then scored with one batched call
+def evaluate_actions(board, actions, player, quick=True):
+    evaluations = np.zeros(len(actions))
+    boards = np.empty((len(actions), board.size + 2, board.size + 2), dtype=np.int32)
+    king_positions = np.empty((len(actions), 2), dtype=np.intp)
+    ongoing = np.zeros(len(actions), dtype=bool)
+    for i, action in enumerate(actions):
+        board.do_action(action, player)
+        if board.outcome == Outcome.ongoing:
+            ongoing[i] = True
+            boards[i] = board.board
+            king_positions[i] = board.king_position
+        elif board.outcome == Outcome.white:
+            evaluations[i] = math.inf
+        elif board.outcome == Outcome.black:
+            evaluations[i] = -math.inf
+        else:
+            evaluations[i] = math.inf if player == Player.black else -math.inf
+        board.undo_last_action()
+    if ongoing.any():
+        evaluate_ongoing = quick_evaluate_batch if quick else evaluate_batch
+        evaluations[ongoing] = evaluate_ongoing(boards[ongoing], king_positions[ongoing])
+    return evaluations
+
+
+# returns the boards as (N, number of tiles) array and the flat indices x * width + y of the kings
+def __flat_boards_and_kings__(boards, king_positions):
+    width = boards.shape[-1]
+    king_positions = np.asarray(king_positions, dtype=np.intp)
+    return boards.reshape(len(boards), -1), king_positions[:, 0] * width + king_positions[:, 1]
+
+
+# superiority_rating of a stack of boards
+def superiority_ratings(boards):
+    flat_boards = boards.reshape(len(boards), -1)
+    white_pieces = np.count_nonzero((flat_boards == TileState.white) | (flat_boards == TileState.king), axis=1)
+    black_pieces = np.count_nonzero(flat_boards == TileState.black, axis=1)
+    return SUPERIORITY_WEIGHT*(2*white_pieces - black_pieces)
+
+
+# king_in_trouble_rating of a stack of boards
+def king_in_trouble_ratings(boards, king_positions):
+    flat_boards, king_indices = __flat_boards_and_kings__(boards, king_positions)
+    width = boards.shape[-1]
+    neighbors = np.take_along_axis(flat_boards, king_indices[:, None] + np.array([-width, width, -1, 1]), axis=1)
+    black_pieces_around_king = np.count_nonzero(neighbors == TileState.black, axis=1)
+    return -KING_IN_TROUBLE_WEIGHT*(KING_IN_TROUBLE_EXP_BASE**black_pieces_around_king - 1)
+
+
+# covered_angle_rating of a stack of boards
+def covered_angle_ratings(boards, king_positions):
+    _, king_indices = __flat_boards_and_kings__(boards, king_positions)
+    covered_angles = covered_angle_tables(boards.shape[-1] - 2).covered_angles(boards, king_indices)
+    return -covered_angles * COVERED_ANGLE_WEIGHT / (2 * math.pi)
+
+
+# same_axis_as_king_rating of a stack of boards. The tiles in the four directions of the kings are gathered with the
+# path indices of the ActionEncoding
+def same_axis_as_king_ratings(boards, king_positions):
+    flat_boards, _ = __flat_boards_and_kings__(boards, king_positions)
+    king_positions = np.asarray(king_positions, dtype=np.intp)
+    paths = action_encoding(boards.shape[-1] - 2).path_indices[king_positions[:, 0] - 1, king_positions[:, 1] - 1]
+    tiles = np.take_along_axis(flat_boards, paths.reshape(len(boards), -1), axis=1).reshape(paths.shape)
+    blocking = (tiles == TileState.border) | (tiles == TileState.white) | (tiles == TileState.black) \
+        | (tiles == TileState.king)
+    first_blocking = np.argmax(blocking, axis=-1)
+    first_tiles = np.take_along_axis(tiles, first_blocking[..., None], axis=-1)[..., 0]
+    black_on_axis = blocking.any(axis=-1) & (first_tiles == TileState.black)
+    axis_sum = np.where(black_on_axis, 1 / (first_blocking + 1), 0).sum(axis=-1)
+    return -axis_sum / 4 * SAME_AXIS_AS_KING_WEIGHT
+
+
+# king_turns_to_corner of a stack of boards. The breadth-first search of KingDistanceField runs forwards from the
+# kings on all boards at once: every step slides the frontier along the free tiles in all four directions, until
+# every king has reached a corner or can not get any further
+def king_turns_to_corner_ratings(boards, king_positions):
+    flat_boards, king_indices = __flat_boards_and_kings__(boards, king_positions)
+    size = boards.shape[-1] - 2
+    width = size + 2
+    games = np.arange(len(boards))
+    free = (flat_boards == TileState.empty) | (flat_boards == TileState.throne) | (flat_boards == TileState.corner)
+    free[games, king_indices] = True
+    corners = np.zeros(width * width, dtype=bool)
+    corners[[width + 1, width + size, size * width + 1, size * width + size]] = True
+
+    reached = np.zeros(flat_boards.shape, dtype=bool)
+    reached[games, king_indices] = True
+    turns = np.where(corners[king_indices], 0, -1)
+    frontier = reached & (turns == -1)[:, None]
+    number_of_turns = 0
+    while frontier.any():
+        number_of_turns += 1
+        next_frontier = np.zeros(frontier.shape, dtype=bool)
+        # the border is never free, so the tiles that np.roll wraps around never get reached
+        for offset in (-width, width, -1, 1):
+            ray = frontier
+            for _ in range(size - 1):
+                ray = np.roll(ray, offset, axis=1) & free
+                if not ray.any():
+                    break
+                next_frontier |= ray
+        next_frontier &= ~reached
+        reached |= next_frontier
+        arrived = (next_frontier & corners).any(axis=1) & (turns == -1)
+        turns[arrived] = number_of_turns
+        frontier = next_frontier & (turns == -1)[:, None]
+    return np.where(turns == -1, 0, -KING_TURNS_TO_CORNER_WEIGHT*KING_TURNS_TO_CORNER_EXP_BASE**(-turns.astype(float)))
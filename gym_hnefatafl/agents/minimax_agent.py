@@ -1,18 +1,33 @@
-import copy
 import math
 import operator
 import random
+import time
 import cProfile
-from bisect import bisect_left
+from multiprocessing import Pool
 
 from gym_hnefatafl.agents.evaluation import evaluate, quick_evaluate, covered_angle_rating, ANGLE_INTERVALS_3, \
-    calculate_angle_intervals, king_centered_evaluation
+    calculate_angle_intervals, king_centered_evaluation, IncrementalEvaluator
+from gym_hnefatafl.agents.move_ordering import MoveOrdering
+from gym_hnefatafl.agents.transposition_table import TranspositionTable, Bound, TRANSPOSITION_TABLE_SIZE_MB
 from gym_hnefatafl.envs import HnefataflEnv
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
 from gym_hnefatafl.envs.board import Player, HnefataflBoard, Outcome
 
 MINIMAX_SEARCH_DEPTH = 1
 PROFILE = False
+
+# Budgets per move. If one of them is set, make_move runs an iterative deepening alpha-beta search
+# (independent of ALPHA_BETA) that goes one ply deeper at a time until the budget is used up or
+# MAX_ITERATIVE_DEEPENING_DEPTH is reached, and returns the result of the deepest completed iteration.
+TIME_BUDGET = None      # seconds
+NODE_BUDGET = None      # number of searched nodes
+MAX_ITERATIVE_DEEPENING_DEPTH = 32
+
 ALPHA_BETA = False
+# if larger than 1, make_move splits the root moves of an alpha-beta search over a pool of this many processes.
+# The pool is created on the first move and kept until close() is called
+NUMBER_OF_SEARCH_PROCESSES = 1
+USE_BITBOARD = False    # whether the search runs on a BitboardHnefataflBoard instead of the given board
 
 # 0: full evaluation, 1: quick evaluation, 2: king_centered_evaluation
 EVALUATION_METHOD = 1
@@ -28,42 +43,107 @@ def minimax_comp(this_player):
     return operator.__lt__ if this_player == Player.black else operator.__gt__
 
 
-# makes a copy of the board for each action and executes the action on the board.
-# The (action, board) pairs are inserted into a list that is sorted by the number
-# of pieces that are captured when performing the action
-def reordered_boards_after_action(board, turn_player):
-    boards = []
-    captures = []
-    for action in board.get_valid_actions(turn_player):
-        board_copy = copy.deepcopy(board)
-        captured = -len(board_copy.do_action(action, turn_player))
-        insertion_index = bisect_left(captures, captured)
-        boards.insert(insertion_index, (action, board_copy))
-    return boards
+# raised inside the search when the time or node budget of a move is used up
+class SearchTimeout(Exception):
+    pass
+
+
+# the agent of a search process and the key of the root position it searched last (see parallel_search)
+__worker_agent__ = None
+__worker_root_key__ = None
+
+
+# initializes a search process of the pool of MinimaxAgent.parallel_search
+def __init_search_worker__(player, transposition_table_size_mb):
+    global __worker_agent__
+    __worker_agent__ = MinimaxAgent(player, transposition_table_size_mb, number_of_processes=1)
+
+
+# searches one root action in a search process. The worker agent keeps its transposition table between tasks
+# and moves. Returns (action, value, number of searched nodes) with value None if the budget ran out
+def __search_root_action__(arguments):
+    global __worker_root_key__
+    position, action, turn_player, depth, deadline, node_limit = arguments
+    agent = __worker_agent__
+    board = BitboardHnefataflBoard.from_position(position) if USE_BITBOARD else HnefataflBoard.from_position(position)
+    if board.zobrist_key != __worker_root_key__:
+        __worker_root_key__ = board.zobrist_key
+        agent.transposition_table.new_search()
+        agent.move_ordering.new_search()
+
+    agent.search_depth = depth
+    agent.deadline = None if deadline is None else time.perf_counter() + deadline - time.time()
+    agent.node_limit = node_limit
+    agent.nodes = 0
+    board.do_action(action, turn_player)
+    try:
+        _, value = agent.alphabeta(board, 1, -math.inf, math.inf, other_player(turn_player))
+    except SearchTimeout:
+        value = None
+    finally:
+        agent.deadline = None
+        agent.node_limit = None
+    return action, value, agent.nodes
 
 
 # an agent that uses a minimax search for estimating which move is best
 class MinimaxAgent(object):
-    def __init__(self, player):
+    def __init__(self, player, transposition_table_size_mb=TRANSPOSITION_TABLE_SIZE_MB,
+                 number_of_processes=NUMBER_OF_SEARCH_PROCESSES):
         self.player = player
+        self.number_of_processes = number_of_processes
+        self.pool = None
+        # used by alphabeta, kept between the moves of a game
+        self.transposition_table_size_mb = transposition_table_size_mb
+        self.transposition_table = TranspositionTable(transposition_table_size_mb)
+        # killer moves and history scores used by alphabeta
+        self.move_ordering = MoveOrdering()
+        # the depth at which minimax_search and alphabeta evaluate the board
+        self.search_depth = MINIMAX_SEARCH_DEPTH
+
+        # budget of the running search (None if unlimited) and the number of nodes searched so far
+        self.deadline = None
+        self.node_limit = None
+        self.nodes = 0
+        # best line of play found by the last completed iteration and its depth
+        self.principal_variation = []
+        self.completed_depth = 0
+
         if not ANGLE_INTERVALS_3:
             calculate_angle_intervals()
 
-    # chooses a move based on a minimax search with the __evaluate__ heuristic further below
-    def make_move(self, board) -> ((int, int), (int, int)):
-        if PROFILE:
-            prof = cProfile.Profile()
-            if ALPHA_BETA:
-                minimax_action, minimax_value = prof.runcall(self.alphabeta, board, 0, -math.inf, math.inf,
-                                                             self.player, )
-            else:
-                minimax_action, minimax_value = prof.runcall(self.minimax_search, board, self.player, 0, )
-            prof.print_stats(sort=2)
+    # chooses a move based on a minimax search with the __evaluate__ heuristic further below.
+    # time_budget (seconds) and node_budget switch to an iterative deepening search within these limits
+    def make_move(self, board, time_budget=TIME_BUDGET, node_budget=NODE_BUDGET) -> ((int, int), (int, int)):
+        if USE_BITBOARD:
+            board = BitboardHnefataflBoard.from_board(board)
+        self.transposition_table.new_search()
+        self.move_ordering.new_search()
+        if self.number_of_processes > 1:
+            search, arguments = self.parallel_search, (board, self.player, time_budget, node_budget)
+        elif time_budget is not None or node_budget is not None:
+            search, arguments = self.iterative_deepening, (board, self.player, time_budget, node_budget)
         else:
+            self.search_depth = MINIMAX_SEARCH_DEPTH
             if ALPHA_BETA:
-                minimax_action, minimax_value = self.alphabeta(board, 0, -math.inf, math.inf, self.player)
+                search, arguments = self.alphabeta, (board, 0, -math.inf, math.inf, self.player)
+            else:
+                search, arguments = self.minimax_search, (board, self.player, 0)
+        # the quick evaluation of minimax_search reads the king ratings from the evaluator while the search is
+        # running (alphabeta evaluates with the full evaluate and would only pay for the updates).
+        # The board gets its previous evaluator back even if the search raises
+        previous_evaluator = board.evaluator
+        if search == self.minimax_search and EVALUATION_METHOD == 1:
+            board.evaluator = IncrementalEvaluator()
+        try:
+            if PROFILE:
+                prof = cProfile.Profile()
+                minimax_action, minimax_value = prof.runcall(search, *arguments)
+                prof.print_stats(sort=2)
             else:
-                minimax_action, minimax_value = self.minimax_search(board, self.player, 0)
+                minimax_action, minimax_value = search(*arguments)
+        finally:
+            board.evaluator = previous_evaluator
 
         return random.choice(board.get_valid_actions(self.player)) if minimax_action is None else minimax_action
 
@@ -71,12 +151,22 @@ class MinimaxAgent(object):
     def give_reward(self, reward):
         pass
 
+    # stops the processes of the parallel search
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
     # returns the minimax action and minimax value for the given board and the turn player.
-    # The calculation is cut off at the depth that is specified at the top of this file
+    # The calculation is cut off at self.search_depth (set to the depth specified at the top of this file)
     # white is maximizer, black is minimizer
     def minimax_search(self, board: HnefataflBoard, turn_player, depth):
         # evaluate this node using the heuristic if the max depth is reached
-        if depth == MINIMAX_SEARCH_DEPTH or board.outcome != Outcome.ongoing:
+        if depth == self.search_depth or board.outcome != Outcome.ongoing:
+            # a player that can not move loses. Inner nodes find that out when get_valid_actions returns no action
+            if board.outcome == Outcome.ongoing and not board.has_any_move(turn_player):
+                return None, -math.inf if turn_player == Player.white else math.inf
             if EVALUATION_METHOD == 0:
                 return None, evaluate(board, turn_player)
             elif EVALUATION_METHOD == 1:
@@ -104,15 +194,51 @@ class MinimaxAgent(object):
 
     # does the same as minimax_search, but uses alpha-beta-pruning to make it faster. initialize with
     # depth = 0, alpha = -math.inf, beta = math.inf
-    def alphabeta(self, board, depth, alpha, beta, turn_player):
-        if depth == MINIMAX_SEARCH_DEPTH or board.outcome != Outcome.ongoing:
+    # Results are stored in the transposition table. Stored results that were searched at least as deep
+    # narrow the window (or end the search of that node).
+    # on_principal_variation is True if all moves leading to this node follow self.principal_variation.
+    # The moves are searched in the order of self.move_ordering: the next move of the principal variation and
+    # the stored best move first, then captures and king escapes, then killer moves and history scores.
+    def alphabeta(self, board, depth, alpha, beta, turn_player, on_principal_variation=False):
+        self.nodes += 1
+        if self.deadline is not None or self.node_limit is not None:
+            self.__check_budget__()
+
+        if depth == self.search_depth or board.outcome != Outcome.ongoing:
+            # a player that can not move loses. Inner nodes find that out when get_valid_actions returns no action
+            if board.outcome == Outcome.ongoing and not board.has_any_move(turn_player):
+                return None, -math.inf if turn_player == Player.white else math.inf
             return None, evaluate(board, turn_player)
+
+        remaining_depth = self.search_depth - depth
+        table_action = None
+        entry = self.transposition_table.probe(board.zobrist_key)
+        if entry is not None:
+            entry_depth, entry_value, entry_bound, table_action = entry
+            # the root always searches so that a valid action is returned
+            if depth > 0 and entry_depth >= remaining_depth:
+                if entry_bound == Bound.exact:
+                    return table_action, entry_value
+                elif entry_bound == Bound.lower:
+                    alpha = max(alpha, entry_value)
+                else:
+                    beta = min(beta, entry_value)
+                if alpha >= beta:
+                    return table_action, entry_value
+        window_alpha, window_beta = alpha, beta
+
+        principal_action = self.principal_variation[depth] \
+            if on_principal_variation and depth < len(self.principal_variation) else None
+        actions = self.move_ordering.order(board, board.get_valid_actions(turn_player), turn_player, depth,
+                                           (principal_action, table_action))
+
         if turn_player == Player.white:
             value = -math.inf
             best_action = None
-            for action in board.get_valid_actions(turn_player):
+            for action in actions:
                 board.do_action(action, turn_player)
-                subtree_best_action, subtree_alpha = self.alphabeta(board, depth + 1, alpha, beta, Player.black)
+                subtree_best_action, subtree_alpha = self.alphabeta(board, depth + 1, alpha, beta, Player.black,
+                                                                    principal_action == action)
                 board.undo_last_action()
                 if value < subtree_alpha:
                     value = subtree_alpha
@@ -120,13 +246,13 @@ class MinimaxAgent(object):
                     alpha = max(alpha, value)
                     if alpha >= beta:
                         break
-            return best_action, value
         else:
             value = math.inf
             best_action = None
-            for action in board.get_valid_actions(turn_player):
+            for action in actions:
                 board.do_action(action, turn_player)
-                subtree_best_action, subtree_beta = self.alphabeta(board, depth + 1, alpha, beta, Player.white)
+                subtree_best_action, subtree_beta = self.alphabeta(board, depth + 1, alpha, beta, Player.white,
+                                                                   principal_action == action)
                 board.undo_last_action()
                 if value > subtree_beta:
                     value = subtree_beta
@@ -134,7 +260,107 @@ class MinimaxAgent(object):
                 beta = min(beta, value)
                 if alpha >= beta:
                     break
-            return best_action, value
 
+        # remember the move that caused a cutoff
+        if alpha >= beta and best_action is not None:
+            self.move_ordering.update(board, best_action, turn_player, depth, remaining_depth)
 
+        if value <= window_alpha:
+            bound = Bound.upper
+        elif value >= window_beta:
+            bound = Bound.lower
+        else:
+            bound = Bound.exact
+        self.transposition_table.store(board.zobrist_key, remaining_depth, value, bound, best_action)
+        return best_action, value
 
+    # Searches one ply deeper at a time with alphabeta until the time budget (seconds) or the node budget is
+    # used up and returns (action, value) of the deepest completed iteration. Every iteration searches the
+    # principal variation of the previous one first (see alphabeta).
+    def iterative_deepening(self, board, turn_player, time_budget=None, node_budget=None):
+        self.deadline = None if time_budget is None else time.perf_counter() + time_budget
+        self.node_limit = node_budget
+        self.nodes = 0
+        self.principal_variation = []
+        self.completed_depth = 0
+        number_of_actions = len(board.action_stack)
+        best_action, best_value = None, None
+        try:
+            for depth in range(1, MAX_ITERATIVE_DEEPENING_DEPTH + 1):
+                self.search_depth = depth
+                best_action, best_value = self.alphabeta(board, 0, -math.inf, math.inf, turn_player, True)
+                self.completed_depth = depth
+                self.principal_variation = self.__principal_variation__(board, turn_player, best_action)
+                # the game is decided within the search horizon
+                if best_value == math.inf or best_value == -math.inf:
+                    break
+        except SearchTimeout:
+            # revert the actions of the interrupted iteration
+            while len(board.action_stack) > number_of_actions:
+                board.undo_last_action()
+        finally:
+            self.deadline = None
+            self.node_limit = None
+        return best_action, best_value
+
+    # raises SearchTimeout if the budget of the running search is used up
+    def __check_budget__(self):
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchTimeout()
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+    # follows the best moves stored in the transposition table, starting with "action", and returns that line
+    def __principal_variation__(self, board, turn_player, action):
+        principal_variation = []
+        while action is not None and len(principal_variation) < self.search_depth \
+                and board.outcome == Outcome.ongoing and board.can_do_action(action, turn_player):
+            board.do_action(action, turn_player)
+            principal_variation.append(action)
+            turn_player = other_player(turn_player)
+            entry = self.transposition_table.probe(board.zobrist_key)
+            action = None if entry is None else entry[3]
+        for _ in principal_variation:
+            board.undo_last_action()
+        return principal_variation
+
+    # Splits the root actions over the search processes, each one searches the position after its action with
+    # alphabeta. Without budget, the root is searched MINIMAX_SEARCH_DEPTH plies deep. With a time or node budget,
+    # the root is searched one ply deeper at a time like in iterative_deepening, ordered by the values of the
+    # previous iteration, and the result of the deepest iteration that every process completed is returned.
+    def parallel_search(self, board, turn_player, time_budget=None, node_budget=None):
+        if self.pool is None:
+            self.pool = Pool(self.number_of_processes, __init_search_worker__,
+                             (self.player, self.transposition_table_size_mb))
+        actions = self.move_ordering.order(board, board.get_valid_actions(turn_player), turn_player, 0)
+        best_action, best_value = None, math.inf if turn_player == Player.black else -math.inf
+        if not actions:
+            return best_action, best_value
+
+        position = board.get_position()
+        deadline = None if time_budget is None else time.time() + time_budget
+        if time_budget is None and node_budget is None:
+            depths = [MINIMAX_SEARCH_DEPTH]
+        else:
+            depths = range(1, MAX_ITERATIVE_DEEPENING_DEPTH + 1)
+        self.nodes = 0
+        self.completed_depth = 0
+        for depth in depths:
+            node_limit = None if node_budget is None else max(1, (node_budget - self.nodes) // len(actions))
+            results = self.pool.map(__search_root_action__,
+                                    [(position, action, turn_player, depth, deadline, node_limit)
+                                     for action in actions], chunksize=1)
+            self.nodes += sum(nodes for _, _, nodes in results)
+            if any(value is None for _, value, _ in results):
+                break
+            # order the actions by value for the next iteration (the sort is stable, ties keep their order)
+            values = {action: value for action, value, _ in results}
+            actions.sort(key=lambda action: values[action], reverse=turn_player == Player.white)
+            best_action, best_value = actions[0], values[actions[0]]
+            self.completed_depth = depth
+            self.principal_variation = [best_action]
+            if best_value == math.inf or best_value == -math.inf \
+                    or (deadline is not None and time.time() > deadline) \
+                    or (node_budget is not None and self.nodes >= node_budget):
+                break
+        return best_action, best_value
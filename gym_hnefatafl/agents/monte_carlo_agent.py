@@ -1,18 +1,20 @@
 import cProfile
-import copy
 import math
-import random
 
 import numpy as np
 
-from gym_hnefatafl.agents.evaluation import evaluate, quick_evaluate, ANGLE_INTERVALS_3, calculate_angle_intervals
+from gym_hnefatafl.agents.evaluation import ANGLE_INTERVALS_3, calculate_angle_intervals, evaluate_actions
 from gym_hnefatafl.agents.minimax_agent import MinimaxAgent
+from gym_hnefatafl.agents.node_store import ValueNodeStore
 from gym_hnefatafl.envs import HnefataflEnv
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
 from gym_hnefatafl.envs.board import Outcome, Player
+from gym_hnefatafl.envs.rollout import RolloutPosition, rollout
 
 QUICK_EVALUATION = True     # whether the nodes calls evaluate or quick_evaluate
 USE_MINIMAX = False          # whether the algorithm uses the minimax algorithm to finish simulating a game
 PROFILE = True
+USE_BITBOARD = False    # whether the tree is searched on a BitboardHnefataflBoard instead of a copy of the env board
 
 MONTE_CARLO_ITERATIONS = 100
 MIN_NUM_VISITS_INTERNAL = 5  # may have to be much higher go uses 9*9
@@ -23,12 +25,14 @@ OUTCOME_WHITE_VALUE = 1
 OUTCOME_DRAW_VALUE = 0
 
 
-# represents a monte carlo search tree
+# represents a monte carlo search tree. The nodes (the ones that are actually stored in memory -> see the paper)
+# are indices into a ValueNodeStore, the root is node 0
 class Tree(object):
     # board: the current board
     # player: the player that this agent represents
     def __init__(self, board, player):
-        self.root = Node(player, None)
+        self.nodes = ValueNodeStore(player)
+        self.root = 0
         self.board = board
         self.player = player
         self.white_minimax = MinimaxAgent(Player.white)
@@ -36,135 +40,111 @@ class Tree(object):
 
     # simulates an entire game
     def simulate_game(self):
-        simulation_board_copy = copy.deepcopy(self.board)
+        simulation_board_copy = self.board.clone(history=False)
         current_node = self.root
+        # whether the last node of the path has played an action. It has not if the game ended with the action of
+        # its parent (or at the root)
+        current_node_played = False
 
         # simulate actions within the tree until we are no longer at a stored node
         while simulation_board_copy.outcome == Outcome.ongoing:
-            self.player = current_node.player
-            next_node, action = current_node.choose_and_simulate_action(simulation_board_copy)
-            if next_node is None:
+            self.player = Player(self.nodes.players[current_node])
+            next_node = self.__simulate_node_action__(current_node, simulation_board_copy)
+            if next_node < 0:
                 self.player = other_player(self.player)
+                current_node_played = True
                 break
             else:
                 current_node = next_node
 
-        back_up_board_copy = copy.deepcopy(simulation_board_copy)
-
-        # finish game
-        while simulation_board_copy.outcome == Outcome.ongoing:
-            self.__choose_and_simulate_action__(simulation_board_copy)
-            self.player = other_player(self.player)
+        # finish game (on a copy, because the actions within the tree are undone when backing up the value)
+        if USE_MINIMAX:
+            finished_board = simulation_board_copy.clone(history=False)
+            while finished_board.outcome == Outcome.ongoing:
+                self.__choose_and_simulate_action__(finished_board)
+                self.player = other_player(self.player)
+            outcome = finished_board.outcome
+        else:
+            outcome = rollout(RolloutPosition.from_board(simulation_board_copy, self.player))
 
-        print(str(simulation_board_copy.outcome))
+        print(str(outcome))
 
         # calculate game value
-        game_value = OUTCOME_BLACK_VALUE if simulation_board_copy.outcome == Outcome.black \
-            else OUTCOME_WHITE_VALUE if simulation_board_copy.outcome == Outcome.white \
+        game_value = OUTCOME_BLACK_VALUE if outcome == Outcome.black \
+            else OUTCOME_WHITE_VALUE if outcome == Outcome.white \
             else OUTCOME_DRAW_VALUE
 
-        # back up value
-        while current_node is not None:
-            back_up_board_copy.undo_last_action()
-            current_node.back_up(game_value, back_up_board_copy)
-            current_node = current_node.parent
-
-    # chooses an action and simulates it.
+        # back up value, undoing exactly the actions played within the tree
+        while current_node >= 0:
+            if current_node_played:
+                simulation_board_copy.undo_last_action()
+            current_node_played = True
+            ################################################################################################
+            # parameter that somehow needs to reflect "points on the board", i. e. empty intersections in go
+            # could possibly be chosen as "number of pieces on the board"
+            points = 11 * 11 * (simulation_board_copy.white_pieces + simulation_board_copy.black_pieces)
+            ################################################################################################
+            self.nodes.back_up(current_node, game_value, points)
+            current_node = int(self.nodes.parents[current_node])
+
+    # chooses the minimax action and simulates it. A player that can not move loses (like in
+    # HnefataflBoard.get_valid_actions), the minimax agent would have no move to return
     def __choose_and_simulate_action__(self, board):
-        if USE_MINIMAX:
-            if self.player == Player.white:
-                board.do_action(self.white_minimax.make_move(board), self.player)
-            else:
-                board.do_action(self.black_minimax.make_move(board), self.player)
-        else:
-            board.do_action(random.choice(board.get_valid_actions(self.player)), self.player)
-
-    # returns the best action found
-    def get_best_action(self):
-        best_action = None
-        if self.root.player == Player.white:
-            best_mu = -math.inf
-            for child, action in self.root.children_with_actions:
-                if child.mean > best_mu:
-                    best_mu = child.mean
-                    best_action = action
+        if not board.has_any_move(self.player):
+            board.outcome = Outcome.white if self.player == Player.black else Outcome.black
+        elif self.player == Player.white:
+            board.do_action(self.white_minimax.make_move(board), self.player)
         else:
-            best_mu = math.inf
-            for child, action in self.root.children_with_actions:
-                if child.mean < best_mu:
-                    best_mu = child.mean
-                    best_action = action
-        return best_action
-
-
-# represents a node within the monte carlo search tree (that is actually stored in memory -> see the paper)
-class Node(object):
-    def __init__(self, player, parent_node):
-        self.parent = parent_node
-        self.children_with_actions = []  # list of (children, action) pairs
-        self.action_to_children_dict = {}
-        self.number_of_visits = 0
-        self.sum_of_values = 0
-        self.sum_of_squared_values = 0
-
-        # sign of this needs to return something meaningful, so instead of 0 this is set to machine epsilon
-        self.mean = np.finfo(float).eps if player == Player.white else -np.finfo(float).eps
-
-        self.variance = 0.0
-        self.player = player
-        self.is_internal = False
-
-    # chooses and simulates an action
-    def choose_and_simulate_action(self, board):
-        self.number_of_visits += 1
-        self.is_internal = self.number_of_visits > MIN_NUM_VISITS_INTERNAL
-        action = self.__choose_action__(board)
-        board.do_action(action, self.player)
-
-        # If this node has already been visited, either create a child node or return an existing one.
-        # Otherwise return None
-        if self.number_of_visits > 1:
-            if action not in self.action_to_children_dict.keys():
-                child_node = Node(other_player(self.player), self)
-                self.children_with_actions.append((child_node, action))
-                self.action_to_children_dict[action] = child_node
-                return child_node, action
-            else:
-                return self.action_to_children_dict[action], action
+            board.do_action(self.black_minimax.make_move(board), self.player)
+
+    # chooses and simulates an action of the player of "node".
+    # If the node has already been visited, returns the child of the action, which is created if necessary.
+    # Otherwise returns -1
+    def __simulate_node_action__(self, node, board):
+        nodes = self.nodes
+        nodes.visits[node] += 1
+        player = Player(nodes.players[node])
+        action = self.__choose_action__(node, board)
+        board.do_action(action, player)
+
+        if nodes.visits[node] > 1:
+            child = nodes.child(node, action)
+            return nodes.add(node, action, other_player(player)) if child < 0 else child
         else:
-            return None, action
+            return -1
 
-    # chooses an action
-    def __choose_action__(self, board):
-        actions = board.get_valid_actions(self.player)
-        probabilities = self.get_action_probabilities(actions, board)
+    # whether a node has been visited often enough to be an internal node (see the paper)
+    def is_internal(self, node):
+        return self.nodes.visits[node] > MIN_NUM_VISITS_INTERNAL
 
-        # Nach einer Stunde googeln herausgefunden, dass numpy nicht in der Lage ist,
-        # ein Array aus Tupeln zu machen und man stattdessen diesen Quatsch machen muss.
-        actions_array = np.empty(len(actions), dtype=object)
-        actions_array[:] = actions
+    # chooses an action of the player of "node"
+    def __choose_action__(self, node, board):
+        actions = board.get_valid_actions(Player(self.nodes.players[node]))
+        probabilities = self.get_action_probabilities(node, actions, board)
 
-        action = np.random.choice(actions_array, p=probabilities)
-        return action
+        # draws the index of the action instead of the action, so that no object array of tuples is needed
+        return actions[np.random.choice(len(actions), p=probabilities)]
 
-    # returns the probabilities for each action
+    # returns the probabilities for each action of the player of "node"
     # actions: the possible actions
     # board: the current board
-    def get_action_probabilities(self, actions, board):
+    def get_action_probabilities(self, node, actions, board):
+        nodes = self.nodes
+        children = np.array([nodes.child(node, action) for action in actions])
+        known = children >= 0
         mus = np.empty(len(actions))
         sigmas_squared = np.empty(len(actions))
-        for i, action in enumerate(actions):
-            if action in self.action_to_children_dict.keys():
-                child = self.action_to_children_dict[action]
-                mus[i] = child.mean
-                sigmas_squared[i] = child.variance
-            else:
-                board.do_action(action, self.player)
-                evaluation = quick_evaluate(board, self.player) if QUICK_EVALUATION else evaluate(board, self.player)
-                mus[i] = 1 if evaluation == math.inf else -1 if evaluation == -math.inf else evaluation / len(
-                    actions)
-                board.undo_last_action()
-                sigmas_squared[i] = DEFAULT_SIGMA_SQUARED
+        mus[known] = nodes.means[children[known]]
+        sigmas_squared[known] = nodes.variances[children[known]]
+
+        # the actions without child node are evaluated together
+        new_actions = np.flatnonzero(~known)
+        if len(new_actions):
+            evaluations = evaluate_actions(board, [actions[i] for i in new_actions], Player(nodes.players[node]),
+                                           QUICK_EVALUATION)
+            mus[new_actions] = np.where(evaluations == math.inf, 1, np.where(evaluations == -math.inf, -1,
+                                                                             evaluations / len(actions)))
+            sigmas_squared[new_actions] = DEFAULT_SIGMA_SQUARED
 
         mu_0_index = np.argmax(mus)
         mu_0 = mus[mu_0_index]
@@ -189,32 +169,20 @@ class Node(object):
         probabilities /= np.sum(probabilities)
         return probabilities
 
-    def back_up(self, value, board):
-        self.sum_of_values += value
-        self.sum_of_squared_values += value * value
-        self.update_mean_variance(board)
-
-    def update_mean_variance(self, board):
-        ################################################################################################
-        # parameter that somehow needs to reflect "points on the board", i. e. empty intersections in go
-        # could possibly be chosen as "number of pieces on the board"
-        p = 11 * 11 * (board.white_pieces + board.black_pieces)
-        ################################################################################################
-        if self.parent is None:
-            if self.player == Player.white:
-                sign = +1
-            else:
-                sign = -1
-            self.mean = self.sum_of_values/self.number_of_visits * sign
-        else:
-            self.mean = self.sum_of_values/self.number_of_visits * -np.sign(self.parent.mean)
-        self.variance = (self.sum_of_squared_values - self.number_of_visits*self.mean*self.mean + 4*p*p) \
-                        / (self.number_of_visits + 1)
+    # returns the best action found
+    def get_best_action(self):
+        children = self.nodes.children_of(self.root)
+        if len(children) == 0:
+            return None
+        means = self.nodes.means[children]
+        # the first child with the best mean, like a scan in creation order
+        best_child = children[np.argmax(means) if self.nodes.players[self.root] == Player.white else np.argmin(means)]
+        return self.nodes.action(best_child)
 
 
 # returns the opponent of the given player
 def other_player(player):
-    return Player.white if player == Player.black else Player.white
+    return Player.white if player == Player.black else Player.black
 
 
 class MonteCarloAgent(object):
@@ -231,7 +199,8 @@ class MonteCarloAgent(object):
         if PROFILE:
             prof = cProfile.Profile()
             prof.enable()
-        tree = Tree(env.get_board(), self.player)
+        board = BitboardHnefataflBoard.from_board(env.get_board()) if USE_BITBOARD else env.get_board()
+        tree = Tree(board, self.player)
         for i in range(MONTE_CARLO_ITERATIONS):
             tree.simulate_game()
             if i % 10 == 9:
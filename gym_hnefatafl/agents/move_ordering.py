@@ -0,0 +1,61 @@
+NUMBER_OF_KILLER_MOVES = 2     # killer moves that are remembered per ply
+
+# sort keys of the ordering stages. Within a stage, moves are sorted by the second part of the key
+PREFERRED_MOVE_SCORE = 5       # transposition table move, principal variation move
+WINNING_MOVE_SCORE = 4         # king to a corner
+CAPTURE_SCORE = 3              # captures (by number of captured pieces) and king moves to the edge
+KILLER_MOVE_SCORE = 2
+HISTORY_SCORE = 1
+
+
+# Orders the moves of a node for alpha-beta search without copying or changing the board:
+# first the preferred moves (transposition table or principal variation move), then king escapes, captures
+# and king moves that threaten an escape, then the killer moves of the ply and the rest by their history score.
+# The killer moves and history scores are learned from the cutoffs reported by the search (see update)
+class MoveOrdering(object):
+    def __init__(self):
+        self.killer_moves = []   # per ply: list of the latest quiet moves that caused a cutoff
+        self.history = {}        # (player, move): sum of squared remaining depths of the cutoffs the move caused
+
+    # prepares for the search of a new move. Killer moves are forgotten, history scores are halved
+    def new_search(self):
+        self.killer_moves = []
+        for key in self.history:
+            self.history[key] //= 2
+
+    # returns the actions sorted by how promising they are
+    def order(self, board, actions, turn_player, ply, preferred_actions=()):
+        killer_moves = self.killer_moves[ply] if ply < len(self.killer_moves) else []
+        corner_coordinates = (1, board.size)
+        king_position = board.king_position
+
+        def sort_key(action):
+            if action in preferred_actions:
+                return PREFERRED_MOVE_SCORE, -preferred_actions.index(action)
+            position_from, (to_x, to_y) = action
+            is_king = position_from == king_position
+            if is_king and to_x in corner_coordinates and to_y in corner_coordinates:
+                return WINNING_MOVE_SCORE, 0
+            captures = board.count_captures(action, turn_player)
+            if captures > 0:
+                return CAPTURE_SCORE, captures
+            if is_king and (to_x in corner_coordinates or to_y in corner_coordinates):
+                return CAPTURE_SCORE, 0
+            if action in killer_moves:
+                return KILLER_MOVE_SCORE, -killer_moves.index(action)
+            return HISTORY_SCORE, self.history.get((turn_player, action), 0)
+
+        return sorted(actions, key=sort_key, reverse=True)
+
+    # records that "action" caused a cutoff at "ply" with "remaining_depth" plies left to search
+    def update(self, board, action, turn_player, ply, remaining_depth):
+        if board.count_captures(action, turn_player) > 0:
+            return
+        while len(self.killer_moves) <= ply:
+            self.killer_moves.append([])
+        killer_moves = self.killer_moves[ply]
+        if action not in killer_moves:
+            killer_moves.insert(0, action)
+            del killer_moves[NUMBER_OF_KILLER_MOVES:]
+        key = (turn_player, action)
+        self.history[key] = self.history.get(key, 0) + remaining_depth * remaining_depth
@@ -0,0 +1,247 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+from gym_hnefatafl.agents.transposition_table import encode_move, decode_move
+from gym_hnefatafl.envs.board import Outcome, Player
+
+NODE_STORE_CHUNK_SIZE = 2**16     # number of nodes the arrays grow by when they are full
+
+# index of the counters of a NodeStore
+NUMBER_OF_NODES = 0
+NUMBER_OF_SIMULATIONS = 1         # simulations that have been started on the tree
+
+# the arrays of a NodeStore as (name, dtype, shape of one node), ordered by item size so that every array of a
+# shared memory block is aligned
+NODE_ARRAYS = (
+    ("results", np.int32, (len(Outcome),)),     # per node: count per Outcome
+    ("actions", np.int32, ()),                  # action that leads from the parent to the node
+    ("first_children", np.int32, ()),
+    ("visits", np.int32, ()),
+    ("virtual_losses", np.int32, ()),
+    ("child_counts", np.int16, ()),
+    ("players", np.int8, ()),
+)
+
+# the arrays of a ValueNodeStore
+VALUE_NODE_ARRAYS = ("players", "parents", "actions", "visits", "sums", "squared_sums", "means", "variances")
+
+
+# Stores the nodes of a monte carlo search tree as a structure of arrays instead of one object per node.
+# A node is an index into the arrays. The children of a node are created together when it is expanded, so they
+# occupy the consecutive indices first_children[node] ... first_children[node] + child_counts[node] - 1.
+# Node 0 is the root. Actions are packed into ints with encode_move.
+# A store created by create_shared keeps its arrays and counters in one block of shared memory of fixed capacity,
+# which other processes open with attach, so that several processes can search the same tree (the caller has to
+# lock the store). Such a store does not grow: expand returns False when the block is full
+class NodeStore(object):
+    # number of bytes of one node (player, action, first child, child count, visits, virtual losses, results)
+    NODE_SIZE = 1 + 4 + 4 + 2 + 4 + 4 + 4 * 4
+
+    def __init__(self, root_player, capacity=NODE_STORE_CHUNK_SIZE, buffer=None):
+        self.shared_memory = None
+        if buffer is None:
+            self.counters = np.zeros(2, dtype=np.int64)
+            for name, dtype, shape in NODE_ARRAYS:
+                setattr(self, name, np.zeros((capacity,) + shape, dtype=dtype))
+        else:
+            self.__map__(buffer, capacity)
+        if root_player is not None:
+            self.players[0] = root_player
+            self.actions[0] = -1
+            self.counters[NUMBER_OF_NODES] = 1
+
+    # creates a store of "capacity" nodes in a new block of shared memory
+    @classmethod
+    def create_shared(cls, root_player, capacity):
+        # a new block is filled with zeros
+        block = shared_memory.SharedMemory(create=True, size=cls.shared_size(capacity))
+        store = cls(root_player, capacity, block.buf)
+        store.shared_memory = block
+        return store
+
+    # opens the store in the shared memory block "name" that create_shared has created with "capacity"
+    @classmethod
+    def attach(cls, name, capacity):
+        block = shared_memory.SharedMemory(name=name)
+        store = cls(None, capacity, block.buf)
+        store.shared_memory = block
+        return store
+
+    # returns the number of bytes of the shared memory block of a store of "capacity" nodes
+    @staticmethod
+    def shared_size(capacity):
+        return 2 * 8 + capacity * NodeStore.NODE_SIZE
+
+    # returns the name of the shared memory block of the store, None if the store is not shared
+    @property
+    def name(self):
+        return None if self.shared_memory is None else self.shared_memory.name
+
+    # closes the shared memory block in this process, the store must not be used afterwards
+    def close(self):
+        if self.shared_memory is not None:
+            # the arrays are views of the block and have to be released before it can be closed
+            self.counters = None
+            for name, _, _ in NODE_ARRAYS:
+                setattr(self, name, None)
+            self.shared_memory.close()
+
+    # closes and frees the shared memory block, called once by the process that created it
+    def unlink(self):
+        block = self.shared_memory
+        self.close()
+        if block is not None:
+            block.unlink()
+
+    @property
+    def number_of_nodes(self):
+        return int(self.counters[NUMBER_OF_NODES])
+
+    @property
+    def number_of_simulations(self):
+        return int(self.counters[NUMBER_OF_SIMULATIONS])
+
+    def __len__(self):
+        return self.number_of_nodes
+
+    # creates a child for every action, the children belong to "child_player".
+    # Returns False (and creates nothing) if the store is shared and has no room for the children
+    def expand(self, node, actions, child_player):
+        first_child = self.number_of_nodes
+        if not self.__reserve__(first_child + len(actions)):
+            return False
+        self.players[first_child:first_child + len(actions)] = child_player
+        self.actions[first_child:first_child + len(actions)] = [encode_move(action) for action in actions]
+        self.first_children[node] = first_child
+        self.child_counts[node] = len(actions)
+        self.counters[NUMBER_OF_NODES] += len(actions)
+        return True
+
+    def is_expanded(self, node):
+        return self.child_counts[node] > 0
+
+    # returns the range of the child indices of a node
+    def children(self, node):
+        first_child = int(self.first_children[node])
+        return range(first_child, first_child + int(self.child_counts[node]))
+
+    # returns the action that leads to a node
+    def action(self, node):
+        return decode_move(int(self.actions[node]))
+
+    # counts a finished simulation through a node
+    def update(self, node, outcome):
+        self.results[node, outcome] += 1
+        self.visits[node] += 1
+
+    # returns the number of bytes allocated for the nodes
+    def memory_usage(self):
+        return sum(getattr(self, name).nbytes for name, _, _ in NODE_ARRAYS)
+
+    # lays the counters and arrays of "capacity" nodes out in "buffer" one after the other
+    def __map__(self, buffer, capacity):
+        self.counters = np.frombuffer(buffer, dtype=np.int64, count=2)
+        offset = self.counters.nbytes
+        for name, dtype, shape in NODE_ARRAYS:
+            count = capacity * int(np.prod(shape, dtype=int))
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape((capacity,) + shape)
+            setattr(self, name, array)
+            offset += array.nbytes
+
+    # makes sure that the arrays can hold "number_of_nodes" nodes by growing them in chunks.
+    # Shared stores cannot grow, for them it returns whether the nodes fit
+    def __reserve__(self, number_of_nodes):
+        capacity = len(self.players)
+        if number_of_nodes <= capacity:
+            return True
+        if self.shared_memory is not None:
+            return False
+        capacity += NODE_STORE_CHUNK_SIZE * -(-(number_of_nodes - capacity) // NODE_STORE_CHUNK_SIZE)
+        for name, _, _ in NODE_ARRAYS:
+            old_array = getattr(self, name)
+            new_array = np.zeros((capacity,) + old_array.shape[1:], dtype=old_array.dtype)
+            new_array[:len(old_array)] = old_array
+            setattr(self, name, new_array)
+        return True
+
+
+# Stores the nodes of the tree of monte_carlo_agent (mean and variance of the game values of every node) as a
+# structure of arrays. Unlike in NodeStore, children are created one at a time, when their action is first
+# simulated, so they are found through one dict from (parent, packed action) to child instead of a child range.
+# Node 0 is the root, its parent is -1
+class ValueNodeStore(object):
+
+    def __init__(self, root_player, capacity=NODE_STORE_CHUNK_SIZE):
+        self.players = np.zeros(capacity, dtype=np.int8)
+        self.parents = np.zeros(capacity, dtype=np.int32)
+        self.actions = np.zeros(capacity, dtype=np.int32)           # action that leads from the parent to the node
+        self.visits = np.zeros(capacity, dtype=np.int32)
+        self.sums = np.zeros(capacity)                              # sum of the backed up values
+        self.squared_sums = np.zeros(capacity)                      # sum of the squares of the backed up values
+        self.means = np.zeros(capacity)
+        self.variances = np.zeros(capacity)
+        self.children = {}
+        self.number_of_nodes = 0
+        self.add(-1, None, root_player)
+
+    def __len__(self):
+        return self.number_of_nodes
+
+    # creates a node of "player" that "action" leads to from "parent" and returns it
+    def add(self, parent, action, player):
+        node = self.number_of_nodes
+        self.__reserve__(node + 1)
+        self.players[node] = player
+        self.parents[node] = parent
+        self.actions[node] = -1 if action is None else encode_move(action)
+        # the sign of the mean needs to mean something, so instead of 0 it starts at machine epsilon
+        self.means[node] = np.finfo(float).eps if player == Player.white else -np.finfo(float).eps
+        if parent >= 0:
+            self.children[(parent, int(self.actions[node]))] = node
+        self.number_of_nodes += 1
+        return node
+
+    # returns the child of "node" that "action" leads to, -1 if it has not been created
+    def child(self, node, action):
+        return self.children.get((node, encode_move(action)), -1)
+
+    # returns the children of "node" that have been created
+    def children_of(self, node):
+        return np.flatnonzero(self.parents[1:self.number_of_nodes] == node) + 1
+
+    # returns the action that leads to a node
+    def action(self, node):
+        return decode_move(int(self.actions[node]))
+
+    # adds a game value to a node and updates its mean and variance.
+    # "points" is the parameter of the variance that reflects the points on the board (see the paper)
+    def back_up(self, node, value, points):
+        self.sums[node] += value
+        self.squared_sums[node] += value * value
+        # a node whose action has ended the game has not chosen an action itself and has no visits yet
+        visits = max(int(self.visits[node]), 1)
+        parent = self.parents[node]
+        if parent < 0:
+            sign = 1 if self.players[node] == Player.white else -1
+        else:
+            sign = -np.sign(self.means[parent])
+        self.means[node] = self.sums[node] / visits * sign
+        self.variances[node] = (self.squared_sums[node] - visits * self.means[node] * self.means[node]
+                                + 4 * points * points) / (visits + 1)
+
+    # returns the number of bytes allocated for the nodes, without the child dict
+    def memory_usage(self):
+        return sum(getattr(self, name).nbytes for name in VALUE_NODE_ARRAYS)
+
+    # makes sure that the arrays can hold "number_of_nodes" nodes by growing them in chunks
+    def __reserve__(self, number_of_nodes):
+        capacity = len(self.players)
+        if number_of_nodes <= capacity:
+            return
+        capacity += NODE_STORE_CHUNK_SIZE * -(-(number_of_nodes - capacity) // NODE_STORE_CHUNK_SIZE)
+        for name in VALUE_NODE_ARRAYS:
+            old_array = getattr(self, name)
+            new_array = np.zeros(capacity, dtype=old_array.dtype)
+            new_array[:len(old_array)] = old_array
+            setattr(self, name, new_array)
+
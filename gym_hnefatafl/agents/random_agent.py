@@ -13,10 +13,10 @@ class RandomAgent(object):
     # the agent always sends the king to one of the corners if able
     # (this causes white to win basically all the time)
     def make_move(self, env: HnefataflEnv) -> ((int, int), (int, int)):
-        # for pos_from, pos_to in env.action_space:
+        # for pos_from, pos_to in env.get_valid_actions():
         #    if pos_to in self.corners:
         #        return pos_from, pos_to
-        return random.choice(env.action_space)
+        return random.choice(env.get_valid_actions())
 
     # does nothing in this agent, but is here because other agents need it
     def give_reward(self, reward):
@@ -1,149 +1,190 @@
 import cProfile
-import copy
 import math
 import random
+from contextlib import nullcontext
 import numpy as np
-from multiprocessing import Queue, Process
+from multiprocessing import Pool, Lock, resource_tracker
 
 from gym_hnefatafl.agents.evaluation import ANGLE_INTERVALS_3, calculate_angle_intervals
 from gym_hnefatafl.agents.minimax_agent import MinimaxAgent
-from gym_hnefatafl.envs.board import Player, Outcome
+from gym_hnefatafl.agents.node_store import NodeStore, NUMBER_OF_SIMULATIONS
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
+from gym_hnefatafl.envs.board import Player, Outcome, HnefataflBoard
+from gym_hnefatafl.envs.rollout import RolloutPosition, rollout
 
 USE_MINIMAX = False          # whether the algorithm uses the minimax algorithm to finish simulating a game
 PROFILE = False
 PROBABILITY_WORKAROUND = True   # whether the selection process selects moves based on a probability distribution
 #                                   (which ist not correct) or whether it takes the move with the highest value
 #                                   (which is correct according to papers, but probably wrongly implemented here)
-MONTE_CARLO_ITERATIONS = 10
+MONTE_CARLO_ITERATIONS = 10   # simulations per process and move
 EXPLORATION_PARAMETER = math.sqrt(2)
-NUMBER_OF_PROCESSES = 4
+NUMBER_OF_PROCESSES = 4       # size of the worker pool, which is created on the first move and kept for the game
+TREE_PARALLEL = False   # whether the processes share one tree (tree parallelism) instead of searching one tree each
+SHARED_TREE_CAPACITY = 2**18    # nodes of the shared tree, which lives in a block of shared memory of fixed size.
+#                                 Leaves are no longer expanded once it is full
+VIRTUAL_LOSS = 1        # wins a node loses in the selection while a simulation through it is still running
+USE_BITBOARD = False    # whether the trees are searched on a BitboardHnefataflBoard instead of a copy of the env board
 
 
+# A search tree that several processes can simulate at once, each with its own Tree object over one shared NodeStore
+# (see NodeStore.create_shared) and one lock (a multiprocessing.Lock).
+# The nodes are indices into the NodeStore, the root is node 0.
+# Selection, expansion and backpropagation hold the lock, only the rollouts run concurrently.
+# While a simulation runs, the nodes on its path carry a virtual loss so that the other processes choose other paths.
+# Without a lock, the tree belongs to one process and needs none.
+# Unless the rollouts use minimax, simulations are played on copies of a RolloutPosition of the board
 class Tree(object):
-    def __init__(self, board, player):
-        self.root = Node(player)
+    def __init__(self, board, player, nodes=None, lock=None):
+        self.nodes = NodeStore(player) if nodes is None else nodes
+        self.root = 0
         self.board = board
+        self.root_position = None if USE_MINIMAX else RolloutPosition.from_board(board, player)
         self.player = player
         self.white_minimax = MinimaxAgent(Player.white)
         self.black_minimax = MinimaxAgent(Player.black)
-        self.total_simulations = 0
+        self.lock = nullcontext() if lock is None else lock
 
-    def simulate_all(self):
-        for i in range(MONTE_CARLO_ITERATIONS):
+    def simulate_all(self, iterations=MONTE_CARLO_ITERATIONS):
+        for i in range(iterations):
             self.simulate_game()
 
     def simulate_game(self):
-        simulation_board_copy = copy.deepcopy(self.board)
+        simulation_board_copy = self.board.clone(history=False) if USE_MINIMAX else self.root_position.copy()
+        nodes = self.nodes
         current_node = self.root
-        game_history = []
-        self.total_simulations += 1
+        path = [current_node]
 
         # selection and expansion
-        while simulation_board_copy.outcome == Outcome.ongoing:
-            self.player = current_node.player
-            # selection
-            if current_node.children_dict != {}:
-                action = current_node.select(self.total_simulations)
-                current_node = current_node.children_dict[action]
-                game_history.append(action)
-
-            # expansion
-            else:
-                current_node.expand(simulation_board_copy)
-                action = current_node.select(self.total_simulations)
-                game_history.append(action)
-                break
+        with self.lock:
+            nodes.counters[NUMBER_OF_SIMULATIONS] += 1
+            while simulation_board_copy.outcome == Outcome.ongoing:
+                player = Player(nodes.players[current_node])
+                expanded = not nodes.is_expanded(current_node)
+                if expanded:
+                    actions = simulation_board_copy.get_valid_actions(player)
+                    # a full shared tree stops growing, the simulation continues with the rollout from this leaf
+                    if not actions or not nodes.expand(current_node, actions, other_player(player)):
+                        break
+                current_node = self.__select__(current_node)
+                simulation_board_copy.do_action(nodes.action(current_node), player)
+                path.append(current_node)
+                if expanded:
+                    break
+            for node in path:
+                nodes.virtual_losses[node] += VIRTUAL_LOSS
 
         # rollout
-        while simulation_board_copy.outcome == Outcome.ongoing:
-            self.__select_rollout_move__(simulation_board_copy)
-            self.player = other_player(self.player)
+        if USE_MINIMAX:
+            player = Player(nodes.players[current_node])
+            while simulation_board_copy.outcome == Outcome.ongoing:
+                self.__select_rollout_move__(simulation_board_copy, player)
+                player = other_player(player)
+        else:
+            rollout(simulation_board_copy)
 
         # backpropagation
-        current_node = self.root
-        for action in game_history:
-            current_node.update(simulation_board_copy.outcome)
-            current_node = current_node.children_dict[action]
-        current_node.update(simulation_board_copy.outcome)
+        with self.lock:
+            for node in path:
+                nodes.virtual_losses[node] -= VIRTUAL_LOSS
+                nodes.update(node, simulation_board_copy.outcome)
 
-    # makes moves until the game is decided
-    def __select_rollout_move__(self, board):
-        if USE_MINIMAX:
-            if self.player == Player.white:
-                board.do_action(self.white_minimax.make_move(board), self.player)
-            else:
-                board.do_action(self.black_minimax.make_move(board), self.player)
+    # returns the child of "node" that the simulation continues with
+    def __select__(self, node):
+        nodes = self.nodes
+        win_outcome = Outcome.black if nodes.players[node] == Player.black else Outcome.white
+        simulations = int(nodes.visits[node])
+        exploration = EXPLORATION_PARAMETER * math.sqrt(2 * math.log(nodes.number_of_simulations) / (simulations + 1))
+        first_child = int(nodes.first_children[node])
+        children = slice(first_child, first_child + int(nodes.child_counts[node]))
+        wins = nodes.results[children, win_outcome] - nodes.virtual_losses[children]
+        if PROBABILITY_WORKAROUND:
+            probs = np.maximum(wins + 1, 0) / (simulations + 1) + exploration
+            cumulative_probs = np.cumsum(probs)
+            if cumulative_probs[-1] == 0:
+                return first_child + random.randrange(len(probs))
+            # draws a child with probability proportional to probs
+            return first_child + min(int(np.searchsorted(cumulative_probs, random.random() * cumulative_probs[-1],
+                                                         side='right')), len(probs) - 1)
+        else:
+            # the following formula is adapted from  here: https://en.wikipedia.org/w/
+            #                   index.php?title=Monte_Carlo_tree_search&oldid=871362180#Exploration_and_exploitation
+            values = wins / (simulations + 1) + exploration
+            # draws randomly out of all children with the best value
+            return first_child + int(random.choice(np.flatnonzero(values == values.max())))
+
+    # makes the minimax move for "player" in the rollout. A player that can not move loses (like in
+    # HnefataflBoard.get_valid_actions), the minimax agent would have no move to return
+    def __select_rollout_move__(self, board, player):
+        if not board.has_any_move(player):
+            board.outcome = Outcome.white if player == Player.black else Outcome.black
+        elif player == Player.white:
+            board.do_action(self.white_minimax.make_move(board), player)
         else:
-            board.do_action(random.choice(board.get_valid_actions(self.player)), self.player)
+            board.do_action(self.black_minimax.make_move(board), player)
 
     def get_best_action(self):
         most_simulations = 0
         most_simulated_action = []
-        for action in self.root.children_dict:
-            child = self.root.children_dict[action]
-            if child.simulations > most_simulations:
-                most_simulations = child.simulations
-                most_simulated_action = [action]
-            elif child.simulations == most_simulations:
-                most_simulated_action.append(action)
+        for child in self.nodes.children(self.root):
+            simulations = self.nodes.visits[child]
+            if simulations > most_simulations:
+                most_simulations = simulations
+                most_simulated_action = [self.nodes.action(child)]
+            elif simulations == most_simulations:
+                most_simulated_action.append(self.nodes.action(child))
         return random.choice(most_simulated_action)
 
     def get_child_frequencies(self):
-        return [(action, child.simulations) for action, child in self.root.children_dict.items()]
+        return [(self.nodes.action(child), int(self.nodes.visits[child])) for child in self.nodes.children(self.root)]
 
 
-class Node(object):
-    def __init__(self, player):
-        self.player = player
-        self.results = {Outcome.black: 0, Outcome.white: 0, Outcome.draw: 0}
-        self.simulations = 0
-        self.children_dict = {}
+# the lock of the shared trees, set in every process of the worker pool
+__SHARED_TREE_LOCK__ = None
 
-    def win_outcome(self):
-        return Outcome.black if self.player == Player.black else Outcome.white
 
-    def update(self, outcome):
-        self.results[outcome] += 1
-        self.simulations += 1
+# initializes a process of the worker pool. Forked processes inherit the random state of the parent, so every
+# worker needs its own seed or all of them would simulate the same games.
+# A multiprocessing.Lock can only be handed to the workers when they are started, so the pool passes it here
+def __init_simulation_worker__(lock):
+    global __SHARED_TREE_LOCK__
+    __SHARED_TREE_LOCK__ = lock
+    random.seed()
+    np.random.seed()
 
-    def select(self, total_simulations):
-        if PROBABILITY_WORKAROUND:
-            actions = list(self.children_dict.keys())
-            probs = np.array([(self.children_dict[action].results[self.win_outcome()] + 1) / (self.simulations + 1)\
-                        + EXPLORATION_PARAMETER * math.sqrt(2 * math.log(total_simulations) / (self.simulations + 1))
-                     for action in actions])
-            probs /= np.sum(probs)
-
-            actions_array = np.empty(len(actions), dtype=object)
-            actions_array[:] = actions
-            action = np.random.choice(actions_array, p=probs)
-            return action
-        else:
-            best_actions = []   # this is a list so that we can later draw an action
-            #                     randomly out of all actions with the best value
-            best_value = -math.inf
-            for action in self.children_dict.keys():
-                child = self.children_dict[action]
-                # the following formula is adapted from  here: https://en.wikipedia.org/w/
-                #                   index.php?title=Monte_Carlo_tree_search&oldid=871362180#Exploration_and_exploitation
-                value = (child.results[self.win_outcome()]) / (self.simulations + 1)\
-                        + EXPLORATION_PARAMETER * math.sqrt(2 * math.log(total_simulations) / (self.simulations + 1))
-                if value > best_value:
-                    best_value = value
-                    best_actions = [action]
-                elif value == best_value:
-                    best_actions.append(action)
-            return random.choice(best_actions)
-
-    def expand(self, board):
-        for action in board.get_valid_actions(self.player):
-            child = Node(other_player(self.player))
-            self.children_dict[action] = child
+
+# builds a tree for the encoded position (see HnefataflBoard.get_position), simulates "iterations" games
+# and returns the simulation counts of the root children
+def __simulate_position__(arguments):
+    position, player, iterations = arguments
+    board = BitboardHnefataflBoard.from_position(position) if USE_BITBOARD else HnefataflBoard.from_position(position)
+    tree = Tree(board, player)
+    tree.simulate_all(iterations)
+    return tree.get_child_frequencies()
+
+
+# simulates "iterations" games on the tree in the shared memory block "name" (see NodeStore.create_shared)
+# for the encoded position
+def __simulate_shared_tree__(arguments):
+    position, player, name, capacity, iterations = arguments
+    board = BitboardHnefataflBoard.from_position(position) if USE_BITBOARD else HnefataflBoard.from_position(position)
+    nodes = NodeStore.attach(name, capacity)
+    try:
+        Tree(board, player, nodes, __SHARED_TREE_LOCK__).simulate_all(iterations)
+    finally:
+        nodes.close()
 
 
 class TextbookMonteCarloAgent(object):
-    def __init__(self, player):
+    def __init__(self, player, number_of_processes=NUMBER_OF_PROCESSES, iterations_per_process=MONTE_CARLO_ITERATIONS,
+                 tree_parallel=TREE_PARALLEL, shared_tree_capacity=SHARED_TREE_CAPACITY):
         self.player = player
+        self.number_of_processes = number_of_processes
+        self.iterations_per_process = iterations_per_process
+        self.tree_parallel = tree_parallel
+        self.shared_tree_capacity = shared_tree_capacity
+        self.lock = None
+        self.pool = None
         if not ANGLE_INTERVALS_3:
             calculate_angle_intervals()
 
@@ -155,24 +196,28 @@ class TextbookMonteCarloAgent(object):
         if PROFILE:
             prof = cProfile.Profile()
             prof.enable()
-        processes = []
-        queue = Queue()
-        for i in range(NUMBER_OF_PROCESSES):
-            p = Process(target=self.simulate_parallel, args=(queue, env.get_board(),))
-            processes.append(p)
-            p.start()
-        iterations = 0
+        if self.tree_parallel:
+            action = self.tree_parallel_search(env.get_board())
+        else:
+            action = self.root_parallel_search(env.get_board())
+
+        if PROFILE:
+            prof.disable()
+            prof.print_stats(sort=2)
+
+        return action
+
+    # every process of the pool simulates its own tree, the root children simulation counts are added up
+    def root_parallel_search(self, board):
+        self.__start_pool__()
+        task = (board.get_position(), self.player, self.iterations_per_process)
         action_frequency_dict = {}
-        while iterations < NUMBER_OF_PROCESSES:
-            list = queue.get()
-            iterations += 1
-            for action, frequency in list:
+        for frequencies in self.pool.map(__simulate_position__, [task] * self.number_of_processes, chunksize=1):
+            for action, frequency in frequencies:
                 if action in action_frequency_dict:
                     action_frequency_dict[action] += frequency
                 else:
                     action_frequency_dict[action] = frequency
-        for p in processes:
-            p.join()
         most_simulations = 0
         most_simulated_action = []
         for action, frequency in action_frequency_dict.items():
@@ -181,23 +226,42 @@ class TextbookMonteCarloAgent(object):
                 most_simulated_action = [action]
             elif frequency == most_simulations:
                 most_simulated_action.append(action)
-
-        if PROFILE:
-            prof.disable()
-            prof.print_stats(sort=2)
-
         return random.choice(most_simulated_action)
 
-    def simulate_parallel(self, queue, board):
-        tree = Tree(board, self.player)
-        tree.simulate_all()
-        queue.put(tree.get_child_frequencies())
+    # the processes of the pool simulate the same number of games as in root_parallel_search, but all of them on one
+    # tree in shared memory
+    def tree_parallel_search(self, board):
+        self.__start_pool__()
+        nodes = NodeStore.create_shared(self.player, self.shared_tree_capacity)
+        try:
+            task = (board.get_position(), self.player, nodes.name, self.shared_tree_capacity,
+                    self.iterations_per_process)
+            self.pool.map(__simulate_shared_tree__, [task] * self.number_of_processes, chunksize=1)
+            return Tree(board, self.player, nodes).get_best_action()
+        finally:
+            nodes.unlink()
+
+    # creates the worker pool on the first search
+    def __start_pool__(self):
+        if self.pool is None:
+            # the workers have to share the resource tracker of this process. Otherwise each of them starts its own
+            # when it opens a shared tree, and that tracker frees the tree when the worker ends
+            resource_tracker.ensure_running()
+            self.lock = Lock()
+            self.pool = Pool(self.number_of_processes, __init_simulation_worker__, (self.lock,))
 
     # does nothing in this agent, but is here because other agents need it
     def give_reward(self, reward):
         pass
 
+    # stops the worker processes
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
 
 # returns the opponent of the given player
 def other_player(player):
-    return Player.white if player == Player.black else Player.white
+    return Player.white if player == Player.black else Player.black
@@ -0,0 +1,115 @@
+from enum import IntEnum
+
+import numpy as np
+
+TRANSPOSITION_TABLE_SIZE_MB = 16
+
+
+# describes how the stored score relates to the real minimax value of a position
+class Bound(IntEnum):
+    exact = 0
+    lower = 1   # the search failed high, the real value is at least the score
+    upper = 2   # the search failed low, the real value is at most the score
+
+
+# packs a move ((fromX, fromY), (toX, toY)) into a single int (-1 for no move)
+def encode_move(move):
+    if move is None:
+        return -1
+    (from_x, from_y), (to_x, to_y) = move
+    return ((from_x * 16 + from_y) * 16 + to_x) * 16 + to_y
+
+
+# reverts encode_move
+def decode_move(code):
+    if code < 0:
+        return None
+    code, to_y = divmod(code, 16)
+    code, to_x = divmod(code, 16)
+    from_x, from_y = divmod(code, 16)
+    return (from_x, from_y), (to_x, to_y)
+
+
+# A fixed-size hash table of search results keyed by the Zobrist key of a position.
+# Each bucket has two entries: the first one keeps the deepest result (depth-preferred) and is only replaced by
+# deeper or equally deep results or results of a newer search, the second one is always replaced.
+# The table is meant to be kept between moves of a game: call new_search() before every search so that
+# entries of older searches are replaced first.
+# All arrays start out as zeros (depths are stored plus one, so 0 marks an empty entry), which means that
+# memory is only committed for the parts of the table that are actually used.
+class TranspositionTable(object):
+    # number of bytes of one entry (key, score, move, depth, bound, generation)
+    ENTRY_SIZE = 8 + 8 + 4 + 1 + 1 + 1
+
+    def __init__(self, size_mb=TRANSPOSITION_TABLE_SIZE_MB):
+        self.number_of_buckets = max(1, int(size_mb * 2**20) // (2 * self.ENTRY_SIZE))
+        number_of_entries = 2 * self.number_of_buckets
+        self.keys = np.zeros(number_of_entries, dtype=np.uint64)
+        self.scores = np.zeros(number_of_entries, dtype=np.float64)
+        self.moves = np.zeros(number_of_entries, dtype=np.int32)
+        self.depths = np.zeros(number_of_entries, dtype=np.int8)
+        self.bounds = np.zeros(number_of_entries, dtype=np.int8)
+        self.generations = np.zeros(number_of_entries, dtype=np.uint8)
+        self.generation = 0
+
+        # statistics
+        self.hits = 0           # probes that found the position
+        self.misses = 0         # probes that did not find the position
+        self.collisions = 0     # misses where the bucket was filled with other positions
+
+    # marks the start of a new search. Entries of older searches are preferred for replacement
+    def new_search(self):
+        self.generation = (self.generation + 1) % 256
+
+    # removes all entries and resets the statistics
+    def clear(self):
+        self.keys[:] = 0
+        self.moves[:] = 0
+        self.depths[:] = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    # returns (depth, score, bound, move) of the position with the given key or None if it is not stored
+    def probe(self, key):
+        index = 2 * (key % self.number_of_buckets)
+        for entry in (index, index + 1):
+            if self.depths[entry] and int(self.keys[entry]) == key:
+                self.hits += 1
+                return int(self.depths[entry]) - 1, float(self.scores[entry]), Bound(self.bounds[entry]), \
+                    decode_move(int(self.moves[entry]) - 1)
+        self.misses += 1
+        if self.depths[index] and self.depths[index + 1]:
+            self.collisions += 1
+        return None
+
+    # stores the result of searching the position with the given key "depth" plies deep
+    def store(self, key, depth, score, bound, move):
+        index = 2 * (key % self.number_of_buckets)
+        if not self.depths[index] or int(self.keys[index]) == key or depth + 1 >= self.depths[index] \
+                or self.generations[index] != self.generation:
+            # the old depth-preferred entry moves to the always-replace slot if it belongs to another position
+            if self.depths[index] and int(self.keys[index]) != key:
+                self.__copy_entry__(index, index + 1)
+        else:
+            index += 1
+        self.keys[index] = key
+        self.depths[index] = depth + 1
+        self.scores[index] = score
+        self.bounds[index] = bound
+        self.moves[index] = encode_move(move) + 1
+        self.generations[index] = self.generation
+
+    def __copy_entry__(self, source, target):
+        self.keys[target] = self.keys[source]
+        self.depths[target] = self.depths[source]
+        self.scores[target] = self.scores[source]
+        self.bounds[target] = self.bounds[source]
+        self.moves[target] = self.moves[source]
+        self.generations[target] = self.generations[source]
+
+    # returns the number of bytes allocated for the entries
+    def memory_usage(self):
+        return self.keys.nbytes + self.scores.nbytes + self.moves.nbytes + self.depths.nbytes + self.bounds.nbytes \
+            + self.generations.nbytes
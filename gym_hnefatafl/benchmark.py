@@ -0,0 +1,80 @@
+import random
+import time
+
+from gym_hnefatafl.agents import textbook_monte_carlo_agent
+from gym_hnefatafl.agents.textbook_monte_carlo_agent import TextbookMonteCarloAgent
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
+from gym_hnefatafl.envs.board import HnefataflBoard, Player, Outcome
+
+
+# returns the other player
+def other_player(this_player):
+    return Player.black if this_player == Player.white else Player.white
+
+
+# counts the leaf nodes of the full game tree of the given depth (move generation and make/unmake only)
+def perft(board, turn_player, depth):
+    if depth == 0 or board.outcome != Outcome.ongoing:
+        return 1
+    nodes = 0
+    for action in board.get_valid_actions(turn_player):
+        board.do_action(action, turn_player)
+        nodes += perft(board, other_player(turn_player), depth - 1)
+        board.undo_last_action()
+    return nodes
+
+
+# plays "number_of_random_turns" random turns on a fresh board of the given size and returns it
+def random_position(board, number_of_random_turns, seed=0):
+    rng = random.Random(seed)
+    turn_player = Player.black
+    for _ in range(number_of_random_turns):
+        actions = board.get_valid_actions(turn_player)
+        if board.outcome != Outcome.ongoing:
+            break
+        board.do_action(rng.choice(actions), turn_player)
+        turn_player = other_player(turn_player)
+    return board, turn_player
+
+
+# returns the number of perft nodes per second for a board engine
+def nodes_per_second(board_class, size, depth, number_of_random_turns=10):
+    board = board_class(size)
+    if hasattr(board, "print_to_console"):
+        board.print_to_console = False
+    board, turn_player = random_position(board, number_of_random_turns)
+    start = time.perf_counter()
+    nodes = perft(board, turn_player, depth)
+    return nodes / (time.perf_counter() - start)
+
+
+# returns the number of simulated games per second of TextbookMonteCarloAgent with "number_of_workers" processes
+# that simulate their own trees (root parallelism) or one tree in shared memory (tree parallelism)
+def playouts_per_second(tree_parallel, number_of_workers, iterations_per_worker, size=11, number_of_random_turns=10):
+    board = HnefataflBoard(size)
+    board.print_to_console = False
+    board, turn_player = random_position(board, number_of_random_turns)
+    agent = TextbookMonteCarloAgent(turn_player, number_of_workers, iterations_per_worker, tree_parallel)
+    search = agent.tree_parallel_search if tree_parallel else agent.root_parallel_search
+    search(board)   # starts the worker pool
+    start = time.perf_counter()
+    search(board)
+    playouts = number_of_workers * iterations_per_worker / (time.perf_counter() - start)
+    agent.close()
+    return playouts
+
+
+if __name__ == "__main__":
+    for size in (7, 9, 11):
+        numpy_nodes = nodes_per_second(HnefataflBoard, size, 2)
+        bitboard_nodes = nodes_per_second(BitboardHnefataflBoard, size, 2)
+        print("%dx%d: HnefataflBoard %.0f nodes/s, BitboardHnefataflBoard %.0f nodes/s (x%.1f)"
+              % (size, size, numpy_nodes, bitboard_nodes, bitboard_nodes / numpy_nodes))
+
+    # the simulations run on bitboards, otherwise the numpy board makes both variants too slow to compare
+    textbook_monte_carlo_agent.USE_BITBOARD = True
+    for workers in (1, 2, 4):
+        root_playouts = playouts_per_second(False, workers, 25)
+        tree_playouts = playouts_per_second(True, workers, 25)
+        print("%d workers: root parallel %.1f playouts/s, tree parallel %.1f playouts/s"
+              % (workers, root_playouts, tree_playouts))
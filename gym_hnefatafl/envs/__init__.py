@@ -1 +1,2 @@
-from gym_hnefatafl.envs.hnefatafl_env import HnefataflEnv
\ No newline at end of file
+from gym_hnefatafl.envs.hnefatafl_env import HnefataflEnv
+from gym_hnefatafl.envs.vector_env import VectorHnefataflEnv
@@ -0,0 +1,82 @@
+import numpy as np
+
+from gym_hnefatafl.envs.board import Player, TileState
+
+# the four move directions in the order x - 1, x + 1, y - 1, y + 1 (like BitboardGeometry.directions)
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+# Numbers all moves ((from_x, from_y), (to_x, to_y)) of a board size for a fixed discrete action space:
+#   index = (((from_x - 1) * size + from_y - 1) * 4 + direction) * (size - 1) + distance - 1
+# with the direction of the move in DIRECTIONS, i.e. the index of the move in a boolean array of
+# shape (size, size, 4, size - 1). Indices of moves that leave the board exist but are never legal.
+# The lookup tables in both directions are built once per size, so encoding and decoding allocate nothing
+class ActionEncoding(object):
+
+    def __init__(self, size):
+        self.size = size
+        self.width = size + 2
+        self.shape = (size, size, len(DIRECTIONS), size - 1)
+        self.number_of_actions = int(np.prod(self.shape))
+
+        # index -> move as row (from_x, from_y, to_x, to_y) and as tuple
+        self.moves = np.zeros((self.number_of_actions, 4), dtype=np.int32)
+        self.actions = [None] * self.number_of_actions
+        # whether the destination of the move is on the board
+        self.on_board = np.zeros(self.number_of_actions, dtype=bool)
+        # move -> index (-1 for moves that are not encoded), indexed by from_x, from_y, to_x, to_y
+        self.indices = np.full((self.width,) * 4, -1, dtype=np.int32)
+        # path_indices[x - 1, y - 1, direction, distance - 1] is the flat index x * width + y of the tile "distance"
+        # tiles away from (x, y) in "direction". Tiles outside of the grid are mapped to tile 0, a border tile
+        self.path_indices = np.zeros(self.shape, dtype=np.intp)
+
+        for index, (x, y, direction, distance) in enumerate(np.ndindex(*self.shape)):
+            from_x, from_y = x + 1, y + 1
+            to_x = from_x + DIRECTIONS[direction][0] * (distance + 1)
+            to_y = from_y + DIRECTIONS[direction][1] * (distance + 1)
+            self.moves[index] = from_x, from_y, to_x, to_y
+            self.actions[index] = ((from_x, from_y), (to_x, to_y))
+            if 1 <= to_x <= size and 1 <= to_y <= size:
+                self.on_board[index] = True
+                self.indices[from_x, from_y, to_x, to_y] = index
+            if 0 <= to_x < self.width and 0 <= to_y < self.width:
+                self.path_indices[x, y, direction, distance] = to_x * self.width + to_y
+
+    # returns the index of the action ((from_x, from_y), (to_x, to_y)) or -1 if it is no straight move on the board
+    def encode(self, action):
+        (from_x, from_y), (to_x, to_y) = action
+        return int(self.indices[from_x, from_y, to_x, to_y])
+
+    # returns the action ((from_x, from_y), (to_x, to_y)) of an index
+    def decode(self, index):
+        return self.actions[index]
+
+    # returns the legal moves of the boards, a stack of TileState grids, for the players "turn_players" as boolean
+    # array of shape (number of boards,) + self.shape
+    def legal_move_masks(self, boards, turn_players):
+        tiles = boards.reshape(len(boards), -1)[:, self.path_indices]
+        interior = boards[:, 1:-1, 1:-1]
+        own = np.where((np.asarray(turn_players) == Player.white)[:, None, None],
+                       (interior == TileState.white) | (interior == TileState.king), interior == TileState.black)
+        is_king = (interior == TileState.king)[..., None, None]
+        # any piece can pass the empty throne, only the king can enter a corner
+        passable = (tiles == TileState.empty) | (tiles == TileState.throne) | ((tiles == TileState.corner) & is_king)
+        reachable = np.logical_and.accumulate(passable, axis=-1)
+        # soldiers can not stop on the throne
+        reachable &= (tiles != TileState.throne) | is_king
+        return reachable & own[..., None, None]
+
+    # returns the boolean vector of the actions "turn_player" can do on "board"
+    # (a HnefataflBoard or BitboardHnefataflBoard)
+    def legal_action_mask(self, board, turn_player):
+        return self.legal_move_masks(np.asarray(board.board)[None], [turn_player])[0].ravel()
+
+
+__ACTION_ENCODINGS__ = {}
+
+
+# returns the (cached) action encoding of a board size
+def action_encoding(size):
+    if size not in __ACTION_ENCODINGS__:
+        __ACTION_ENCODINGS__[size] = ActionEncoding(size)
+    return __ACTION_ENCODINGS__[size]
@@ -0,0 +1,509 @@
+import numpy as np
+
+from gym_hnefatafl.envs.board import HnefataflBoard, Outcome, Player, TileMoveState, TileState, zobrist_keys
+from gym_hnefatafl.envs.rule_config import MAX_NUMBER_OF_TURNS, MAX_NUMBER_OF_TURNS_WITHOUT_CAPTURE
+
+
+# Precomputed masks and rays for one board size.
+# Bit i of a bitboard stands for the tile (i // width, i % width) of the padded (size + 2) x (size + 2) grid,
+# so moving one tile along x is a shift by width and moving one tile along y is a shift by 1.
+class BitboardGeometry:
+
+    def __init__(self, size):
+        self.size = size
+        self.width = size + 2
+        self.coordinates = [divmod(i, self.width) for i in range(self.width * self.width)]
+
+        self.border = 0
+        for x, y in self.coordinates:
+            if x == 0 or y == 0 or x == size + 1 or y == size + 1:
+                self.border |= self.bit((x, y))
+        self.corners = self.bit((1, 1)) | self.bit((1, size)) | self.bit((size, 1)) | self.bit((size, size))
+        self.throne_position = ((size + 1) // 2, (size + 1) // 2)
+        self.throne = self.bit(self.throne_position)
+
+        # offsets of the four directions in the order x - 1, x + 1, y - 1, y + 1
+        self.directions = (-self.width, self.width, -1, 1)
+
+        # the tiles next to every interior tile
+        self.neighbors = [0] * (self.width * self.width)
+        # for every interior tile and direction: all tiles up to and including the border in that direction
+        self.positive_rays = [(0, 0)] * (self.width * self.width)
+        self.negative_rays = [(0, 0)] * (self.width * self.width)
+        for index, (x, y) in enumerate(self.coordinates):
+            if self.border >> index & 1:
+                continue
+            rays = []
+            for direction in self.directions:
+                ray = 0
+                other = index + direction
+                while True:
+                    ray |= 1 << other
+                    if self.border >> other & 1:
+                        break
+                    other += direction
+                rays.append(ray)
+                self.neighbors[index] |= 1 << (index + direction)
+            self.negative_rays[index] = (rays[0], rays[2])
+            self.positive_rays[index] = (rays[1], rays[3])
+
+        # the empty board with borders, corners and throne, used when converting bitboards back into a grid
+        self.empty_grid = np.zeros((self.width, self.width), dtype=np.int32)
+        self.empty_grid[0, :] = TileState.border
+        self.empty_grid[size + 1, :] = TileState.border
+        self.empty_grid[:, 0] = TileState.border
+        self.empty_grid[:, size + 1] = TileState.border
+        for corner in ((1, 1), (1, size), (size, 1), (size, size)):
+            self.empty_grid[corner] = TileState.corner
+        self.empty_grid[self.throne_position] = TileState.throne
+
+    # returns the bit of the given (x, y) tile
+    def bit(self, position):
+        return 1 << (position[0] * self.width + position[1])
+
+    # returns the index of the given (x, y) tile
+    def index(self, position):
+        return position[0] * self.width + position[1]
+
+    # returns the positions of all set bits of a bitboard
+    def positions(self, bitboard):
+        positions = []
+        while bitboard:
+            lowest_bit = bitboard & -bitboard
+            positions.append(self.coordinates[lowest_bit.bit_length() - 1])
+            bitboard ^= lowest_bit
+        return positions
+
+
+__GEOMETRIES__ = {}
+
+
+# returns the (cached) geometry of a board size
+def geometry(size):
+    if size not in __GEOMETRIES__:
+        __GEOMETRIES__[size] = BitboardGeometry(size)
+    return __GEOMETRIES__[size]
+
+
+# returns the number of set bits
+def popcount(bitboard):
+    return bin(bitboard).count("1")
+
+
+# A board engine with the same interface as HnefataflBoard that stores the position as integer bitboards:
+# one for the white soldiers, one for the black soldiers and one for the king. Borders, corners and the throne
+# are constant masks of the BitboardGeometry. Move generation, captures and the king capture check are done
+# with bit operations, which makes do_action/undo_last_action a lot cheaper than updating numpy grids.
+# It is meant for searching the game tree, so it never prints anything to the console.
+class BitboardHnefataflBoard:
+
+    def __init__(self, size):
+        self.size = size
+        self.geometry = geometry(size)
+
+        self.white = 0
+        self.black = 0
+        self.king = 0
+        self.king_position = self.geometry.throne_position
+
+        # Zobrist key of the current position including the side to move (same keys as HnefataflBoard)
+        self.zobrist = zobrist_keys(size)
+        self.zobrist_key = 0
+
+        # holds the Zobrist keys of all board states and the frequency how often they occurred
+        self.board_states_dict = {}
+
+        # the outcome of the current match
+        self.outcome = Outcome.ongoing
+
+        # number of pieces of a color. white pieces includes the king
+        self.white_pieces = 0
+        self.black_pieces = 0
+
+        # turn counts for draw condition
+        self.turn_count = 0
+        self.turns_without_capture_count = 0
+
+        # for reverting actions
+        # entries are (from index, to index, captured soldiers, number of captured pieces,
+        #              turns without capture before the action, Zobrist key before the action)
+        self.action_stack = []
+
+        # see HnefataflBoard.evaluator
+        self.evaluator = None
+
+        # tile state grid that was built last by the board property and the position it was built for
+        self.__grid__ = None
+        self.__grid_position__ = None
+
+        self.reset_board()
+
+    # creates a bitboard engine from the position of a HnefataflBoard (including its repetition history)
+    @classmethod
+    def from_board(cls, board):
+        bitboard = cls.__new__(cls)
+        bitboard.size = board.size
+        bitboard.geometry = geometry(board.size)
+        bitboard.white, bitboard.black, bitboard.king = bitboard.__bitboards_from_grid__(board.board)
+        bitboard.king_position = tuple(int(i) for i in board.king_position)
+        bitboard.zobrist = board.zobrist
+        bitboard.zobrist_key = board.zobrist_key
+        bitboard.board_states_dict = dict(board.board_states_dict)
+        bitboard.outcome = board.outcome
+        bitboard.white_pieces = board.white_pieces
+        bitboard.black_pieces = board.black_pieces
+        bitboard.turn_count = board.turn_count
+        bitboard.turns_without_capture_count = board.turns_without_capture_count
+        bitboard.action_stack = []
+        bitboard.evaluator = None
+        bitboard.__grid__ = None
+        bitboard.__grid_position__ = None
+        return bitboard
+
+    # returns a copy of the board (see HnefataflBoard.clone)
+    def clone(self, history=True):
+        board = type(self).__new__(type(self))
+        board.__dict__.update(self.__dict__)
+        board.evaluator = None
+        board.board_states_dict = self.board_states_dict.copy()
+        board.action_stack = list(self.action_stack) if history else []
+        return board
+
+    # creates a bitboard engine from an encoding returned by get_position
+    @classmethod
+    def from_position(cls, position):
+        return cls.from_board(HnefataflBoard.from_position(position))
+
+    # returns a compact, picklable encoding of the current position (see HnefataflBoard.get_position)
+    def get_position(self):
+        return (self.size, self.board.astype(np.int8).tobytes(), self.king_position, self.white_pieces,
+                self.black_pieces, self.turn_count, self.turns_without_capture_count, int(self.outcome),
+                self.zobrist_key, self.board_states_dict)
+
+    def reset_board(self):
+        start = HnefataflBoard(self.size)
+        self.white, self.black, self.king = self.__bitboards_from_grid__(start.board)
+        self.king_position = self.geometry.throne_position
+        self.white_pieces = start.white_pieces
+        self.black_pieces = start.black_pieces
+        self.zobrist_key = start.zobrist_key
+        self.board_states_dict = {self.zobrist_key: 1}
+        self.outcome = Outcome.ongoing
+        self.turn_count = 0
+        self.turns_without_capture_count = 0
+        self.action_stack = []
+
+    # returns the (white, black, king) bitboards of a tile state grid
+    def __bitboards_from_grid__(self, grid):
+        flat_grid = np.asarray(grid).ravel()
+        bitboards = []
+        for tile_state in (TileState.white, TileState.black, TileState.king):
+            bitboard = 0
+            for index in np.flatnonzero(flat_grid == tile_state):
+                bitboard |= 1 << int(index)
+            bitboards.append(bitboard)
+        return tuple(bitboards)
+
+    # the tile state grid of the current position (see HnefataflBoard.board).
+    # It is rebuilt only if the position has changed since the last call.
+    @property
+    def board(self):
+        position = (self.white, self.black, self.king)
+        if self.__grid_position__ != position:
+            grid = self.geometry.empty_grid.copy()
+            for tile_state, bitboard in zip((TileState.white, TileState.black, TileState.king), position):
+                for tile in self.geometry.positions(bitboard):
+                    grid[tile] = tile_state
+            self.__grid__ = grid
+            self.__grid_position__ = position
+            # the other grids are derived from the new one when they are first read
+            self.__move_grid__ = None
+            self.__player_grid__ = None
+        return self.__grid__
+
+    # the TileMoveState grid of the current position (see HnefataflBoard.move_board), cached like board
+    @property
+    def move_board(self):
+        board = self.board
+        if self.__move_grid__ is None:
+            self.__move_grid__ = ((board == TileState.border) | (board == TileState.white)
+                                  | (board == TileState.black) | (board == TileState.king)).astype(np.int32) \
+                * TileMoveState.blocking
+        return self.__move_grid__
+
+    # the Player grid of the current position (see HnefataflBoard.player_board), cached like board
+    @property
+    def player_board(self):
+        board = self.board
+        if self.__player_grid__ is None:
+            player_board = np.zeros(board.shape, dtype=np.int32)
+            player_board[board == TileState.black] = Player.black
+            player_board[(board == TileState.white) | (board == TileState.king)] = Player.white
+            self.__player_grid__ = player_board
+        return self.__player_grid__
+
+    # the positions of the pieces of each player (see HnefataflBoard.piece_positions)
+    @property
+    def piece_positions(self):
+        return {Player.white: self.geometry.positions(self.white | self.king),
+                Player.black: self.geometry.positions(self.black)}
+
+    # returns the bitboard of all pieces of a player
+    def pieces(self, player):
+        return self.white | self.king if player == Player.white else self.black
+
+    # returns the bitboard of all tiles the piece on the tile with the given index can move to
+    def __destinations__(self, index, is_king):
+        geometry = self.geometry
+        blocking = self.white | self.black | self.king | geometry.border
+        if not is_king:
+            blocking |= geometry.corners
+        destinations = 0
+        # rays that go to higher indices end before their lowest blocking tile
+        for ray in geometry.positive_rays[index]:
+            blocked = ray & blocking
+            destinations |= ray & ((blocked & -blocked) - 1)
+        # rays that go to lower indices end after their highest blocking tile
+        for ray in geometry.negative_rays[index]:
+            blocked = ray & blocking
+            destinations |= ray & -(1 << blocked.bit_length())
+        if not is_king:
+            destinations &= ~geometry.throne
+        return destinations
+
+    #  Checks whether "player" can do action "move".
+    #  move = ((fromX,fromY),(toX,toY))
+    def can_do_action(self, move, player):
+        position_from, position_to = move
+        from_bit = self.geometry.bit(position_from)
+        if not self.pieces(player) & from_bit:
+            return False
+        return bool(self.__destinations__(self.geometry.index(position_from), from_bit == self.king)
+                    & self.geometry.bit(position_to))
+
+    # returns all valid actions for a player as a list of actions
+    def get_valid_actions(self, turn_player):
+        coordinates = self.geometry.coordinates
+        valid_actions = []
+        pieces = self.pieces(turn_player)
+        while pieces:
+            piece = pieces & -pieces
+            pieces ^= piece
+            index = piece.bit_length() - 1
+            position = coordinates[index]
+            destinations = self.__destinations__(index, piece == self.king)
+            while destinations:
+                destination = destinations & -destinations
+                destinations ^= destination
+                valid_actions.append((position, coordinates[destination.bit_length() - 1]))
+        if len(valid_actions) == 0:
+            self.outcome = Outcome.white if turn_player == Player.black else Outcome.black
+        return valid_actions
+
+    # returns all valid actions for a piece at a given position as a list of actions
+    def get_valid_actions_for_piece(self, position):
+        index = self.geometry.index(position)
+        destinations = self.__destinations__(index, self.geometry.bit(position) == self.king)
+        return [(position, destination) for destination in self.geometry.positions(destinations)]
+
+    # returns whether "player" has any valid action, without building the list of actions
+    # (unlike get_valid_actions, it does not end the game if there is none)
+    def has_any_move(self, player):
+        pieces = self.pieces(player)
+        while pieces:
+            piece = pieces & -pieces
+            pieces ^= piece
+            if self.__destinations__(piece.bit_length() - 1, piece == self.king):
+                return True
+        return False
+
+    # returns the number of valid actions of "player" without building the list of actions
+    def count_moves(self, player):
+        number_of_moves = 0
+        pieces = self.pieces(player)
+        while pieces:
+            piece = pieces & -pieces
+            pieces ^= piece
+            number_of_moves += popcount(self.__destinations__(piece.bit_length() - 1, piece == self.king))
+        return number_of_moves
+
+    # returns the number of valid actions of the piece at "position" without building the list of actions
+    def count_moves_for_piece(self, position):
+        return popcount(self.__destinations__(self.geometry.index(position), self.geometry.bit(position) == self.king))
+
+    # executes "move" for the player "player" whose turn it is
+    # except when the game is already over. In this case it does nothing
+    def do_action(self, move, player):
+        # return immediately if game over
+        if self.outcome != Outcome.ongoing:
+            return
+
+        if not self.can_do_action(move, player):
+            raise Exception(str(player) + " tried to make move " + str(move) + ", but that move is not possible.")
+
+        geometry = self.geometry
+        position_from, position_to = move
+        from_index = geometry.index(position_from)
+        to_index = geometry.index(position_to)
+        from_bit = 1 << from_index
+        to_bit = 1 << to_index
+
+        # increase turn counts
+        self.turn_count += 1
+        turns_without_capture_count = self.turns_without_capture_count
+        self.turns_without_capture_count += 1
+
+        zobrist_key = self.zobrist_key
+
+        # move the piece and check if the king reached a corner
+        if from_bit == self.king:
+            self.king = to_bit
+            self.king_position = position_to
+            if to_bit & geometry.corners:
+                self.outcome = Outcome.white
+            tile_state = TileState.king
+        elif player == Player.white:
+            self.white ^= from_bit | to_bit
+            tile_state = TileState.white
+        else:
+            self.black ^= from_bit | to_bit
+            tile_state = TileState.black
+        keys = self.zobrist.pieces[tile_state]
+        self.zobrist_key ^= keys[from_index] ^ keys[to_index] ^ self.zobrist.white_to_move
+
+        captured, captured_pieces = self.capture(to_index, player)
+        self.action_stack.append((from_index, to_index, captured, len(captured_pieces), turns_without_capture_count,
+                                  zobrist_key))
+        if self.evaluator is not None:
+            self.evaluator.action_done(self, move, captured_pieces)
+
+        # update the board_states_dictionary so that we know whether the present board has occurred for the 3rd time
+        frequency = self.board_states_dict.get(self.zobrist_key, 0) + 1
+        self.board_states_dict[self.zobrist_key] = frequency
+        if frequency == 3:
+            self.outcome = Outcome.draw
+
+        # check if draw conditions by turn count are met
+        if self.turn_count == MAX_NUMBER_OF_TURNS and self.outcome == Outcome.ongoing:
+            self.outcome = Outcome.draw
+        if self.turns_without_capture_count == MAX_NUMBER_OF_TURNS_WITHOUT_CAPTURE \
+                and self.outcome == Outcome.ongoing:
+            self.outcome = Outcome.draw
+
+        return captured_pieces
+
+    # captures all enemy pieces around the tile "to_index" that the player "player" has just moved a piece to.
+    # Returns the bitboard of the captured soldiers and the list of captured positions (including the king)
+    def capture(self, to_index, turn_player):
+        geometry = self.geometry
+        empty_throne = geometry.throne & ~self.king
+        if turn_player == Player.white:
+            opponent_soldiers = self.black
+            opponent_keys = self.zobrist.pieces[TileState.black]
+            hostile = self.white | self.king | geometry.corners | empty_throne
+        else:
+            opponent_soldiers = self.white
+            opponent_keys = self.zobrist.pieces[TileState.white]
+            hostile = self.black | geometry.corners | empty_throne
+
+        captured = 0
+        if geometry.neighbors[to_index] & opponent_soldiers:
+            for direction in geometry.directions:
+                neighbor = to_index + direction
+                if opponent_soldiers >> neighbor & 1 and hostile >> (neighbor + direction) & 1:
+                    captured |= 1 << neighbor
+                    self.zobrist_key ^= opponent_keys[neighbor]
+        if captured:
+            if turn_player == Player.white:
+                self.black ^= captured
+            else:
+                self.white ^= captured
+        captured_pieces = geometry.positions(captured)
+
+        # check capture king
+        if not geometry.neighbors[geometry.index(self.king_position)] & ~(self.black | empty_throne):
+            self.outcome = Outcome.black
+            captured_pieces.append(self.king_position)
+
+        if len(captured_pieces) > 0:
+            self.turns_without_capture_count = 0
+
+        if turn_player == Player.white:
+            self.black_pieces -= len(captured_pieces)
+        else:
+            self.white_pieces -= len(captured_pieces)
+
+        return captured, captured_pieces
+
+    # returns the number of pieces (including the king) that "player" would capture with "move",
+    # i.e. len(do_action(move, player)), without executing the move
+    def count_captures(self, move, player):
+        geometry = self.geometry
+        from_index = geometry.index(move[0])
+        to_index = geometry.index(move[1])
+        from_bit = 1 << from_index
+        to_bit = 1 << to_index
+        king_moves = from_bit == self.king
+        king = to_bit if king_moves else self.king
+        empty_throne = geometry.throne & ~king
+        if player == Player.white:
+            opponent_soldiers = self.black
+            hostile = ((self.white | self.king) & ~from_bit) | to_bit | geometry.corners | empty_throne
+        else:
+            opponent_soldiers = self.white
+            hostile = (self.black & ~from_bit) | to_bit | geometry.corners | empty_throne
+
+        captured = 0
+        if geometry.neighbors[to_index] & opponent_soldiers:
+            for direction in geometry.directions:
+                neighbor = to_index + direction
+                if opponent_soldiers >> neighbor & 1 and hostile >> (neighbor + direction) & 1:
+                    captured |= 1 << neighbor
+        captures = popcount(captured)
+
+        # the king is captured if all of its neighbors are black or the empty throne
+        black = self.black ^ (from_bit | to_bit) if player == Player.black else self.black & ~captured
+        if not geometry.neighbors[king.bit_length() - 1] & ~(black | empty_throne):
+            captures += 1
+        return captures
+
+    # reverts the last action and returns the board state to the state before
+    def undo_last_action(self):
+        if len(self.action_stack) > 0:
+            if self.board_states_dict[self.zobrist_key] == 1:
+                self.board_states_dict.pop(self.zobrist_key)
+            else:
+                self.board_states_dict[self.zobrist_key] -= 1
+
+            from_index, to_index, captured, number_of_captured, turns_without_capture_count, self.zobrist_key \
+                = self.action_stack.pop()
+            move_bits = (1 << from_index) | (1 << to_index)
+            if self.king >> to_index & 1:
+                self.king = 1 << from_index
+                self.king_position = self.geometry.coordinates[from_index]
+                moving_player = Player.white
+            elif self.white >> to_index & 1:
+                self.white ^= move_bits
+                moving_player = Player.white
+            else:
+                self.black ^= move_bits
+                moving_player = Player.black
+
+            # revert captures
+            if moving_player == Player.white:
+                self.black |= captured
+                self.black_pieces += number_of_captured
+            else:
+                self.white |= captured
+                self.white_pieces += number_of_captured
+
+            self.turns_without_capture_count = turns_without_capture_count
+            self.outcome = Outcome.ongoing
+            self.turn_count -= 1
+            if self.evaluator is not None:
+                self.evaluator.action_undone(self)
+        else:
+            raise Exception("undo_last_action() failed because there is no action left to revert.")
+
+    def __str__(self):
+        return str(self.board)
@@ -1,3 +1,5 @@
+import random
+
 import numpy as np
 from enum import IntEnum
 
@@ -33,6 +35,95 @@ class Outcome(IntEnum):
     draw = 3
 
 
+# Random 64 bit keys for Zobrist hashing: one for every piece tile state on every tile and one for the side to move.
+# The key of a position is the xor of the keys of all pieces on the board, xor the side key if white is to move.
+# Keys are generated from a fixed seed so that every process (and every board engine) uses the same ones.
+class ZobristKeys:
+
+    def __init__(self, size):
+        self.width = size + 2
+        rng = random.Random(size)
+        # indexed by tile state and then by x * width + y
+        self.pieces = [None] * (TileState.king + 1)
+        for tile_state in (TileState.white, TileState.black, TileState.king):
+            self.pieces[tile_state] = [rng.getrandbits(64) for _ in range(self.width * self.width)]
+        self.white_to_move = rng.getrandbits(64)
+        # the piece keys as uint64 array for vectorized hashing, indexed by any tile state (0 for tiles without
+        # piece) and then by flat index
+        self.piece_array = np.zeros((len(TileState), self.width * self.width), dtype=np.uint64)
+        for tile_state in (TileState.white, TileState.black, TileState.king):
+            self.piece_array[tile_state] = self.pieces[tile_state]
+
+    # the keys never change, so copies of a board share them
+    def __deepcopy__(self, memo):
+        return self
+
+    # returns the key of a piece with the given tile state on the tile "position"
+    def piece(self, tile_state, position):
+        return self.pieces[tile_state][position[0] * self.width + position[1]]
+
+    # returns the key of a position given as tile state grid
+    def position_key(self, board, turn_player):
+        key = self.white_to_move if turn_player == Player.white else 0
+        for tile_state in (TileState.white, TileState.black, TileState.king):
+            for index in np.flatnonzero(np.asarray(board).ravel() == tile_state):
+                key ^= self.pieces[tile_state][index]
+        return key
+
+
+__ZOBRIST_KEYS__ = {}
+
+
+# returns the (cached) Zobrist keys of a board size
+def zobrist_keys(size):
+    if size not in __ZOBRIST_KEYS__:
+        __ZOBRIST_KEYS__[size] = ZobristKeys(size)
+    return __ZOBRIST_KEYS__[size]
+
+
+# Precomputed rays for the move generation of one board size. For every tile and direction, a ray lists the tiles
+# in that direction up to the border as (destination, action) pairs, where action is the prebuilt action
+# ((fromX, fromY), (toX, toY)) or None if the piece may pass the tile but not stop on it.
+# The throne and corner rules are applied in advance: soldier rays end before a corner and have no action on the
+# throne, king rays can stop anywhere
+class MoveTables:
+
+    def __init__(self, size):
+        throne = ((size + 1) // 2, (size + 1) // 2)
+        corners = ((1, 1), (1, size), (size, 1), (size, size))
+        self.soldier_rays = {}
+        self.king_rays = {}
+        for x in range(1, size + 1):
+            for y in range(1, size + 1):
+                soldier_rays = []
+                king_rays = []
+                for direction_x, direction_y in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                    soldier_ray = []
+                    king_ray = []
+                    x_other, y_other = x + direction_x, y + direction_y
+                    while 1 <= x_other <= size and 1 <= y_other <= size:
+                        destination = (x_other, y_other)
+                        action = ((x, y), destination)
+                        king_ray.append((destination, action))
+                        if destination not in corners:
+                            soldier_ray.append((destination, None if destination == throne else action))
+                        x_other, y_other = x_other + direction_x, y_other + direction_y
+                    soldier_rays.append(tuple(soldier_ray))
+                    king_rays.append(tuple(king_ray))
+                self.soldier_rays[(x, y)] = tuple(soldier_rays)
+                self.king_rays[(x, y)] = tuple(king_rays)
+
+
+__MOVE_TABLES__ = {}
+
+
+# returns the (cached) move tables of a board size
+def move_tables(size):
+    if size not in __MOVE_TABLES__:
+        __MOVE_TABLES__[size] = MoveTables(size)
+    return __MOVE_TABLES__[size]
+
+
 class HnefataflBoard:
 
     def __init__(self, size):
@@ -44,8 +135,21 @@ class HnefataflBoard:
 
         self.king_position = ((self.size + 1)/2, (self.size + 1)/2)
 
-        # holds all board states and the frequency how often they occurred
-        self.board_states_dict = {self.board.tobytes(): 1}
+        self.move_tables = move_tables(size)
+        # positions of the pieces of each player (the king belongs to white), kept up to date by do_action,
+        # capture and undo_last_action, so that move generation only visits occupied tiles
+        self.piece_positions = {Player.white: set(), Player.black: set()}
+        # optional object that is notified of done and undone actions (see evaluation.IncrementalEvaluator).
+        # It is not copied by clone
+        self.evaluator = None
+
+        # Zobrist key of the current position including the side to move. It is updated incrementally
+        # by do_action and undo_last_action and can be used as a transposition key by search code.
+        self.zobrist = zobrist_keys(size)
+        self.zobrist_key = 0
+
+        # holds the Zobrist keys of all board states and the frequency how often they occurred
+        self.board_states_dict = {self.zobrist_key: 1}
 
         # the outcome of the current match
         self.outcome = Outcome.ongoing
@@ -68,8 +172,6 @@ class HnefataflBoard:
         self.replay=True
 
         # for reverting actions
-        self.board_stack = []
-        self.king_position_stack = []
         self.action_stack = []
         self.capture_stack = []
         self.turns_without_capture_count_stack = []
@@ -152,11 +254,71 @@ class HnefataflBoard:
         self.board[self.size, 1] = TileState.corner
 
         self.update_board_states()
-        self.board_states_dict = {self.board.tobytes(): 1}
+        # black moves first
+        self.zobrist_key = self.zobrist.position_key(self.board, Player.black)
+        self.board_states_dict = {self.zobrist_key: 1}
         self.outcome = Outcome.ongoing
         self.turn_count = 0
         self.turns_without_capture_count = 0
 
+    # returns a compact, picklable encoding of the current position (without the undo history) that
+    # HnefataflBoard.from_position turns back into a board, e.g. for sending positions to other processes
+    def get_position(self):
+        return (self.size, self.board.astype(np.int8).tobytes(), tuple(int(i) for i in self.king_position),
+                self.white_pieces, self.black_pieces, self.turn_count, self.turns_without_capture_count,
+                int(self.outcome), self.zobrist_key, self.board_states_dict)
+
+    # creates a board from an encoding returned by get_position. The board does not print to the console
+    @classmethod
+    def from_position(cls, position):
+        size, board_bytes, king_position, white_pieces, black_pieces, turn_count, turns_without_capture_count, \
+            outcome, zobrist_key, board_states_dict = position
+        board = cls(size)
+        board.print_to_console = False
+        board.board = np.frombuffer(board_bytes, dtype=np.int8).reshape((size + 2, size + 2)).astype(np.int32)
+        board.update_board_states()
+        board.king_position = king_position
+        board.white_pieces = white_pieces
+        board.black_pieces = black_pieces
+        board.turn_count = turn_count
+        board.turns_without_capture_count = turns_without_capture_count
+        board.outcome = Outcome(outcome)
+        board.zobrist_key = zobrist_key
+        board.board_states_dict = dict(board_states_dict)
+        return board
+
+    # Returns a copy of the board that does not print to the console or save the game. The grids are copied with
+    # ndarray.copy() and everything else directly, which is a lot cheaper than copy.deepcopy.
+    # history: whether the undo stacks are copied, so that the copy can undo the actions before the current
+    # position. Only the lists are copied, their entries are shared with the board and never changed. The
+    # frequencies of the board states are always copied because they decide threefold repetitions
+    def clone(self, history=True):
+        board = type(self).__new__(type(self))
+        board.size = self.size
+        board.board = self.board.copy()
+        board.move_board = self.move_board.copy()
+        board.player_board = self.player_board.copy()
+        board.king_position = self.king_position
+        board.move_tables = self.move_tables
+        board.piece_positions = {Player.white: set(self.piece_positions[Player.white]),
+                                 Player.black: set(self.piece_positions[Player.black])}
+        board.zobrist = self.zobrist
+        board.zobrist_key = self.zobrist_key
+        board.board_states_dict = self.board_states_dict.copy()
+        board.outcome = self.outcome
+        board.white_pieces = self.white_pieces
+        board.black_pieces = self.black_pieces
+        board.turn_count = self.turn_count
+        board.turns_without_capture_count = self.turns_without_capture_count
+        board.print_to_console = False
+        board.save_game = False
+        board.replay = self.replay
+        board.evaluator = None
+        board.action_stack = list(self.action_stack) if history else []
+        board.capture_stack = list(self.capture_stack) if history else []
+        board.turns_without_capture_count_stack = list(self.turns_without_capture_count_stack) if history else []
+        return board
+
     def update_board_states(self):
         # movable state for any player (borders, corners, and soldiers are blocking)
         # anything else is traversable
@@ -171,6 +333,10 @@ class HnefataflBoard:
         np.place(self.player_board, self.board == TileState.black, Player.black)
         np.place(self.player_board, (self.board == TileState.white) | (self.board == TileState.king), Player.white)
 
+        # piece positions
+        for player in (Player.white, Player.black):
+            self.piece_positions[player] = set((int(x), int(y)) for x, y in np.argwhere(self.player_board == player))
+
     #  Checks whether "player" can do action "move".
     #  move = ((fromX,fromY),(toX,toY))
     def can_do_action(self, move, player):
@@ -180,54 +346,49 @@ class HnefataflBoard:
     # returns all valid actions for a player as a list of actions
     def get_valid_actions(self, turn_player):
         valid_actions = []
-        for position, player in np.ndenumerate(self.player_board):
-            if player == turn_player:
-                valid_actions.extend(self.get_valid_actions_for_piece(position))
+        for position in sorted(self.piece_positions[turn_player]):
+            valid_actions.extend(self.__piece_actions__(position))
         if len(valid_actions) == 0:
-            self.outcome = Outcome.white if turn_player == Player.black else Outcome.black
-            if self.print_to_console:
-                print("It is " + str(turn_player) + "'s turn, but they can't make any moves. "
-                      + str(Player.white if turn_player == Player.black else Player.black) + " wins!")
+            self.set_no_moves_outcome(turn_player)
         return valid_actions
 
+    # ends the game because "turn_player" can not move, the other player wins
+    def set_no_moves_outcome(self, turn_player):
+        self.outcome = Outcome.white if turn_player == Player.black else Outcome.black
+        if self.print_to_console:
+            print("It is " + str(turn_player) + "'s turn, but they can't make any moves. "
+                  + str(Player.white if turn_player == Player.black else Player.black) + " wins!")
+
     # returns all valid actions for a piece at a given position as a list of actions
     def get_valid_actions_for_piece(self, position):
-        x, y = position
-        is_king = self.board[x, y] == TileState.king
-        valid_actions = []
-        # first direction
-        for x_other in reversed(range(1, x)):
-            if self.move_board[x_other, y] == TileMoveState.traversable\
-                    and (is_king or self.board[x_other, y] != TileState.corner):
-                if (not (x_other, y) == ((self.size + 1)//2, (self.size + 1)//2)) or is_king:  # exclude throne if the piece is not the king
-                    valid_actions.append(((x, y), (x_other, y)))
-            else:
-                break
-        # second direction
-        for x_other in range(x + 1, self.size + 1):
-            if self.move_board[x_other, y] == TileMoveState.traversable \
-                    and (is_king or self.board[x_other, y] != TileState.corner):
-                if (not (x_other, y) == ((self.size + 1)//2, (self.size + 1)//2)) or is_king:  # exclude throne if the piece is not the king
-                    valid_actions.append(((x, y), (x_other, y)))
-            else:
-                break
-        # third direction
-        for y_other in reversed(range(1, y)):
-            if self.move_board[x, y_other] == TileMoveState.traversable \
-                    and (is_king or self.board[x, y_other] != TileState.corner):
-                if (not (x, y_other) == ((self.size + 1)//2, (self.size + 1)//2)) or is_king:  # exclude throne if the piece is not the king
-                    valid_actions.append(((x, y), (x, y_other)))
-            else:
-                break
-        # forth direction
-        for y_other in range(y + 1, self.size + 1):
-            if self.move_board[x, y_other] == TileMoveState.traversable \
-                    and (is_king or self.board[x, y_other] != TileState.corner):
-                if (not (x, y_other) == ((self.size + 1)//2, (self.size + 1)//2)) or is_king:  # exclude throne if the piece is not the king
-                    valid_actions.append(((x, y), (x, y_other)))
-            else:
-                break
-        return valid_actions
+        return list(self.__piece_actions__(position))
+
+    # returns whether "player" has any valid action, without building the list of actions
+    # (unlike get_valid_actions, it does not end the game if there is none)
+    def has_any_move(self, player):
+        for position in self.piece_positions[player]:
+            for _ in self.__piece_actions__(position):
+                return True
+        return False
+
+    # returns the number of valid actions of "player" without building the list of actions
+    def count_moves(self, player):
+        return sum(self.count_moves_for_piece(position) for position in self.piece_positions[player])
+
+    # returns the number of valid actions of the piece at "position" without building the list of actions
+    def count_moves_for_piece(self, position):
+        return sum(1 for _ in self.__piece_actions__(position))
+
+    # yields the valid actions of the piece at "position" one by one: each ray of the piece is walked until its first
+    # blocking tile. The rays already leave out the throne and the corners for soldiers (see MoveTables)
+    def __piece_actions__(self, position):
+        move_board = self.move_board
+        for ray in self.__rays__(position):
+            for destination, action in ray:
+                if move_board[destination] != TileMoveState.traversable:
+                    break
+                if action is not None:
+                    yield action
 
     # executes "move" for the player "player" whose turn it is
     # except when the game is already over. In this case it does nothing
@@ -252,9 +413,6 @@ class HnefataflBoard:
             self.turns_without_capture_count_stack.append(self.turns_without_capture_count)
             self.turns_without_capture_count += 1
             self.action_stack.append((move, self.board[from_x, from_y]))
-            board_bytes = self.board.tobytes()
-            self.board_stack.append(board_bytes)
-            self.king_position_stack.append(self.king_position)
 
             if self.print_to_console:
                 print(str(player) + " moves a piece from " + str((from_x, from_y)) + " to " + str((to_x, to_y)))
@@ -266,22 +424,31 @@ class HnefataflBoard:
                     if self.print_to_console:
                         print("The king escapes to corner " + str((to_x, to_y)) + ". White wins!")
             # update the board itself and capture pieces if applicable
-            self.board[to_x, to_y] = self.board[from_x, from_y]
-            self.board[from_x, from_y] = TileState.empty if (from_x, from_y) != ((self.size + 1)//2, (self.size + 1)//2) \
-                else TileState.throne
+            tile_state = self.board[from_x, from_y]
+            self.zobrist_key ^= self.zobrist.piece(tile_state, (from_x, from_y)) \
+                ^ self.zobrist.piece(tile_state, (to_x, to_y)) ^ self.zobrist.white_to_move
+            self.board[to_x, to_y] = tile_state
+            self.board[from_x, from_y] = self.__unoccupied_tile_state__((from_x, from_y))
+            self.move_board[to_x, to_y] = TileMoveState.blocking
+            self.move_board[from_x, from_y] = TileMoveState.traversable
+            self.player_board[to_x, to_y] = player
+            self.player_board[from_x, from_y] = 0
+            self.piece_positions[player].remove((from_x, from_y))
+            self.piece_positions[player].add((to_x, to_y))
             captured_pieces = self.capture((to_x, to_y), player)
             self.capture_stack.append(captured_pieces)
+            if self.evaluator is not None:
+                self.evaluator.action_done(self, move, captured_pieces)
 
             # update the board_states_dictionary so that we know whether the present board has occurred for the 3rd time
-            board_bytes = self.board.tobytes()
-            if board_bytes in self.board_states_dict:
-                self.board_states_dict[board_bytes] += 1
-                if self.board_states_dict[board_bytes] == 3:
+            if self.zobrist_key in self.board_states_dict:
+                self.board_states_dict[self.zobrist_key] += 1
+                if self.board_states_dict[self.zobrist_key] == 3:
                     self.outcome = Outcome.draw
                     if self.print_to_console:
                         print("The same board state has occurred three times. The game ends in a draw!")
             else:
-                self.board_states_dict[board_bytes] = 1
+                self.board_states_dict[self.zobrist_key] = 1
 
 
             # check if draw conditions by turn count are met
@@ -291,7 +458,6 @@ class HnefataflBoard:
                     and self.outcome == Outcome.ongoing:
                 self.outcome = Outcome.draw
 
-            self.update_board_states()
             if self.save_game:
                 if Outcome != Outcome.ongoing:
                     file.write(entry)
@@ -315,7 +481,7 @@ class HnefataflBoard:
                 and (self.board[x + 2, y] == own_pawn_tile_state or self.board[x + 2, y] == TileState.corner
                      or self.board[x + 2, y] == TileState.throne
                      or (turn_player == Player.white and self.board[x + 2, y] == TileState.king)):
-            self.board[x + 1, y] = TileState.empty
+            self.__remove_piece__((x + 1, y))
             captured_pieces.append((x + 1, y))
             if self.print_to_console:
                 print(str(turn_player) + " captures piece at " + str((x + 1, y)))
@@ -325,7 +491,7 @@ class HnefataflBoard:
                 and (self.board[x - 2, y] == own_pawn_tile_state or self.board[x - 2, y] == TileState.corner
                      or self.board[x - 2, y] == TileState.throne
                      or (turn_player == Player.white and self.board[x - 2, y] == TileState.king)):
-            self.board[x - 1, y] = TileState.empty
+            self.__remove_piece__((x - 1, y))
             captured_pieces.append((x - 1, y))
             if self.print_to_console:
                 print(str(turn_player) + " captures piece at " + str((x - 1, y)))
@@ -335,7 +501,7 @@ class HnefataflBoard:
                 and (self.board[x, y + 2] == own_pawn_tile_state or self.board[x, y + 2] == TileState.corner
                      or self.board[x, y + 2] == TileState.throne
                      or (turn_player == Player.white and self.board[x, y + 2] == TileState.king)):
-            self.board[x, y + 1] = TileState.empty
+            self.__remove_piece__((x, y + 1))
             captured_pieces.append((x, y + 1))
             if self.print_to_console:
                 print(str(turn_player) + " captures piece at " + str((x, y + 1)))
@@ -345,7 +511,7 @@ class HnefataflBoard:
                 and (self.board[x, y - 2] == own_pawn_tile_state or self.board[x, y - 2] == TileState.corner
                      or self.board[x, y - 2] == TileState.throne
                      or (turn_player == Player.white and self.board[x, y - 2] == TileState.king)):
-            self.board[x, y - 1] = TileState.empty
+            self.__remove_piece__((x, y - 1))
             captured_pieces.append((x, y - 1))
             if self.print_to_console:
                 print(str(turn_player) + " captures piece at " + str((x, y - 1)))
@@ -374,56 +540,112 @@ class HnefataflBoard:
 
         return captured_pieces
 
-    # reverts the last action and returns the board state to the state before
+    # returns the number of pieces (including the king) that "player" would capture with "move",
+    # i.e. len(do_action(move, player)), without executing the move
+    def count_captures(self, move, player):
+        (from_x, from_y), (x, y) = move
+        own_pawn_tile_state = TileState.black if player == Player.black else TileState.white
+        opponent_pawn_tile_state = TileState.white if player == Player.black else TileState.black
+        captures = 0
+        for direction_x, direction_y in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            if self.board[x + direction_x, y + direction_y] == opponent_pawn_tile_state:
+                hostile = self.board[x + 2*direction_x, y + 2*direction_y]
+                if hostile == own_pawn_tile_state or hostile == TileState.corner or hostile == TileState.throne \
+                        or (player == Player.white and hostile == TileState.king):
+                    captures += 1
+
+        # the king can only be captured by a black piece moving next to it or by the king moving
+        # between black pieces (without capturing one of them)
+        king_moves = self.board[from_x, from_y] == TileState.king
+        king_x, king_y = (x, y) if king_moves else self.king_position
+        if (king_moves and captures == 0) or (player == Player.black and abs(king_x - x) + abs(king_y - y) == 1):
+            for position in ((king_x + 1, king_y), (king_x - 1, king_y), (king_x, king_y + 1), (king_x, king_y - 1)):
+                if position == (x, y):
+                    tile_state = self.board[from_x, from_y]
+                elif position == (from_x, from_y):
+                    tile_state = self.__unoccupied_tile_state__(position)
+                else:
+                    tile_state = self.board[position]
+                if tile_state != TileState.black and tile_state != TileState.throne:
+                    break
+            else:
+                captures += 1
+        return captures
+
+    # reverts the last action and returns the board state to the state before.
+    # Only the tiles of the moved piece and the captured pieces are patched.
     def undo_last_action(self):
-        if len(self.board_stack) > 0:
-            if self.board_states_dict[self.board.tobytes()] == 1:
-                self.board_states_dict.pop(self.board.tobytes())
+        if len(self.action_stack) > 0:
+            # update board_states_dict
+            if self.board_states_dict[self.zobrist_key] == 1:
+                self.board_states_dict.pop(self.zobrist_key)
             else:
-                self.board_states_dict[self.board.tobytes()] -= 1
-            self.board = np.frombuffer(self.board_stack.pop(), dtype=np.int32).reshape((self.size + 2, self.size + 2))
-            self.board.setflags(write=1)
-            self.king_position = self.king_position_stack.pop()
-            self.turns_without_capture_count = self.turns_without_capture_count_stack.pop()
+                self.board_states_dict[self.zobrist_key] -= 1
+
+            # revert the movement of the piece
+            (from_position, to_position), tile_state = self.action_stack.pop()
+            player = Player.black if tile_state == TileState.black else Player.white
+            king_position = self.king_position
+            self.board[to_position] = self.__unoccupied_tile_state__(to_position)
+            self.move_board[to_position] = TileMoveState.traversable
+            self.player_board[to_position] = 0
+            self.board[from_position] = tile_state
+            self.move_board[from_position] = TileMoveState.blocking
+            self.player_board[from_position] = player
+            self.piece_positions[player].remove(to_position)
+            self.piece_positions[player].add(from_position)
+            self.zobrist_key ^= self.zobrist.piece(tile_state, from_position) \
+                ^ self.zobrist.piece(tile_state, to_position) ^ self.zobrist.white_to_move
+            # update king_position if that action was the king being moved
+            if tile_state == TileState.king:
+                self.king_position = from_position
+
+            # revert captures (a captured king is never removed from the board)
+            captured_pieces = self.capture_stack.pop()
+            other_player = Player.white if player == Player.black else Player.black
+            other_player_tile_state = TileState.white if player == Player.black else TileState.black
+            for position in captured_pieces:
+                if position != king_position:
+                    self.board[position] = other_player_tile_state
+                    self.move_board[position] = TileMoveState.blocking
+                    self.player_board[position] = other_player
+                    self.piece_positions[other_player].add(position)
+                    self.zobrist_key ^= self.zobrist.piece(other_player_tile_state, position)
+            if player == Player.black:
+                self.white_pieces += len(captured_pieces)
+            else:
+                self.black_pieces += len(captured_pieces)
+
             self.outcome = Outcome.ongoing
             self.turn_count -= 1
-            self.update_board_states()
+            self.turns_without_capture_count = self.turns_without_capture_count_stack.pop()
+            if self.evaluator is not None:
+                self.evaluator.action_undone(self)
         else:
             raise Exception("undo_last_action() failed because there is no action left to revert.")
-        # if len(self.action_stack) > 0:
-        #     # update board_states_dict
-        #     if self.board.tobytes() not in self.board_states_dict:
-        #         print(self.board.tobytes())
-        #         print(self.board_states_dict)
-        #     if self.board_states_dict[self.board.tobytes()] == 1:
-        #         self.board_states_dict.pop(self.board.tobytes())
-        #     else:
-        #         self.board_states_dict[self.board.tobytes()] -= 1
-        #
-        #     # revert the movement of the piece
-        #     (from_position, to_position), tile_state = self.action_stack.pop()
-        #     self.board[to_position] = TileState.empty
-        #     self.board[from_position] = tile_state
-        #     # update king_position if that action was the king being moved
-        #     if self.king_position == to_position:
-        #         self.king_position = from_position
-        #
-        #     # revert captures
-        #     captured_pieces = self.capture_stack.pop()
-        #     other_player_tile_state = TileState.white if tile_state == TileState.black else TileState.black
-        #     for position in captured_pieces:
-        #         self.board[position] = other_player_tile_state if self.king_position != position else TileState.king
-        #     if tile_state == TileState.black:
-        #         self.white_pieces += len(captured_pieces)
-        #     else:
-        #         self.black_pieces += len(captured_pieces)
-        #
-        #     self.outcome = Outcome.ongoing
-        #     self.turn_count -= 1
-        #     self.turns_without_capture_count = self.turns_without_capture_count_stack.pop()
-        #     self.update_board_states()
-        # else:
-        #     raise Exception("undo_last_action() failed because there is no action left to revert.")
+
+    # returns the precomputed rays (see MoveTables) of the piece at "position"
+    def __rays__(self, position):
+        if self.board[position] == TileState.king:
+            return self.move_tables.king_rays[position]
+        return self.move_tables.soldier_rays[position]
+
+    # returns the tile state of a tile when no piece stands on it
+    def __unoccupied_tile_state__(self, position):
+        x, y = position
+        if (x, y) == ((self.size + 1)//2, (self.size + 1)//2):
+            return TileState.throne
+        if (x == 1 or x == self.size) and (y == 1 or y == self.size):
+            return TileState.corner
+        return TileState.empty
+
+    # removes a captured soldier from all boards
+    def __remove_piece__(self, position):
+        self.zobrist_key ^= self.zobrist.piece(self.board[position], position)
+        self.piece_positions[self.player_board[position]].discard(position)
+        self.board[position] = TileState.empty
+        self.move_board[position] = TileMoveState.traversable
+        self.player_board[position] = 0
 
     def __str__(self):
         return str(self.board)
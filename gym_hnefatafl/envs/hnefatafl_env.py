@@ -1,6 +1,8 @@
-import copy
-
 import gym
+import numpy as np
+from gym import spaces
+from gym_hnefatafl.envs.action_encoding import action_encoding
+from gym_hnefatafl.envs.observation import ObservationEncoder
 from gym_hnefatafl.envs.render_utils import Render_utils
 from gym_hnefatafl.envs.board import Outcome
 from gym_hnefatafl.envs.board import HnefataflBoard
@@ -36,13 +38,24 @@ class HnefataflEnv(gym.Env):
     # Set these in ALL subclasses
     observation_space = None
 
-    def __init__(self, size):
+    # observation_dtype: None to observe the env itself, otherwise the dtype of the observation planes
+    #                    (see ObservationEncoder), e.g. np.uint8 or np.float32
+    # repetition_plane: whether the observation planes include the repetition count of the position
+    def __init__(self, size, observation_dtype=None, repetition_plane=False):
         self.size = size
         self.viewer = None
+        self.observation_encoder = None
+        if observation_dtype is not None:
+            self.observation_encoder = ObservationEncoder(size, observation_dtype, repetition_plane)
+            self.observation_space = self.observation_encoder.observation_space
         self._hnefatafl = HnefataflBoard(size)
         self._blackTurn = True
-        self.action_space = []
-        self.recalculate_action_space()
+        # every move of the board size has a fixed index (see ActionEncoding), legal_action_mask() tells which
+        # of them are legal in the current position
+        self.action_encoding = action_encoding(size)
+        self.action_space = spaces.Discrete(self.action_encoding.number_of_actions)
+        self._legal_action_mask = None
+        self.check_valid_actions()
 
     def step(self, action):
         """Run one timestep of the environment's dynamics. When end of
@@ -50,33 +63,50 @@ class HnefataflEnv(gym.Env):
         to reset this environment's state.
         Accepts an action and returns a tuple (observation, reward, done, info).
         Args:
-            action (object): an action provided by the environment
+            action (object): an action index of the action space or an action ((fromX, fromY), (toX, toY))
         Returns:
-            observation (object): agent's observation of the current environment
+            observation (object): agent's observation of the current environment (see get_observation)
             reward (float) : amount of reward returned after previous action
             done (boolean): whether the episode has ended, in which case further step() calls will return undefined results
             info (dict): contains auxiliary diagnostic information (helpful for debugging, and sometimes learning)
         """
 
+        if isinstance(action, (int, np.integer)):
+            action = self.action_encoding.decode(action)
         captured_pieces = self._hnefatafl.do_action(action, self.turn_player())
         self._blackTurn = not self._blackTurn
-        self.recalculate_action_space()
+        self._legal_action_mask = None
+        self.check_valid_actions()
 
         game_over = self._hnefatafl.outcome != Outcome.ongoing
-        return self, 0, game_over, self._hnefatafl.outcome, captured_pieces
+        return self.get_observation(), 0, game_over, self._hnefatafl.outcome, captured_pieces
+
+    # Returns the env itself if it has no observation encoder. Otherwise it returns the observation planes of the
+    # current position, written into "out" if given or else into the buffer of the encoder, which is reused by
+    # the next call
+    def get_observation(self, out=None):
+        if self.observation_encoder is None:
+            return self
+        return self.observation_encoder.encode(self._hnefatafl, self.turn_player(), out)
 
-    # returns a copy of the internal board
+    # returns a copy of the internal board (that does not print to the console or save the game)
     def get_board(self):
-        board_copy = copy.deepcopy(self._hnefatafl)
-        board_copy.print_to_console = False
-        board_copy.save_game=False
-        return board_copy
+        return self._hnefatafl.clone()
+
+    # returns the boolean vector of the action indices that are legal for the agent whose turn it is
+    def legal_action_mask(self):
+        if self._legal_action_mask is None:
+            self._legal_action_mask = self.action_encoding.legal_action_mask(self._hnefatafl, self.turn_player())
+        return self._legal_action_mask
 
-        # return self._hnefatafl.copy()
+    # returns the valid actions ((fromX, fromY), (toX, toY)) of the agent whose turn it is
+    def get_valid_actions(self):
+        return [self.action_encoding.decode(index) for index in np.flatnonzero(self.legal_action_mask())]
 
-    # recalculates the action space for the agent whose turn it is next
-    def recalculate_action_space(self):
-        self.action_space = self._hnefatafl.get_valid_actions(self.turn_player())
+    # ends the game if the agent whose turn it is can not move (like HnefataflBoard.get_valid_actions)
+    def check_valid_actions(self):
+        if self._hnefatafl.outcome == Outcome.ongoing and not self.legal_action_mask().any():
+            self._hnefatafl.set_no_moves_outcome(self.turn_player())
 
     # returns either Player.black or Player.white depending on whose turn it is
     def turn_player(self):
@@ -89,7 +119,8 @@ class HnefataflEnv(gym.Env):
         """
         self._hnefatafl = HnefataflBoard()
         self._blackTurn = True
-        self.recalculate_action_space()
+        self._legal_action_mask = None
+        self.check_valid_actions()
 
         raise NotImplementedError
 
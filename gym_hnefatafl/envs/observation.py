@@ -0,0 +1,52 @@
+import numpy as np
+from gym import spaces
+
+from gym_hnefatafl.envs.board import Player, TileState
+
+# planes of an observation, each one is a size x size array of the tiles without the border
+BLACK_PLANE = 0
+WHITE_PLANE = 1          # white soldiers
+KING_PLANE = 2
+THRONE_PLANE = 3
+CORNERS_PLANE = 4
+SIDE_TO_MOVE_PLANE = 5   # all ones if white is to move
+REPETITIONS_PLANE = 6    # how often the current position has occurred (optional)
+
+
+# Encodes positions as a stack of planes of shape (number of planes, size, size) for learners.
+# The encoder owns one buffer that every call of encode overwrites and returns, so no memory is allocated per
+# position, or it writes into a buffer given by the caller
+class ObservationEncoder(object):
+
+    def __init__(self, size, dtype=np.uint8, repetition_plane=False):
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self.number_of_planes = REPETITIONS_PLANE + 1 if repetition_plane else REPETITIONS_PLANE
+        shape = (self.number_of_planes, size, size)
+        high = np.ones(shape, dtype=self.dtype)
+        if repetition_plane:
+            high[REPETITIONS_PLANE] = 3
+        self.observation_space = spaces.Box(low=np.zeros(shape, dtype=self.dtype), high=high, dtype=self.dtype)
+        self.buffer = np.zeros(shape, dtype=self.dtype)
+
+        # the planes that are the same for every position
+        self.throne = np.zeros((size, size), dtype=self.dtype)
+        self.throne[(size - 1) // 2, (size - 1) // 2] = 1
+        self.corners = np.zeros((size, size), dtype=self.dtype)
+        self.corners[::size - 1, ::size - 1] = 1
+
+    # writes the observation of "board" (HnefataflBoard or BitboardHnefataflBoard) with "turn_player" to move
+    # into "out" (or the buffer of the encoder) and returns it
+    def encode(self, board, turn_player, out=None):
+        if out is None:
+            out = self.buffer
+        grid = np.asarray(board.board)[1:-1, 1:-1]
+        np.equal(grid, TileState.black, out=out[BLACK_PLANE], casting="unsafe")
+        np.equal(grid, TileState.white, out=out[WHITE_PLANE], casting="unsafe")
+        np.equal(grid, TileState.king, out=out[KING_PLANE], casting="unsafe")
+        out[THRONE_PLANE] = self.throne
+        out[CORNERS_PLANE] = self.corners
+        out[SIDE_TO_MOVE_PLANE] = turn_player == Player.white
+        if self.number_of_planes > REPETITIONS_PLANE:
+            out[REPETITIONS_PLANE] = board.board_states_dict.get(board.zobrist_key, 0)
+        return out
@@ -0,0 +1,170 @@
+import random
+
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard, geometry, popcount
+from gym_hnefatafl.envs.board import Outcome, Player
+from gym_hnefatafl.envs.rule_config import MAX_NUMBER_OF_TURNS, MAX_NUMBER_OF_TURNS_WITHOUT_CAPTURE
+
+
+# A position for playing games to their end as fast as possible (e.g. the rollouts of monte carlo tree search).
+# It uses the bitboards and the move generation of BitboardHnefataflBoard, but knows the player to move and does
+# none of the bookkeeping that is only needed for searching: there are no Zobrist keys, no repetition history
+# (so threefold repetitions are not detected) and no action stack (so actions can not be undone).
+# Copying a RolloutPosition only copies a few ints
+class RolloutPosition(BitboardHnefataflBoard):
+
+    # creates a rollout position from a HnefataflBoard or BitboardHnefataflBoard, "turn_player" moves next.
+    # The bitboards of a HnefataflBoard are built from its piece positions, its history is not copied
+    @classmethod
+    def from_board(cls, board, turn_player):
+        position = cls.__new__(cls)
+        position.size = board.size
+        if isinstance(board, BitboardHnefataflBoard):
+            position.geometry = board.geometry
+            position.white = board.white
+            position.black = board.black
+            position.king = board.king
+        else:
+            position.geometry = geometry(board.size)
+            index = position.geometry.index
+            # the positions may hold NumPy integers, which can not be shifted beyond 64 bits
+            position.king = 1 << int(index(board.king_position))
+            position.white = sum(1 << int(index(tile)) for tile in board.piece_positions[Player.white]) \
+                & ~position.king
+            position.black = sum(1 << int(index(tile)) for tile in board.piece_positions[Player.black])
+        position.king_position = tuple(int(i) for i in board.king_position)
+        position.turn_player = turn_player
+        position.outcome = board.outcome
+        position.white_pieces = board.white_pieces
+        position.black_pieces = board.black_pieces
+        position.turn_count = board.turn_count
+        position.turns_without_capture_count = board.turns_without_capture_count
+        position.__grid__ = None
+        position.__grid_position__ = None
+        return position
+
+    def copy(self):
+        position = RolloutPosition.__new__(RolloutPosition)
+        position.__dict__.update(self.__dict__)
+        return position
+
+    # executes "move" for "player" without checking whether the move is valid
+    def do_action(self, move, player):
+        if self.outcome != Outcome.ongoing:
+            return
+        self.turn_player = player
+        self.play(self.geometry.index(move[0]), self.geometry.index(move[1]))
+
+    def undo_last_action(self):
+        raise Exception("a RolloutPosition can not undo actions.")
+
+    # moves the piece on the tile "from_index" of the player to move to the tile "to_index",
+    # captures and checks the end of the game like HnefataflBoard.do_action
+    def play(self, from_index, to_index):
+        geometry = self.geometry
+        from_bit = 1 << from_index
+        to_bit = 1 << to_index
+        player = self.turn_player
+        self.turn_count += 1
+        self.turns_without_capture_count += 1
+
+        if from_bit == self.king:
+            self.king = to_bit
+            self.king_position = geometry.coordinates[to_index]
+            if to_bit & geometry.corners:
+                self.outcome = Outcome.white
+        elif player == Player.white:
+            self.white ^= from_bit | to_bit
+        else:
+            self.black ^= from_bit | to_bit
+
+        # captures
+        empty_throne = geometry.throne & ~self.king
+        if player == Player.white:
+            opponent_soldiers = self.black
+            hostile = self.white | self.king | geometry.corners | empty_throne
+        else:
+            opponent_soldiers = self.white
+            hostile = self.black | geometry.corners | empty_throne
+        if geometry.neighbors[to_index] & opponent_soldiers:
+            captured = 0
+            for direction in geometry.directions:
+                neighbor = to_index + direction
+                if opponent_soldiers >> neighbor & 1 and hostile >> (neighbor + direction) & 1:
+                    captured |= 1 << neighbor
+            if captured:
+                if player == Player.white:
+                    self.black ^= captured
+                    self.black_pieces -= popcount(captured)
+                else:
+                    self.white ^= captured
+                    self.white_pieces -= popcount(captured)
+                self.turns_without_capture_count = 0
+
+        # check capture king
+        if not geometry.neighbors[self.king.bit_length() - 1] & ~(self.black | empty_throne):
+            self.outcome = Outcome.black
+            self.white_pieces -= 1
+            self.turns_without_capture_count = 0
+
+        # check if draw conditions by turn count are met
+        if self.outcome == Outcome.ongoing and (self.turn_count == MAX_NUMBER_OF_TURNS
+                                                or self.turns_without_capture_count
+                                                == MAX_NUMBER_OF_TURNS_WITHOUT_CAPTURE):
+            self.outcome = Outcome.draw
+
+        self.turn_player = Player.black if player == Player.white else Player.white
+
+    # returns a uniformly drawn valid move (from index, to index) of the player to move, or None if there is none.
+    # Instead of generating all moves, a random piece and a random number below the maximum number of destinations
+    # of a piece are drawn until the number is below the number of destinations of the piece.
+    # If that fails too often, a move is drawn by its number among all moves, which are counted but not generated
+    def random_move(self):
+        pieces = self.pieces(self.turn_player)
+        number_of_pieces = popcount(pieces)
+        maximum_number_of_destinations = 2 * (self.size - 1)
+        for _ in range(4 * number_of_pieces):
+            piece = pieces
+            for _ in range(random.randrange(number_of_pieces)):
+                piece &= piece - 1
+            piece &= -piece
+            destinations = self.__destinations__(piece.bit_length() - 1, piece == self.king)
+            destination_number = random.randrange(maximum_number_of_destinations)
+            if destination_number < popcount(destinations):
+                for _ in range(destination_number):
+                    destinations &= destinations - 1
+                return piece.bit_length() - 1, (destinations & -destinations).bit_length() - 1
+
+        number_of_moves = self.count_moves(self.turn_player)
+        if number_of_moves == 0:
+            return None
+        move_number = random.randrange(number_of_moves)
+        while pieces:
+            piece = pieces & -pieces
+            pieces ^= piece
+            destinations = self.__destinations__(piece.bit_length() - 1, piece == self.king)
+            number_of_destinations = popcount(destinations)
+            if move_number < number_of_destinations:
+                for _ in range(move_number):
+                    destinations &= destinations - 1
+                return piece.bit_length() - 1, (destinations & -destinations).bit_length() - 1
+            move_number -= number_of_destinations
+
+
+# the policy of a uniformly random player
+def random_policy(position):
+    return position.random_move()
+
+
+# plays the game of "position" (which is changed) to its end with "policy" choosing the moves of both players
+# and returns the outcome. A policy returns the (from index, to index) of the move of the player to move or None
+# if there is no valid move. If the game is not decided after "max_plies" plies, the outcome is a draw
+def rollout(position, policy=random_policy, max_plies=None):
+    plies = 0
+    while position.outcome == Outcome.ongoing and (max_plies is None or plies < max_plies):
+        move = policy(position)
+        if move is None:
+            position.outcome = Outcome.white if position.turn_player == Player.black else Outcome.black
+            break
+        position.play(*move)
+        plies += 1
+    return Outcome.draw if position.outcome == Outcome.ongoing else position.outcome
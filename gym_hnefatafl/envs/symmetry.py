@@ -0,0 +1,101 @@
+import numpy as np
+
+from gym_hnefatafl.envs.action_encoding import DIRECTIONS, action_encoding
+from gym_hnefatafl.envs.board import Player, zobrist_keys
+
+NUMBER_OF_SYMMETRIES = 8
+
+
+# applies symmetry number "symmetry" to the last two axes of a square array and returns a view of it:
+# 0 - 3 rotate by 0, 90, 180 and 270 degrees, 4 - 7 mirror and then rotate like 0 - 3
+def transform_grid(grid, symmetry):
+    if symmetry >= 4:
+        grid = np.flip(grid, axis=-1)
+    return np.rot90(grid, symmetry % 4, axes=(-2, -1))
+
+
+# Permutation tables of the 8 symmetries of the board (rotations and reflections) for one board size.
+# Boards and observation planes are transformed with transform_grid, which only creates views.
+# Legal action masks and policy vectors in the indexing of the ActionEncoding are transformed with precomputed
+# permutations of the action indices. Every function works on single arrays and on batches (leading axes)
+class Symmetries(object):
+
+    def __init__(self, size):
+        self.size = size
+        self.width = size + 2
+        encoding = action_encoding(size)
+        number_of_tiles = self.width * self.width
+
+        # tile_maps[symmetry][index] is the flat index of the tile that the tile "index" of the padded grid is
+        # moved to
+        sources = np.arange(number_of_tiles).reshape(self.width, self.width)
+        self.tile_maps = np.zeros((NUMBER_OF_SYMMETRIES, number_of_tiles), dtype=np.intp)
+        for symmetry in range(NUMBER_OF_SYMMETRIES):
+            self.tile_maps[symmetry][transform_grid(sources, symmetry).ravel()] = np.arange(number_of_tiles)
+
+        # inverses[symmetry] is the symmetry that reverts "symmetry"
+        tiles = np.arange(number_of_tiles)
+        self.inverses = [next(inverse for inverse in range(NUMBER_OF_SYMMETRIES)
+                              if (self.tile_maps[inverse][self.tile_maps[symmetry]] == tiles).all())
+                         for symmetry in range(NUMBER_OF_SYMMETRIES)]
+
+        # action_maps[symmetry][index] is the index of the action that the action "index" becomes, action_sources
+        # is the inverse permutation, so that transformed[..., index] = original[..., action_sources[index]]
+        self.action_maps = np.zeros((NUMBER_OF_SYMMETRIES, encoding.number_of_actions), dtype=np.intp)
+        from_index = encoding.moves[:, 0] * self.width + encoding.moves[:, 1]
+        _, _, direction, distance = np.unravel_index(np.arange(encoding.number_of_actions), encoding.shape)
+        offsets = np.array([dx * self.width + dy for dx, dy in DIRECTIONS])
+        for symmetry in range(NUMBER_OF_SYMMETRIES):
+            tile_map = self.tile_maps[symmetry]
+            new_from_index = tile_map[from_index]
+            # the direction is transformed by transforming the neighbor of the tile in that direction
+            new_offset = tile_map[from_index + offsets[direction]] - new_from_index
+            new_direction = np.select([new_offset == offset for offset in offsets], range(len(DIRECTIONS)))
+            new_x, new_y = np.divmod(new_from_index, self.width)
+            self.action_maps[symmetry] = np.ravel_multi_index((new_x - 1, new_y - 1, new_direction, distance),
+                                                              encoding.shape)
+        self.action_sources = np.argsort(self.action_maps, axis=1)
+
+        # Zobrist keys of HnefataflBoard indexed by any tile state and flat index (0 for tiles without piece),
+        # for canonical_keys
+        zobrist = zobrist_keys(size)
+        self.zobrist_pieces = zobrist.piece_array
+        self.zobrist_white_to_move = np.uint64(zobrist.white_to_move)
+
+    # returns the boards (..., size + 2, size + 2), or any other square planes, transformed by "symmetry" as view
+    def transform_boards(self, boards, symmetry):
+        return transform_grid(boards, symmetry)
+
+    # returns the legal action masks or policy vectors (..., number of actions) transformed by "symmetry"
+    def transform_actions(self, actions, symmetry):
+        return np.take(actions, self.action_sources[symmetry], axis=-1)
+
+    # returns the index of the action "index" transformed by "symmetry"
+    def transform_action(self, index, symmetry):
+        return self.action_maps[symmetry][index]
+
+    # Returns the canonical Zobrist keys of TileState grids (..., size + 2, size + 2) with "turn_players" to move
+    # and the symmetries that lead to them: the smallest key of all 8 transformed boards. Symmetric positions
+    # have the same canonical key, so tables keyed by it merge them. The key of symmetry 0 is the zobrist_key
+    # of HnefataflBoard
+    def canonical_keys(self, boards, turn_players):
+        boards = np.asarray(boards)
+        flat_boards = boards.reshape(boards.shape[:-2] + (-1,))
+        tiles = np.arange(flat_boards.shape[-1])
+        keys = np.stack([np.bitwise_xor.reduce(self.zobrist_pieces[flat_boards, self.tile_maps[symmetry][tiles]],
+                                               axis=-1)
+                         for symmetry in range(NUMBER_OF_SYMMETRIES)])
+        symmetries = np.argmin(keys, axis=0)
+        canonical_keys = np.min(keys, axis=0)
+        return np.where(np.asarray(turn_players) == Player.white, canonical_keys ^ self.zobrist_white_to_move,
+                        canonical_keys), symmetries
+
+
+__SYMMETRIES__ = {}
+
+
+# returns the (cached) symmetry tables of a board size
+def symmetries(size):
+    if size not in __SYMMETRIES__:
+        __SYMMETRIES__[size] = Symmetries(size)
+    return __SYMMETRIES__[size]
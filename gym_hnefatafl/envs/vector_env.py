@@ -0,0 +1,196 @@
+import numpy as np
+
+from gym_hnefatafl.envs.action_encoding import DIRECTIONS, action_encoding
+from gym_hnefatafl.envs.board import HnefataflBoard, Outcome, Player, TileState, zobrist_keys
+from gym_hnefatafl.envs.rule_config import MAX_NUMBER_OF_TURNS, MAX_NUMBER_OF_TURNS_WITHOUT_CAPTURE
+
+
+# Index tables of one board size for the vectorized rules of VectorHnefataflEnv.
+# Tiles are flat indices x * width + y of the padded (size + 2) x (size + 2) grid
+class VectorGeometry(object):
+
+    def __init__(self, size):
+        self.size = size
+        self.width = size + 2
+
+        start = HnefataflBoard(size)
+        start.print_to_console = False
+        self.start_board = start.board.astype(np.int8)
+        self.start_key = np.uint64(start.zobrist_key)
+
+        # the Zobrist keys of HnefataflBoard, indexed by tile state and flat index
+        zobrist = zobrist_keys(size)
+        self.zobrist_pieces = zobrist.piece_array
+        self.zobrist_white_to_move = np.uint64(zobrist.white_to_move)
+
+        self.offsets = np.array([dx * self.width + dy for dx, dy in DIRECTIONS])
+        self.throne_index = (size + 1) // 2 * (self.width + 1)
+        self.corners = np.zeros(self.width * self.width, dtype=bool)
+        for x, y in ((1, 1), (1, size), (size, 1), (size, size)):
+            self.corners[x * self.width + y] = True
+
+
+__VECTOR_GEOMETRIES__ = {}
+
+
+# returns the (cached) vector geometry of a board size
+def vector_geometry(size):
+    if size not in __VECTOR_GEOMETRIES__:
+        __VECTOR_GEOMETRIES__[size] = VectorGeometry(size)
+    return __VECTOR_GEOMETRIES__[size]
+
+
+# Plays "number_of_games" games at once. The games are stored in stacked arrays and every rule of
+# HnefataflBoard.do_action is applied to all games with numpy operations:
+#   boards: (number_of_games, size + 2, size + 2) TileState grids
+#   turn_players, turn_counts, turns_without_capture_counts: (number_of_games,)
+# Repetitions are counted with the Zobrist keys of the positions since the last capture (earlier positions have
+# more pieces and can not occur again).
+# Moves are given as rows (from_x, from_y, to_x, to_y) or as indices of the ActionEncoding of the size.
+# Legal moves are given as boolean masks of shape (number_of_games, size, size, 4, size - 1) indexed by the tile
+# (x - 1, y - 1) of the piece, the direction (see DIRECTIONS) and the distance - 1, so a flattened mask is the
+# legal action mask of the ActionEncoding.
+# Finished games are reset to the start position by step.
+class VectorHnefataflEnv(object):
+
+    def __init__(self, number_of_games, size):
+        self.number_of_games = number_of_games
+        self.size = size
+        self.geometry = vector_geometry(size)
+        self.action_encoding = action_encoding(size)
+        self.boards = np.empty((number_of_games, size + 2, size + 2), dtype=np.int8)
+        self.turn_players = np.empty(number_of_games, dtype=np.int8)
+        self.turn_counts = np.empty(number_of_games, dtype=np.int32)
+        self.turns_without_capture_counts = np.empty(number_of_games, dtype=np.int32)
+        self.zobrist_keys = np.empty(number_of_games, dtype=np.uint64)
+        # per game the Zobrist keys of the positions since the last capture, indexed by turns without capture
+        self.history = np.empty((number_of_games, MAX_NUMBER_OF_TURNS_WITHOUT_CAPTURE + 1), dtype=np.uint64)
+        self.legal_move_masks = None
+        self.reset()
+
+    # resets all games and returns the observations
+    def reset(self):
+        self.__reset_games__(np.ones(self.number_of_games, dtype=bool))
+        self.legal_move_masks = self.__legal_move_masks__()
+        return self.boards.copy()
+
+    # Does one move in every game.
+    # actions: (number_of_games, 4) array of (from_x, from_y, to_x, to_y) or (number_of_games,) action indices.
+    # Returns (observations, rewards, dones, outcomes, legal_move_masks):
+    #   observations: copy of the boards after the move (or after the reset of finished games)
+    #   rewards: 1 if the player that moved has won, -1 if it has lost, else 0
+    #   dones: whether the game has ended with this move (it has been reset since)
+    #   outcomes: the outcome of every game after the move
+    #   legal_move_masks: the legal moves of the players to move next
+    def step(self, actions):
+        geometry = self.geometry
+        number_of_games = self.number_of_games
+        games = np.arange(number_of_games)
+        actions = np.asarray(actions, dtype=np.intp)
+        if actions.ndim == 1:
+            actions = self.action_encoding.moves[actions]
+        actions = actions.reshape(number_of_games, 4)
+        from_x, from_y, to_x, to_y = actions.T
+        self.__check_actions__(games, from_x, from_y, to_x, to_y)
+
+        width = geometry.width
+        flat_boards = self.boards.reshape(number_of_games, -1)
+        from_index = from_x * width + from_y
+        to_index = to_x * width + to_y
+        pieces = flat_boards[games, from_index]
+        flat_boards[games, from_index] = np.where(from_index == geometry.throne_index, TileState.throne,
+                                                  TileState.empty)
+        flat_boards[games, to_index] = pieces
+        keys = self.zobrist_keys ^ geometry.zobrist_pieces[pieces, from_index] \
+            ^ geometry.zobrist_pieces[pieces, to_index] ^ geometry.zobrist_white_to_move
+
+        # check if the king reached a corner
+        outcomes = np.full(number_of_games, Outcome.ongoing, dtype=np.int8)
+        outcomes[(pieces == TileState.king) & geometry.corners[to_index]] = Outcome.white
+
+        # captures
+        white_moves = self.turn_players == Player.white
+        opponent_tile_state = np.where(white_moves, TileState.black, TileState.white)
+        number_of_captures = np.zeros(number_of_games, dtype=np.int32)
+        for offset in geometry.offsets:
+            neighbor = to_index + offset
+            beyond = np.clip(neighbor + offset, 0, width * width - 1)
+            beyond_tile = flat_boards[games, beyond]
+            hostile = (beyond_tile == TileState.corner) | (beyond_tile == TileState.throne) \
+                | np.where(white_moves, (beyond_tile == TileState.white) | (beyond_tile == TileState.king),
+                           beyond_tile == TileState.black)
+            captured = (flat_boards[games, neighbor] == opponent_tile_state) & hostile
+            flat_boards[games[captured], neighbor[captured]] = TileState.empty
+            keys[captured] ^= geometry.zobrist_pieces[opponent_tile_state[captured], neighbor[captured]]
+            number_of_captures += captured
+
+        # check capture king
+        king_index = np.argmax(flat_boards == TileState.king, axis=1)
+        king_neighbors = flat_boards[games[:, None], king_index[:, None] + geometry.offsets]
+        king_captured = np.all((king_neighbors == TileState.black) | (king_neighbors == TileState.throne), axis=1)
+        outcomes[king_captured] = Outcome.black
+        number_of_captures += king_captured
+
+        # increase turn counts
+        self.turn_counts += 1
+        self.turns_without_capture_counts = np.where(number_of_captures > 0, 0,
+                                                     self.turns_without_capture_counts + 1).astype(np.int32)
+        self.zobrist_keys = keys
+
+        # check if the present board has occurred for the 3rd time
+        turns_without_capture = self.turns_without_capture_counts
+        earlier = np.arange(self.history.shape[1]) < turns_without_capture[:, None]
+        frequencies = np.count_nonzero((self.history == keys[:, None]) & earlier, axis=1) + 1
+        self.history[games, turns_without_capture] = keys
+        outcomes[frequencies >= 3] = Outcome.draw
+
+        # check if draw conditions by turn count are met
+        outcomes[(outcomes == Outcome.ongoing) & ((self.turn_counts == MAX_NUMBER_OF_TURNS)
+                                                  | (turns_without_capture == MAX_NUMBER_OF_TURNS_WITHOUT_CAPTURE))] \
+            = Outcome.draw
+
+        # the next player loses if it can not move
+        moved_players = self.turn_players.copy()
+        self.turn_players = np.where(white_moves, Player.black, Player.white).astype(np.int8)
+        self.legal_move_masks = self.__legal_move_masks__()
+        no_moves = (outcomes == Outcome.ongoing) & ~self.legal_move_masks.reshape(number_of_games, -1).any(axis=1)
+        outcomes[no_moves] = moved_players[no_moves]    # the values of Player and Outcome agree for both colors
+
+        rewards = np.where(outcomes == moved_players, 1,
+                           np.where((outcomes == Outcome.white) | (outcomes == Outcome.black), -1, 0))
+        dones = outcomes != Outcome.ongoing
+        if dones.any():
+            self.__reset_games__(dones)
+            self.legal_move_masks[dones] = self.__legal_move_masks__(dones)
+        return self.boards.copy(), rewards, dones, outcomes, self.legal_move_masks
+
+    # raises an exception if an action is not a legal move
+    def __check_actions__(self, games, from_x, from_y, to_x, to_y):
+        size = self.size
+        delta_x = to_x - from_x
+        delta_y = to_y - from_y
+        direction = np.where(delta_x < 0, 0, np.where(delta_x > 0, 1, np.where(delta_y < 0, 2, 3)))
+        distance = np.abs(delta_x) + np.abs(delta_y)
+        legal = (np.minimum(from_x, from_y) >= 1) & (np.maximum(from_x, from_y) <= size) \
+            & ((delta_x == 0) ^ (delta_y == 0)) & (distance < size)
+        legal[legal] = self.legal_move_masks[games[legal], from_x[legal] - 1, from_y[legal] - 1, direction[legal],
+                                             distance[legal] - 1]
+        if not legal.all():
+            game = int(np.flatnonzero(~legal)[0])
+            raise Exception("game " + str(game) + ": " + str(Player(self.turn_players[game])) + " tried to make move "
+                            + str(((from_x[game], from_y[game]), (to_x[game], to_y[game])))
+                            + ", but that move is not possible.")
+
+    # sets the games selected by the boolean array "games" to the start position
+    def __reset_games__(self, games):
+        geometry = self.geometry
+        self.boards[games] = geometry.start_board
+        self.turn_players[games] = Player.black
+        self.turn_counts[games] = 0
+        self.turns_without_capture_counts[games] = 0
+        self.zobrist_keys[games] = geometry.start_key
+        self.history[games, 0] = geometry.start_key
+
+    # returns the legal move masks of the selected games for their players to move
+    def __legal_move_masks__(self, games=slice(None)):
+        return self.action_encoding.legal_move_masks(self.boards[games], self.turn_players[games])
@@ -0,0 +1,96 @@
+import random
+
+import numpy as np
+import pytest
+
+from gym_hnefatafl.envs import HnefataflEnv
+from gym_hnefatafl.envs.action_encoding import DIRECTIONS, action_encoding
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
+from gym_hnefatafl.envs.board import HnefataflBoard, Player, Outcome, TileState
+
+GAMES_PER_SIZE = 3
+MAX_TURNS = 200
+
+
+# returns the opponent of the given player
+def other_player(player):
+    return Player.white if player == Player.black else Player.black
+
+
+# every straight move on the board has exactly one index, decoding it gives the move back, and the index tables
+# agree with the formula of ActionEncoding
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_index_round_trip(size):
+    encoding = action_encoding(size)
+    assert encoding.number_of_actions == size * size * 4 * (size - 1)
+    on_board = 0
+    for from_x in range(1, size + 1):
+        for from_y in range(1, size + 1):
+            for direction, (direction_x, direction_y) in enumerate(DIRECTIONS):
+                for distance in range(1, size):
+                    to_x, to_y = from_x + direction_x * distance, from_y + direction_y * distance
+                    index = (((from_x - 1) * size + from_y - 1) * 4 + direction) * (size - 1) + distance - 1
+                    action = ((from_x, from_y), (to_x, to_y))
+                    assert encoding.decode(index) == action
+                    assert tuple(encoding.moves[index]) == (from_x, from_y, to_x, to_y)
+                    if 1 <= to_x <= size and 1 <= to_y <= size:
+                        on_board += 1
+                        assert encoding.on_board[index]
+                        assert encoding.encode(action) == index
+                    else:
+                        assert not encoding.on_board[index]
+    assert on_board == np.count_nonzero(encoding.on_board) == np.count_nonzero(encoding.indices >= 0)
+    assert encoding.encode(((1, 1), (2, 2))) == -1
+    assert action_encoding(size) is encoding
+
+
+# the legal action mask is the set of valid actions of both engines along random games, for both players
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_legal_action_mask(size):
+    encoding = action_encoding(size)
+    rng = random.Random(size)
+    for game in range(GAMES_PER_SIZE):
+        board = HnefataflBoard(size)
+        board.print_to_console = False
+        player = Player.black
+        for turn in range(MAX_TURNS):
+            for mask_player in (other_player(player), player):
+                actions = board.get_valid_actions(mask_player)
+                for engine in (board, BitboardHnefataflBoard.from_board(board)):
+                    mask = encoding.legal_action_mask(engine, mask_player)
+                    assert mask.shape == (encoding.number_of_actions,) and mask.dtype == bool
+                    assert sorted(encoding.decode(index) for index in np.flatnonzero(mask)) == sorted(actions)
+            if board.outcome != Outcome.ongoing:
+                break
+            board.do_action(rng.choice(actions), player)
+            player = other_player(player)
+
+        boards = np.stack([board.board, HnefataflBoard(size).board])
+        masks = encoding.legal_move_masks(boards, [player, Player.black])
+        assert masks.shape == (2,) + encoding.shape
+        assert np.array_equal(masks[0].ravel(), encoding.legal_action_mask(board, player))
+
+
+# the env takes action indices, and a player without moves loses like on the board, with the same message
+def test_env_without_moves(capsys):
+    env = HnefataflEnv(7)
+    action = env.get_valid_actions()[0]
+    env.step(env.action_encoding.encode(action))
+    assert env.turn_player() == Player.white
+    assert env._hnefatafl.action_stack[-1][0] == action
+
+    # the king is blocked by three black soldiers and the border and is the only white piece
+    board = env._hnefatafl
+    grid = board.board
+    grid[(grid == TileState.white) | (grid == TileState.black) | (grid == TileState.king)] = TileState.empty
+    grid[4, 4] = TileState.throne
+    grid[1, 4] = TileState.king
+    for position in ((2, 4), (1, 3), (1, 5)):
+        grid[position] = TileState.black
+    board.update_board_states()
+    board.king_position = (1, 4)
+    env._legal_action_mask = None
+    capsys.readouterr()
+    env.check_valid_actions()
+    assert board.outcome == Outcome.black
+    assert "can't make any moves" in capsys.readouterr().out
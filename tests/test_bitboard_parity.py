@@ -0,0 +1,121 @@
+import random
+
+import numpy as np
+import pytest
+
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
+from gym_hnefatafl.envs.board import HnefataflBoard, Player, Outcome, TileState
+
+GAMES_PER_SIZE = 6
+MAX_TURNS = 300
+
+
+# returns the opponent of the given player
+def other_player(player):
+    return Player.white if player == Player.black else Player.black
+
+
+# asserts that both engines are in the same position
+def assert_same_position(board, bitboard):
+    assert np.array_equal(board.board, bitboard.board)
+    assert np.array_equal(board.move_board, bitboard.move_board)
+    assert np.array_equal(board.player_board, bitboard.player_board)
+    assert tuple(int(i) for i in board.king_position) == tuple(bitboard.king_position)
+    assert (board.white_pieces, board.black_pieces) == (bitboard.white_pieces, bitboard.black_pieces)
+    assert board.outcome == bitboard.outcome
+    assert board.turns_without_capture_count == bitboard.turns_without_capture_count
+    assert board.zobrist_key == bitboard.zobrist_key
+
+
+# plays random games on both engines and compares the valid actions, the captures, the positions and the outcomes
+# after every action, then undoes all actions and compares the positions again
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_random_games(size):
+    rng = random.Random(size)
+    for game in range(GAMES_PER_SIZE):
+        board = HnefataflBoard(size)
+        board.print_to_console = False
+        bitboard = BitboardHnefataflBoard(size)
+        player = Player.black
+        for turn in range(MAX_TURNS):
+            if board.outcome != Outcome.ongoing:
+                break
+            actions = board.get_valid_actions(player)
+            assert sorted(actions) == sorted(bitboard.get_valid_actions(player))
+            assert board.outcome == bitboard.outcome
+            if not actions:
+                break
+            assert board.has_any_move(player) and bitboard.has_any_move(player)
+            assert board.count_moves(player) == bitboard.count_moves(player) == len(actions)
+            action = rng.choice(actions)
+            assert sorted(board.do_action(action, player)) == sorted(bitboard.do_action(action, player))
+            assert_same_position(board, bitboard)
+            player = other_player(player)
+
+        while board.action_stack:
+            board.undo_last_action()
+            bitboard.undo_last_action()
+            assert_same_position(board, bitboard)
+        assert not bitboard.action_stack
+        assert_same_position(HnefataflBoard(size), bitboard)
+
+
+# the grids of the bitboard engine are cached per position and must follow actions and undos
+def test_cached_grids_follow_the_position():
+    bitboard = BitboardHnefataflBoard(11)
+    start_move_board = bitboard.move_board.copy()
+    start_player_board = bitboard.player_board.copy()
+    assert bitboard.move_board is bitboard.move_board
+    action = bitboard.get_valid_actions(Player.black)[0]
+    bitboard.do_action(action, Player.black)
+    assert not np.array_equal(bitboard.move_board, start_move_board)
+    assert not np.array_equal(bitboard.player_board, start_player_board)
+    bitboard.undo_last_action()
+    assert np.array_equal(bitboard.move_board, start_move_board)
+    assert np.array_equal(bitboard.player_board, start_player_board)
+
+
+# returns a 7x7 board on which the white king, the only white piece, is blocked by three black soldiers and the
+# border, with white to move
+def blocked_king_board():
+    board = HnefataflBoard(7)
+    grid = board.board.copy()
+    grid[(grid == TileState.white) | (grid == TileState.black) | (grid == TileState.king)] = TileState.empty
+    grid[4, 4] = TileState.throne
+    grid[1, 4] = TileState.king
+    for position in ((2, 4), (1, 3), (1, 5)):
+        grid[position] = TileState.black
+    grid[5, 5] = TileState.black
+    return HnefataflBoard.from_position((7, grid.astype(np.int8).tobytes(), (1, 4), 1, 4, 10, 0, int(Outcome.ongoing),
+                                         board.zobrist.position_key(grid, Player.white), {}))
+
+
+# has_any_move finds a player without moves on both engines without ending the game
+def test_has_any_move_without_moves():
+    board = blocked_king_board()
+    for engine in (board, BitboardHnefataflBoard.from_board(board)):
+        assert not engine.has_any_move(Player.white)
+        assert engine.count_moves(Player.white) == 0
+        assert engine.has_any_move(Player.black)
+        assert engine.outcome == Outcome.ongoing
+        assert engine.get_valid_actions(Player.white) == []
+        assert engine.outcome == Outcome.black
+
+
+# a clone with history shares the entries of the undo stacks and undoes back to the start without changing the
+# board, a clone without history can not undo the actions before it
+def test_clone_history():
+    for engine in (HnefataflBoard(9), BitboardHnefataflBoard(9)):
+        engine.print_to_console = False
+        player = Player.black
+        for _ in range(6):
+            engine.do_action(engine.get_valid_actions(player)[0], player)
+            player = other_player(player)
+        position = engine.get_position()
+        clone = engine.clone()
+        assert clone.action_stack[-1] is engine.action_stack[-1]
+        while clone.action_stack:
+            clone.undo_last_action()
+        assert clone.get_position() == HnefataflBoard(9).get_position()
+        assert engine.get_position() == position and len(engine.action_stack) == 6
+        assert not engine.clone(history=False).action_stack
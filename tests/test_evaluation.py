@@ -0,0 +1,317 @@
+import itertools
+import math
+import random
+
+import numpy as np
+import pytest
+
+from gym_hnefatafl.agents.evaluation import IncrementalEvaluator, king_ratings, quick_evaluate, \
+    king_turns_to_corner, KING_TURNS_TO_CORNER_WEIGHT, KING_TURNS_TO_CORNER_EXP_BASE, Area, area_masks, \
+    number_of_pieces, board_presence_rating, board_presence_ratings, KING_BONUS_FACTOR, AREA_FACTOR, \
+    covered_angle_rating, covered_angle_tables, calculate_angle_intervals, ANGLE_CALCULATION_ORDER_3, \
+    ANGLE_INTERVALS_3, COVERED_ANGLE_WEIGHT, evaluate, evaluate_actions, superiority_rating, superiority_ratings, \
+    king_in_trouble_rating, king_in_trouble_ratings, covered_angle_ratings, same_axis_as_king_rating, \
+    same_axis_as_king_ratings, king_turns_to_corner_ratings
+from gym_hnefatafl.envs.action_encoding import DIRECTIONS
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
+from gym_hnefatafl.envs.board import HnefataflBoard, Player, Outcome, TileState
+
+GAMES_PER_SIZE = 3
+MAX_TURNS = 200
+ACTIONS_PER_TURN = 4
+POSITIONS_PER_SIZE = 60
+
+
+# returns the opponent of the given player
+def other_player(player):
+    return Player.white if player == Player.black else Player.black
+
+
+# returns a board of the engine "engine" that does not print to the console
+def new_board(engine, size):
+    board = engine(size)
+    board.print_to_console = False
+    return board
+
+
+# returns positions (HnefataflBoard) of random games on a board of size "size", with the players to move
+def random_positions(size, number_of_positions, seed):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < number_of_positions:
+        board = new_board(HnefataflBoard, size)
+        player = Player.black
+        for turn in range(MAX_TURNS):
+            actions = board.get_valid_actions(player)
+            if board.outcome != Outcome.ongoing or len(positions) == number_of_positions:
+                break
+            board.do_action(rng.choice(actions), player)
+            player = other_player(player)
+            if board.outcome == Outcome.ongoing:
+                positions.append((board.clone(), player))
+    return positions
+
+
+# returns a board of size "size" with only the king at "king_position" and black soldiers at "black_positions"
+def sparse_board(size, king_position, black_positions):
+    board = new_board(HnefataflBoard, size)
+    grid = board.board
+    grid[(grid == TileState.white) | (grid == TileState.black) | (grid == TileState.king)] = TileState.empty
+    throne = (size + 1) // 2
+    grid[throne, throne] = TileState.throne
+    grid[king_position] = TileState.king
+    for position in black_positions:
+        grid[position] = TileState.black
+    board.update_board_states()
+    board.king_position = king_position
+    board.white_pieces = 1
+    board.black_pieces = len(black_positions)
+    board.zobrist_key = board.zobrist.position_key(grid, Player.black)
+    return board
+
+
+# the number of king moves to the nearest corner by a breadth-first search forwards from the king (None if the king
+# can not reach a corner). Soldiers and the border block the king, the throne does not
+def reference_turns_to_corner(board):
+    grid = board.board
+    size = board.size
+    corners = {(1, 1), (1, size), (size, 1), (size, size)}
+    king_position = tuple(int(i) for i in board.king_position)
+    if king_position in corners:
+        return 0
+    reached = {king_position}
+    frontier = [king_position]
+    turns = 0
+    while frontier:
+        turns += 1
+        next_frontier = []
+        for x, y in frontier:
+            for direction_x, direction_y in DIRECTIONS:
+                to_x, to_y = x + direction_x, y + direction_y
+                while grid[to_x, to_y] in (TileState.empty, TileState.throne, TileState.corner):
+                    if (to_x, to_y) in corners:
+                        return turns
+                    if (to_x, to_y) not in reached:
+                        reached.add((to_x, to_y))
+                        next_frontier.append((to_x, to_y))
+                    to_x, to_y = to_x + direction_x, to_y + direction_y
+        frontier = next_frontier
+    return None
+
+
+# returns the rating of king_turns_to_corner for "turns" king moves to a corner (None for no way)
+def turns_to_corner_rating(turns):
+    return 0 if turns is None else -KING_TURNS_TO_CORNER_WEIGHT*KING_TURNS_TO_CORNER_EXP_BASE**(-turns)
+
+
+# king_turns_to_corner counts the king moves to the nearest corner (soldiers block, the throne does not), on fixed
+# boards and along random games, also when the cached distance field of the soldiers is reused after king moves
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_king_turns_to_corner(size):
+    assert king_turns_to_corner(new_board(HnefataflBoard, size)) == 0
+    assert king_turns_to_corner(sparse_board(size, (1, 3), [])) == turns_to_corner_rating(1)
+    assert king_turns_to_corner(sparse_board(size, (1, 3), [(1, 2), (1, 4)])) == turns_to_corner_rating(2)
+    assert king_turns_to_corner(sparse_board(size, (1, 3), [(1, 2), (1, 4), (size, 3)])) \
+        == turns_to_corner_rating(3)
+    assert king_turns_to_corner(sparse_board(size, (2, 2), [(1, 2), (3, 2), (2, 1), (2, 3)])) \
+        == turns_to_corner_rating(None)
+    throne = (size + 1) // 2
+    assert king_turns_to_corner(sparse_board(size, (throne, throne), [])) == turns_to_corner_rating(2)
+    # the only way leads over the throne
+    assert king_turns_to_corner(sparse_board(size, (throne, 2), [(throne, 1), (throne - 1, 2), (throne + 1, 2)])) \
+        == turns_to_corner_rating(2)
+    for board, player in random_positions(size, POSITIONS_PER_SIZE, size):
+        for engine in (board, BitboardHnefataflBoard.from_board(board)):
+            assert king_turns_to_corner(engine) == turns_to_corner_rating(reference_turns_to_corner(board))
+
+
+# the king ratings of the IncrementalEvaluator must match the ratings computed from scratch after every action and
+# every undo along random games, also for actions that are undone again right away (like in a search)
+@pytest.mark.parametrize("engine", [HnefataflBoard, BitboardHnefataflBoard])
+@pytest.mark.parametrize("size", [7, 11])
+def test_incremental_evaluator(engine, size):
+    rng = random.Random(size)
+    for game in range(GAMES_PER_SIZE):
+        board = new_board(engine, size)
+        board.evaluator = IncrementalEvaluator()
+        player = Player.black
+        for turn in range(MAX_TURNS):
+            actions = board.get_valid_actions(player)
+            if board.outcome != Outcome.ongoing:
+                break
+            for action in rng.sample(actions, min(ACTIONS_PER_TURN, len(actions))):
+                board.do_action(action, player)
+                assert board.evaluator.king_ratings(board) == king_ratings(board)
+                board.undo_last_action()
+                assert board.evaluator.king_ratings(board) == king_ratings(board)
+            board.do_action(rng.choice(actions), player)
+            player = other_player(player)
+            scratch_board = board.clone()
+            assert scratch_board.evaluator is None
+            assert quick_evaluate(board, player) == quick_evaluate(scratch_board, player)
+
+        while board.action_stack:
+            board.undo_last_action()
+            assert board.evaluator.king_ratings(board) == king_ratings(board)
+        assert not board.evaluator.stack
+
+
+# the tiles of the areas of the 11x11 board before the areas were generalized to all board sizes
+def reference_area_indices(area):
+    bands = (range(1, 5), range(5, 8), range(8, 12))
+    return itertools.product(bands[area // 3], bands[area % 3])
+
+
+# board_presence_rating computed area by area with the tiles of the areas, like before the area masks
+def reference_board_presence_rating(board, area_indices):
+    total_value = 0
+    for area in Area:
+        black = sum(1 for tile in area_indices(area) if board.board[tile] == TileState.black)
+        white = sum(1 for tile in area_indices(area) if board.board[tile] == TileState.white)
+        area_value = max(min(black - white / 2, 1), -1)
+        if tuple(board.king_position) in set(area_indices(area)):
+            area_value *= KING_BONUS_FACTOR
+        total_value += area_value * AREA_FACTOR[area]
+    return total_value
+
+
+# the areas split every board size into 3 x 3 rectangles with a middle band around the throne. On 11x11 they are the
+# areas of the hardcoded 4, 3, 4 bands
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_area_masks(size):
+    masks = area_masks(size)
+    tiles = [set(area.indices(size)) for area in Area]
+    assert sum(len(area_tiles) for area_tiles in tiles) == size * size
+    assert set().union(*tiles) == set(itertools.product(range(1, size + 1), repeat=2))
+    throne = (size + 1) // 2
+    assert (throne, throne) in tiles[Area.middle]
+    for area in Area:
+        mirrored_area = Area(3 * (area // 3) + 2 - area % 3)
+        assert tiles[mirrored_area] == {(x, size + 1 - y) for x, y in tiles[area]}
+        assert tiles[Area(3 * (area % 3) + area // 3)] == {(y, x) for x, y in tiles[area]}
+    assert np.all(masks.one_hot.sum(axis=1) == (masks.labels.ravel() < len(Area)))
+    if size == 11:
+        for area in Area:
+            assert tiles[area] == set(reference_area_indices(area))
+
+
+# the area counts and board_presence_rating match the area by area computation on both engines along random games,
+# also for a stack of boards
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_board_presence_rating(size):
+    positions = random_positions(size, POSITIONS_PER_SIZE, size)
+    for board, player in positions:
+        area_indices = reference_area_indices if size == 11 else lambda area: area.indices(size)
+        expected = reference_board_presence_rating(board, area_indices)
+        for engine in (board, BitboardHnefataflBoard.from_board(board)):
+            assert board_presence_rating(engine) == pytest.approx(expected, abs=1e-12)
+            for area in Area:
+                assert number_of_pieces(engine, area) \
+                    == (sum(1 for tile in area_indices(area) if board.board[tile] == TileState.black),
+                        sum(1 for tile in area_indices(area) if board.board[tile] == TileState.white))
+    boards = np.stack([board.board for board, player in positions])
+    assert np.allclose(board_presence_ratings(boards), [board_presence_rating(board) for board, player in positions],
+                       rtol=0, atol=1e-12)
+
+
+# the angle that the union of the intervals of the black pieces around the king covers, by sorting and merging the
+# intervals (the ones that cross over 0 are split)
+def reference_covered_angle(board):
+    if not ANGLE_INTERVALS_3:
+        calculate_angle_intervals()
+    king_x, king_y = board.king_position
+    intervals = []
+    for (relative_x, relative_y), (right, left) in zip(ANGLE_CALCULATION_ORDER_3, ANGLE_INTERVALS_3):
+        x, y = king_x + relative_x, king_y + relative_y
+        if 1 <= x <= board.size and 1 <= y <= board.size and board.board[x, y] == TileState.black:
+            if right > left:
+                intervals += [(right, 2 * math.pi), (0, left)]
+            else:
+                intervals.append((right, left))
+    covered_angle = 0
+    end = 0
+    for right, left in sorted(intervals):
+        covered_angle += max(left, end) - max(right, end)
+        end = max(end, left)
+    return covered_angle
+
+
+# covered_angle_rating for the covered angle "covered_angle"
+def covered_angle_value(covered_angle):
+    return -covered_angle * COVERED_ANGLE_WEIGHT / (2 * math.pi)
+
+
+# The covered angle tables give the exact union of the intervals of the black pieces around the king: for single
+# pieces, for pieces on both sides of 0, for a full ring, for kings at the edge and along random games
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_covered_angle_rating(size):
+    tables = covered_angle_tables(size)
+    throne = (size + 1) // 2
+    assert covered_angle_rating(sparse_board(size, (throne, throne), [])) == 0
+    for square, (relative_x, relative_y) in enumerate(ANGLE_CALCULATION_ORDER_3):
+        board = sparse_board(size, (throne, throne), [(throne + relative_x, throne + relative_y)])
+        right, left = ANGLE_INTERVALS_3[square]
+        width = left - right if right <= left else left + 2 * math.pi - right
+        assert covered_angle_rating(board) == pytest.approx(covered_angle_value(width), abs=1e-12)
+    # both squares next to the king on the axis through angle 0 cover a quarter of the circle each
+    board = sparse_board(size, (throne, throne), [(throne + 1, throne), (throne - 1, throne)])
+    assert covered_angle_rating(board) == pytest.approx(covered_angle_value(math.pi), abs=1e-12)
+    ring = [(throne + relative_x, throne + relative_y) for relative_x, relative_y in ANGLE_CALCULATION_ORDER_3]
+    assert covered_angle_rating(sparse_board(size, (throne, throne), ring)) \
+        == pytest.approx(covered_angle_value(2 * math.pi), abs=1e-12)
+
+    rng = random.Random(size)
+    for _ in range(POSITIONS_PER_SIZE):
+        king_position = (rng.randint(1, size), rng.randint(1, size))
+        black_positions = [tile for tile in itertools.product(range(1, size + 1), repeat=2)
+                           if tile != king_position and rng.random() < 0.3]
+        board = sparse_board(size, king_position, black_positions)
+        assert covered_angle_rating(board) == pytest.approx(covered_angle_value(reference_covered_angle(board)),
+                                                            abs=1e-12)
+    for board, player in random_positions(size, POSITIONS_PER_SIZE, size):
+        expected = covered_angle_value(reference_covered_angle(board))
+        for engine in (board, BitboardHnefataflBoard.from_board(board)):
+            assert covered_angle_rating(engine) == pytest.approx(expected, abs=1e-12)
+    assert tables.tables.min() >= 0 and tables.tables.reshape(4, -1).max(axis=1) == pytest.approx([math.pi / 2] * 4)
+
+
+# every batched rating matches the rating of each board of the stack
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_batched_ratings(size):
+    positions = random_positions(size, POSITIONS_PER_SIZE, size + 1)
+    boards = np.stack([board.board for board, player in positions])
+    king_positions = np.array([board.king_position for board, player in positions])
+    for batched_rating, rating in ((lambda boards, kings: superiority_ratings(boards), superiority_rating),
+                                   (king_in_trouble_ratings, king_in_trouble_rating),
+                                   (covered_angle_ratings, covered_angle_rating),
+                                   (same_axis_as_king_ratings, same_axis_as_king_rating),
+                                   (king_turns_to_corner_ratings, king_turns_to_corner)):
+        ratings = batched_rating(boards, king_positions)
+        assert ratings.shape == (len(positions),)
+        assert np.allclose(ratings, [rating(board) for board, player in positions], rtol=0, atol=1e-12)
+
+
+# evaluate_actions gives the evaluation of doing each action, evaluating the board and undoing the action again,
+# including finished games, and leaves the board unchanged
+@pytest.mark.parametrize("engine", [HnefataflBoard, BitboardHnefataflBoard])
+@pytest.mark.parametrize("size", [7, 11])
+def test_evaluate_actions(engine, size):
+    positions = random_positions(size, POSITIONS_PER_SIZE // 3, size + 2)
+    # the king can escape, black can capture the king
+    positions.append((sparse_board(size, (1, 3), [(2, 2), (3, 3)]), Player.white))
+    positions.append((sparse_board(size, (2, 3), [(1, 3), (2, 2), (2, 4), (3, 1)]), Player.black))
+    for board, player in positions:
+        if engine == BitboardHnefataflBoard:
+            board = BitboardHnefataflBoard.from_board(board)
+        grid = board.board.copy()
+        actions = board.get_valid_actions(player)
+        for quick, evaluation in ((True, quick_evaluate), (False, evaluate)):
+            expected = []
+            for action in actions:
+                board.do_action(action, player)
+                expected.append(evaluation(board, player))
+                board.undo_last_action()
+            assert np.allclose(evaluate_actions(board, actions, player, quick), expected, rtol=0, atol=1e-12)
+            assert np.array_equal(board.board, grid) and board.outcome == Outcome.ongoing
+    for (board, player), value in zip(positions[-2:], (math.inf, -math.inf)):
+        assert value in evaluate_actions(board, board.get_valid_actions(player), player)
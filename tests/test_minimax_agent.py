@@ -0,0 +1,197 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from gym_hnefatafl.agents import minimax_agent
+from gym_hnefatafl.agents.minimax_agent import MinimaxAgent
+from gym_hnefatafl.agents.move_ordering import MoveOrdering, NUMBER_OF_KILLER_MOVES
+from gym_hnefatafl.agents.transposition_table import TranspositionTable, Bound, encode_move, decode_move
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
+from gym_hnefatafl.envs.board import HnefataflBoard, Player, Outcome, TileState
+
+# returns the opponent of the given player
+def other_player(player):
+    return Player.white if player == Player.black else Player.black
+
+
+# returns a bitboard engine after "turns" random actions, and the player to move
+def random_position(size, turns, seed):
+    rng = random.Random(seed)
+    board = BitboardHnefataflBoard(size)
+    player = Player.black
+    for _ in range(turns):
+        actions = board.get_valid_actions(player)
+        if board.outcome != Outcome.ongoing:
+            break
+        board.do_action(rng.choice(actions), player)
+        player = other_player(player)
+    return board, player
+
+
+# returns (grid, Zobrist key, number of actions on the stack) to check that a search left the board unchanged
+def snapshot(board):
+    return board.board.copy(), board.zobrist_key, len(board.action_stack)
+
+
+def assert_unchanged(board, position):
+    grid, zobrist_key, number_of_actions = position
+    assert np.array_equal(board.board, grid)
+    assert board.zobrist_key == zobrist_key and len(board.action_stack) == number_of_actions
+
+
+# both searches evaluate the leaves with the full evaluate
+@pytest.fixture(autouse=True)
+def full_evaluation(monkeypatch):
+    monkeypatch.setattr(minimax_agent, "EVALUATION_METHOD", 0)
+
+
+# returns the value of a plain minimax search "depth" plies deep
+def minimax_value(board, player, depth):
+    agent = MinimaxAgent(player)
+    agent.search_depth = depth
+    return agent.minimax_search(board, player, 0)[1]
+
+
+# alphabeta with transposition table and move ordering finds the minimax value, also when the table and the
+# move ordering are kept from the previous search like between the moves of a game, and without ordering
+@pytest.mark.parametrize("size, depth, number_of_positions", [(7, 2, 4), (7, 3, 1), (9, 2, 4), (11, 2, 2)])
+def test_alphabeta_matches_minimax(size, depth, number_of_positions):
+    for seed in range(number_of_positions):
+        board, player = random_position(size, 4 + 2 * seed, seed)
+        position = snapshot(board)
+        value = minimax_value(board, player, depth)
+        agent = MinimaxAgent(player, transposition_table_size_mb=1)
+        agent.search_depth = depth
+        for _ in range(2):
+            agent.transposition_table.new_search()
+            agent.move_ordering.new_search()
+            action, alphabeta_value = agent.alphabeta(board, 0, -math.inf, math.inf, player)
+            assert alphabeta_value == value
+            assert_unchanged(board, position)
+            board.do_action(action, player)
+            assert minimax_value(board, other_player(player), depth - 1) == value
+            board.undo_last_action()
+        assert agent.transposition_table.hits > 0
+
+        unordered_agent = MinimaxAgent(player, transposition_table_size_mb=1)
+        unordered_agent.search_depth = depth
+        unordered_agent.move_ordering.order = lambda board, actions, *arguments: actions
+        assert unordered_agent.alphabeta(board, 0, -math.inf, math.inf, player)[1] == value
+
+
+# a node budget interrupts the iterative deepening, which returns the result of the deepest completed iteration
+# and reverts the actions of the interrupted one
+@pytest.mark.parametrize("node_budget", [200, 1000, 4000])
+def test_iterative_deepening_node_budget(node_budget):
+    board, player = random_position(9, 6, node_budget)
+    position = snapshot(board)
+    agent = MinimaxAgent(player, transposition_table_size_mb=1)
+    action, value = agent.iterative_deepening(board, player, node_budget=node_budget)
+    assert_unchanged(board, position)
+    assert agent.completed_depth >= 1 and agent.nodes > node_budget
+    assert agent.deadline is None and agent.node_limit is None
+    assert value == minimax_value(board, player, agent.completed_depth)
+    assert agent.principal_variation[0] == action
+    assert action in board.get_valid_actions(player)
+
+
+# an exhausted time budget returns no result, make_move then still returns a valid action
+def test_iterative_deepening_time_budget():
+    board, player = random_position(11, 6, 0)
+    position = snapshot(board)
+    agent = MinimaxAgent(player, transposition_table_size_mb=1)
+    assert agent.iterative_deepening(board, player, time_budget=0) == (None, None)
+    assert agent.completed_depth == 0
+    assert_unchanged(board, position)
+    assert agent.make_move(board, time_budget=0) in board.get_valid_actions(player)
+    assert agent.make_move(board, time_budget=0.5) in board.get_valid_actions(player)
+    assert agent.completed_depth >= 1
+    assert_unchanged(board, position)
+
+
+def test_transposition_table_store_and_probe():
+    table = TranspositionTable(1)
+    assert table.memory_usage() <= 2**20
+    move = ((1, 2), (1, 9))
+    assert decode_move(encode_move(move)) == move and decode_move(encode_move(None)) is None
+    assert table.probe(12345) is None
+    table.store(12345, 3, 1.5, Bound.lower, move)
+    table.store(777, 0, -math.inf, Bound.exact, None)
+    assert table.probe(12345) == (3, 1.5, Bound.lower, move)
+    assert table.probe(777) == (0, -math.inf, Bound.exact, None)
+    table.store(12345, 2, 0.5, Bound.upper, None)
+    assert table.probe(12345) == (2, 0.5, Bound.upper, None)
+    assert (table.hits, table.misses) == (3, 1)
+    table.clear()
+    assert table.probe(12345) is None and (table.hits, table.misses) == (0, 1)
+
+
+# The first entry of a bucket keeps the deepest result of the current search, the second one is always replaced.
+# Results of older searches are replaced first
+def test_transposition_table_replacement():
+    table = TranspositionTable(1)
+    buckets = table.number_of_buckets
+    deep, shallow, other, deeper = 5, 5 + buckets, 5 + 2 * buckets, 5 + 3 * buckets
+    table.store(deep, 4, 4.0, Bound.exact, None)
+    table.store(shallow, 1, 1.0, Bound.exact, None)
+    assert table.probe(deep)[1] == 4.0 and table.probe(shallow)[1] == 1.0
+    # the always-replace entry gives way, the deepest result stays
+    table.store(other, 2, 2.0, Bound.exact, None)
+    assert table.probe(shallow) is None and table.collisions == 1
+    assert table.probe(deep)[1] == 4.0 and table.probe(other)[1] == 2.0
+    # a deeper result takes the first entry, the former deepest result moves to the second one
+    table.store(deeper, 6, 6.0, Bound.exact, None)
+    assert table.probe(deeper)[1] == 6.0 and table.probe(deep)[1] == 4.0 and table.probe(other) is None
+    # in a new search, the deepest result of the last search is replaced by a shallower one
+    table.new_search()
+    table.store(other, 0, 0.0, Bound.exact, None)
+    assert table.probe(other)[1] == 0.0 and table.probe(deeper)[1] == 6.0 and table.probe(deep) is None
+    assert table.keys[2 * (other % buckets)] == other
+
+
+# returns a 7x7 board with black to move on which black can capture a white soldier and the king can escape
+def ordering_board():
+    board = HnefataflBoard(7)
+    grid = board.board.copy()
+    grid[(grid == TileState.white) | (grid == TileState.black) | (grid == TileState.king)] = TileState.empty
+    grid[4, 4] = TileState.throne
+    grid[1, 4] = TileState.king
+    grid[4, 2] = TileState.white
+    grid[4, 1] = TileState.black
+    grid[6, 3] = TileState.black
+    grid[6, 6] = TileState.black
+    return HnefataflBoard.from_position((7, grid.astype(np.int8).tobytes(), (1, 4), 2, 3, 10, 0,
+                                         int(Outcome.ongoing), board.zobrist.position_key(grid, Player.black), {}))
+
+
+# preferred moves come first, then king escapes, captures and king moves to the edge, then killer moves and the
+# other moves by history score
+def test_move_ordering():
+    board = ordering_board()
+    ordering = MoveOrdering()
+    white_actions = board.get_valid_actions(Player.white)
+    escape = ((1, 4), (1, 1))
+    assert ordering.order(board, white_actions, Player.white, 0)[0] == escape
+    preferred = ((4, 2), (7, 2))
+    assert ordering.order(board, white_actions, Player.white, 0, (None, preferred))[:2] == [preferred, escape]
+
+    black_actions = board.get_valid_actions(Player.black)
+    capture = ((6, 3), (4, 3))
+    assert board.count_captures(capture, Player.black) == 1
+    quiet_actions = [action for action in black_actions if action != capture]
+    killer, history_move = quiet_actions[-1], quiet_actions[-2]
+    ordering.update(board, capture, Player.black, 1, 2)
+    assert not ordering.killer_moves and not ordering.history
+    ordering.update(board, history_move, Player.black, 0, 3)
+    ordering.update(board, killer, Player.black, 1, 1)
+    ordered = ordering.order(board, black_actions, Player.black, 1)
+    assert ordered[:3] == [capture, killer, history_move]
+    assert sorted(ordered) == sorted(black_actions)
+
+    for action in quiet_actions[:NUMBER_OF_KILLER_MOVES + 1]:
+        ordering.update(board, action, Player.black, 1, 1)
+    assert ordering.killer_moves[1] == quiet_actions[NUMBER_OF_KILLER_MOVES:0:-1]
+    ordering.new_search()
+    assert not ordering.killer_moves and ordering.history[(Player.black, history_move)] == 4
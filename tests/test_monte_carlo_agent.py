@@ -0,0 +1,34 @@
+import numpy as np
+
+from gym_hnefatafl.agents.monte_carlo_agent import Tree
+from gym_hnefatafl.envs.board import HnefataflBoard, Player, Outcome, TileState
+
+SIMULATIONS = 40
+
+
+# returns a 7x7 board without history on which the white king can escape to a corner with white to move
+def escape_board():
+    board = HnefataflBoard(7)
+    grid = board.board.copy()
+    grid[(grid == TileState.white) | (grid == TileState.black) | (grid == TileState.king)] = TileState.empty
+    grid[4, 4] = TileState.throne
+    grid[1, 4] = TileState.king
+    grid[5, 5] = TileState.black
+    grid[6, 3] = TileState.black
+    return HnefataflBoard.from_position((7, grid.astype(np.int8).tobytes(), (1, 4), 1, 2, 10, 0, int(Outcome.ongoing),
+                                         board.zobrist.position_key(grid, Player.white), {}))
+
+
+# once the root is expanded, the escape ends the game within the tree at a child that has not played an action.
+# Backing up must undo only the actions played within the tree
+def test_simulate_game_with_terminal_node():
+    np.random.seed(0)
+    board = escape_board()
+    position = board.get_position()
+    tree = Tree(board, Player.white)
+    for _ in range(SIMULATIONS):
+        tree.simulate_game()
+    escape = tree.nodes.child(tree.root, ((1, 4), (1, 1)))
+    assert escape >= 0
+    assert tree.nodes.visits[tree.root] == SIMULATIONS
+    assert board.get_position() == position
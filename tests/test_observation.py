@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+import pytest
+
+from gym_hnefatafl.envs import HnefataflEnv
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
+from gym_hnefatafl.envs.board import HnefataflBoard, Player, Outcome, TileState
+from gym_hnefatafl.envs.observation import ObservationEncoder, BLACK_PLANE, WHITE_PLANE, KING_PLANE, THRONE_PLANE, \
+    CORNERS_PLANE, SIDE_TO_MOVE_PLANE, REPETITIONS_PLANE
+
+MAX_TURNS = 120
+
+
+# returns the opponent of the given player
+def other_player(player):
+    return Player.white if player == Player.black else Player.black
+
+
+# rebuilds the tile state grid without border from the planes of an observation
+def decode_planes(observation, size):
+    grid = np.full((size, size), TileState.empty)
+    grid[observation[THRONE_PLANE] == 1] = TileState.throne
+    grid[observation[CORNERS_PLANE] == 1] = TileState.corner
+    grid[observation[BLACK_PLANE] == 1] = TileState.black
+    grid[observation[WHITE_PLANE] == 1] = TileState.white
+    grid[observation[KING_PLANE] == 1] = TileState.king
+    return grid
+
+
+# the planes encode the grid, the side to move and the repetitions of the position on both engines along a random
+# game, and the observations are in the observation space
+@pytest.mark.parametrize("size", [7, 11])
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32])
+def test_observation_planes(size, dtype):
+    encoder = ObservationEncoder(size, dtype, repetition_plane=True)
+    rng = random.Random(size)
+    board = HnefataflBoard(size)
+    board.print_to_console = False
+    player = Player.black
+    for turn in range(MAX_TURNS):
+        for engine in (board, BitboardHnefataflBoard.from_board(board)):
+            observation = encoder.encode(engine, player)
+            assert observation is encoder.buffer and observation.dtype == dtype
+            assert observation.shape == (REPETITIONS_PLANE + 1, size, size)
+            assert encoder.observation_space.contains(observation)
+            assert np.array_equal(decode_planes(observation, size), board.board[1:-1, 1:-1])
+            assert (observation[SIDE_TO_MOVE_PLANE] == (player == Player.white)).all()
+            assert (observation[REPETITIONS_PLANE] == board.board_states_dict[board.zobrist_key]).all()
+        actions = board.get_valid_actions(player)
+        if board.outcome != Outcome.ongoing:
+            break
+        board.do_action(rng.choice(actions), player)
+        player = other_player(player)
+
+    out = np.zeros_like(encoder.buffer)
+    assert encoder.encode(board, player, out) is out
+    assert np.array_equal(out, encoder.encode(board, player))
+    assert ObservationEncoder(size).encode(board, player).shape == (REPETITIONS_PLANE, size, size)
+
+
+# the env returns the observation of the position after the step, or itself without observation dtype
+def test_env_observation():
+    env = HnefataflEnv(9, np.uint8)
+    observation, _, _, _, _ = env.step(env.get_valid_actions()[0])
+    assert env.observation_space.contains(observation)
+    assert np.array_equal(decode_planes(observation, 9), env._hnefatafl.board[1:-1, 1:-1])
+    assert (observation[SIDE_TO_MOVE_PLANE] == 1).all()
+    assert HnefataflEnv(9).get_observation().size == 9
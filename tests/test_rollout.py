@@ -0,0 +1,101 @@
+import random
+from collections import Counter
+
+import pytest
+
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
+from gym_hnefatafl.envs.board import HnefataflBoard, Player, Outcome
+from gym_hnefatafl.envs.rollout import RolloutPosition, rollout
+
+ROLLOUTS_PER_SIZE = 10
+SAMPLES_PER_MOVE = 50
+
+
+# returns the opponent of the given player
+def other_player(player):
+    return Player.white if player == Player.black else Player.black
+
+
+# returns the (from index, to index) moves of the valid actions of "player" on a bitboard engine
+def valid_moves(bitboard, player):
+    geometry = bitboard.geometry
+    return {(geometry.index(from_position), geometry.index(to_position))
+            for from_position, to_position in bitboard.get_valid_actions(player)}
+
+
+# returns a HnefataflBoard after "turns" random actions, and the player to move
+def random_board(size, turns, seed):
+    rng = random.Random(seed)
+    board = HnefataflBoard(size)
+    board.print_to_console = False
+    player = Player.black
+    for _ in range(turns):
+        board.do_action(rng.choice(board.get_valid_actions(player)), player)
+        player = other_player(player)
+    return board, player
+
+
+# a rollout position created from a HnefataflBoard or from a bitboard engine is the same position
+def test_from_board():
+    board, player = random_board(11, 30, 0)
+    for position in (RolloutPosition.from_board(board, player),
+                     RolloutPosition.from_board(BitboardHnefataflBoard.from_board(board), player)):
+        assert (position.white, position.black, position.king) \
+            == BitboardHnefataflBoard.from_board(board).__bitboards_from_grid__(board.board)
+        assert position.king_position == tuple(int(i) for i in board.king_position)
+        assert (position.white_pieces, position.black_pieces, position.turn_count,
+                position.turns_without_capture_count, position.outcome, position.turn_player) \
+            == (board.white_pieces, board.black_pieces, board.turn_count, board.turns_without_capture_count,
+                board.outcome, player)
+
+
+# plays rollouts with random_move and the same moves on a bitboard engine. Every move must be valid and both must
+# be in the same position afterwards (until the bitboard engine ends the game by a threefold repetition, which
+# rollouts do not detect)
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_rollout_moves_are_valid(size):
+    random.seed(size)
+    for _ in range(ROLLOUTS_PER_SIZE):
+        bitboard = BitboardHnefataflBoard(size)
+        position = RolloutPosition.from_board(bitboard, Player.black)
+        while position.outcome == Outcome.ongoing:
+            player = position.turn_player
+            move = position.random_move()
+            moves = valid_moves(bitboard, player)
+            if move is None:
+                assert not moves
+                break
+            assert move in moves
+            position.play(*move)
+            geometry = bitboard.geometry
+            bitboard.do_action((geometry.coordinates[move[0]], geometry.coordinates[move[1]]), player)
+            if bitboard.outcome == Outcome.draw and position.outcome == Outcome.ongoing:
+                break
+            assert (position.white, position.black, position.king, position.turns_without_capture_count,
+                    position.outcome) \
+                == (bitboard.white, bitboard.black, bitboard.king, bitboard.turns_without_capture_count,
+                    bitboard.outcome)
+            # if the king moves between black pieces, the board engines count him as captured black piece
+            if position.outcome == Outcome.ongoing:
+                assert (position.white_pieces, position.black_pieces) \
+                    == (bitboard.white_pieces, bitboard.black_pieces)
+            assert position.turn_player == other_player(player)
+
+    position = RolloutPosition.from_board(BitboardHnefataflBoard(size), Player.black)
+    assert rollout(position.copy()) in (Outcome.white, Outcome.black, Outcome.draw)
+    assert rollout(position.copy(), max_plies=0) == Outcome.draw
+    assert position.turn_count == 0
+
+
+# random_move draws every valid move with the same probability: chi-squared test of the frequencies of the moves
+@pytest.mark.parametrize("turns", [0, 40])
+def test_random_move_is_uniform(turns):
+    random.seed(turns)
+    board, player = random_board(11, turns, turns)
+    position = RolloutPosition.from_board(board, player)
+    moves = valid_moves(BitboardHnefataflBoard.from_board(board), player)
+    counts = Counter(position.random_move() for _ in range(SAMPLES_PER_MOVE * len(moves)))
+    assert set(counts) == moves
+    chi_squared = sum((counts[move] - SAMPLES_PER_MOVE) ** 2 / SAMPLES_PER_MOVE for move in moves)
+    degrees_of_freedom = len(moves) - 1
+    assert chi_squared < degrees_of_freedom + 5 * (2 * degrees_of_freedom) ** 0.5
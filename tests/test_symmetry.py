@@ -0,0 +1,118 @@
+import random
+
+import numpy as np
+import pytest
+
+from gym_hnefatafl.envs.action_encoding import action_encoding
+from gym_hnefatafl.envs.bitboard import BitboardHnefataflBoard
+from gym_hnefatafl.envs.board import HnefataflBoard, Player, Outcome
+from gym_hnefatafl.envs.symmetry import NUMBER_OF_SYMMETRIES, symmetries, transform_grid
+
+POSITIONS_PER_SIZE = 4
+
+
+# returns the opponent of the given player
+def other_player(player):
+    return Player.white if player == Player.black else Player.black
+
+
+# returns a bitboard engine after "turns" random actions, and the player to move
+def random_position(size, turns, seed):
+    rng = random.Random(seed)
+    board = BitboardHnefataflBoard(size)
+    player = Player.black
+    for _ in range(turns):
+        actions = board.get_valid_actions(player)
+        if board.outcome != Outcome.ongoing:
+            break
+        board.do_action(rng.choice(actions), player)
+        player = other_player(player)
+    return board, player
+
+
+# returns a HnefataflBoard with the tile state grid "grid"
+def board_from_grid(grid):
+    board = HnefataflBoard(len(grid) - 2)
+    board.print_to_console = False
+    board.board = np.ascontiguousarray(grid).astype(np.int32)
+    board.update_board_states()
+    return board
+
+
+# the tile and action permutations are permutations, the inverses revert them, and the symmetries form the
+# dihedral group (closed under composition, 0 is the identity)
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_permutations(size):
+    tables = symmetries(size)
+    number_of_tiles = (size + 2) ** 2
+    tiles = np.arange(number_of_tiles)
+    actions = np.arange(action_encoding(size).number_of_actions)
+    assert np.array_equal(tables.tile_maps[0], tiles) and np.array_equal(tables.action_maps[0], actions)
+    for symmetry in range(NUMBER_OF_SYMMETRIES):
+        tile_map = tables.tile_maps[symmetry]
+        action_map = tables.action_maps[symmetry]
+        assert np.array_equal(np.sort(tile_map), tiles) and np.array_equal(np.sort(action_map), actions)
+        inverse = tables.inverses[symmetry]
+        assert np.array_equal(tables.tile_maps[inverse][tile_map], tiles)
+        assert np.array_equal(tables.action_maps[inverse][action_map], actions)
+        assert np.array_equal(action_map[tables.action_sources[symmetry]], actions)
+        for other in range(NUMBER_OF_SYMMETRIES):
+            assert any(np.array_equal(tables.tile_maps[other][tile_map], tables.tile_maps[composition])
+                       for composition in range(NUMBER_OF_SYMMETRIES))
+    grid = np.arange(number_of_tiles).reshape(size + 2, size + 2)
+    assert len({transform_grid(grid, symmetry).tobytes() for symmetry in range(NUMBER_OF_SYMMETRIES)}) == 8
+
+
+# Transforming a position transforms its moves: the transformed legal action mask is the mask of the transformed
+# board, and transform_action moves the start and the end of an action like transform_grid moves the tiles.
+# Policy vectors are moved along with their actions, also in batch
+@pytest.mark.parametrize("size", [7, 11])
+def test_legal_action_masks(size):
+    tables = symmetries(size)
+    encoding = action_encoding(size)
+    for seed in range(POSITIONS_PER_SIZE):
+        board, player = random_position(size, 10 * seed, seed)
+        grid = board.board
+        mask = encoding.legal_action_mask(board, player)
+        policy = np.random.RandomState(seed).rand(encoding.number_of_actions)
+        for symmetry in range(NUMBER_OF_SYMMETRIES):
+            transformed_grid = tables.transform_boards(grid, symmetry)
+            assert np.shares_memory(transformed_grid, grid)
+            transformed_mask = tables.transform_actions(mask, symmetry)
+            assert np.array_equal(transformed_mask,
+                                  encoding.legal_action_mask(board_from_grid(transformed_grid), player))
+            tile_map = tables.tile_maps[symmetry]
+            for index in np.flatnonzero(mask):
+                (from_x, from_y), (to_x, to_y) = encoding.decode(index)
+                new_from, new_to = encoding.decode(tables.transform_action(index, symmetry))
+                assert new_from == tuple(divmod(tile_map[from_x * (size + 2) + from_y], size + 2))
+                assert new_to == tuple(divmod(tile_map[to_x * (size + 2) + to_y], size + 2))
+                assert transformed_mask[tables.transform_action(index, symmetry)]
+            transformed_policy = tables.transform_actions(policy, symmetry)
+            assert np.array_equal(transformed_policy[tables.action_maps[symmetry]], policy)
+            batch = tables.transform_actions(np.stack([policy, mask]), symmetry)
+            assert np.array_equal(batch[0], transformed_policy) and np.array_equal(batch[1], transformed_mask)
+
+
+# all 8 transformations of a position have the same canonical key: the smallest key of the pieces of the
+# transformed boards, then with the key of the side to move. Symmetry 0 has the Zobrist key of the board, and the
+# returned symmetry leads to the canonical key
+@pytest.mark.parametrize("size", [7, 11])
+def test_canonical_keys(size):
+    tables = symmetries(size)
+    for seed in range(POSITIONS_PER_SIZE):
+        board, player = random_position(size, 10 * seed + 1, seed)
+        grid = board.board.astype(np.int8)
+        boards = np.stack([transform_grid(grid, symmetry) for symmetry in range(NUMBER_OF_SYMMETRIES)])
+        keys, key_symmetries = tables.canonical_keys(boards, [player] * NUMBER_OF_SYMMETRIES)
+        assert len(set(keys.tolist())) == 1
+
+        piece_keys = [board.zobrist.position_key(transformed_grid, Player.black) for transformed_grid in boards]
+        side_key = board.zobrist.white_to_move if player == Player.white else 0
+        key, symmetry = tables.canonical_keys(grid, player)
+        assert key == keys[0] == min(piece_keys) ^ side_key
+        assert piece_keys[symmetry] == min(piece_keys)
+        assert piece_keys[0] ^ side_key == board.zobrist_key
+        for transformed_grid, key_symmetry in zip(boards, key_symmetries):
+            assert board.zobrist.position_key(transform_grid(transformed_grid, key_symmetry), Player.black) \
+                == min(piece_keys)
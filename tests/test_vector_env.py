@@ -0,0 +1,81 @@
+import random
+
+import numpy as np
+import pytest
+
+from gym_hnefatafl.envs.board import HnefataflBoard, Player, Outcome
+from gym_hnefatafl.envs.vector_env import VectorHnefataflEnv
+
+NUMBER_OF_GAMES = 4
+FINISHED_GAMES_PER_SIZE = 6
+
+
+# returns the opponent of the given player
+def other_player(player):
+    return Player.white if player == Player.black else Player.black
+
+
+def new_board(size):
+    board = HnefataflBoard(size)
+    board.print_to_console = False
+    return board
+
+
+# the valid actions of a game as set of move tuples, read from the legal move mask of the env
+def mask_actions(env, game):
+    encoding = env.action_encoding
+    return {encoding.decode(index) for index in np.flatnonzero(env.legal_move_masks[game].ravel())}
+
+
+# plays random games in the vector env and in one HnefataflBoard per game and compares the legal moves, the
+# observations, the rewards, the dones, the outcomes and the Zobrist keys after every step. Finished games must be
+# reset by the env to the start position with black to move
+@pytest.mark.parametrize("size", [7, 9, 11])
+def test_vector_env_matches_scalar_games(size):
+    rng = random.Random(size)
+    env = VectorHnefataflEnv(NUMBER_OF_GAMES, size)
+    boards = [new_board(size) for _ in range(NUMBER_OF_GAMES)]
+    players = [Player.black] * NUMBER_OF_GAMES
+    start_board = new_board(size).board
+    finished_games = 0
+    step = 0
+    while finished_games < FINISHED_GAMES_PER_SIZE:
+        actions = []
+        for game, board in enumerate(boards):
+            valid_actions = board.get_valid_actions(players[game])
+            assert mask_actions(env, game) == set(valid_actions)
+            actions.append(rng.choice(valid_actions))
+        # the env takes action indices or (from_x, from_y, to_x, to_y) rows
+        if step % 2 == 0:
+            observations, rewards, dones, outcomes, _ = env.step([env.action_encoding.encode(action)
+                                                                  for action in actions])
+        else:
+            observations, rewards, dones, outcomes, _ = env.step([[from_x, from_y, to_x, to_y]
+                                                                  for (from_x, from_y), (to_x, to_y) in actions])
+
+        for game, board in enumerate(boards):
+            mover = players[game]
+            board.do_action(actions[game], mover)
+            players[game] = other_player(mover)
+            if board.outcome == Outcome.ongoing:
+                # the scalar board detects that the next player can not move when it asks for the valid actions
+                board.get_valid_actions(players[game])
+            assert outcomes[game] == board.outcome
+            assert dones[game] == (board.outcome != Outcome.ongoing)
+            if board.outcome == Outcome.ongoing or board.outcome == Outcome.draw:
+                assert rewards[game] == 0
+            else:
+                assert rewards[game] == (1 if board.outcome == mover else -1)
+
+            if dones[game]:
+                assert np.array_equal(observations[game], start_board)
+                assert env.turn_players[game] == Player.black
+                assert env.turn_counts[game] == 0
+                boards[game] = new_board(size)
+                players[game] = Player.black
+                finished_games += 1
+            else:
+                assert np.array_equal(observations[game], board.board)
+                assert env.turn_players[game] == players[game]
+            assert env.zobrist_keys[game] == boards[game].zobrist_key
+        step += 1